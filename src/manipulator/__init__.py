@@ -14,10 +14,78 @@
 #     You should have received a copy of the GNU General Public License
 #    along with this program. If not, see <http://www.gnu.org/licenses/>.
 from .dh_table import DHTable
+from .dh_table import CompactDHTable
 
 from .symbols import *
 
 from .utils import to_latrix
 
+from .optimization import Optimization
+from .optimization import DerivationReport
+from .optimization import ExpressionBudget
+from .optimization import ExpressionBudgetWarning
+from .optimization import ExpressionStats
+from .optimization import expression_stats
+
+from .kernels import CompiledExpressions
+from .kernels import FusedKernel
+from .kernels import DerivativeKernel
+
+from .model import CompiledModel
+
 from .manipulator import Manipulator
 from .manipulator import UArmInverseKinematics
+
+from .dataset import Dataset
+from .dataset import DatasetWriter
+
+from .dynamics import LinkInertia
+from .dynamics import InverseDynamics
+
+from .statics import GravityLoad
+from .statics import GravityMap
+
+from .calibration import calibrate
+from .calibration import CalibrationResult
+
+from .uncertainty import propagate
+from .uncertainty import UncertaintyResult
+
+from .verification import verify_round_trip
+from .verification import RoundTripReport
+
+from .control import ControlLoop
+from .control import LoopTelemetry
+from .control import ResolvedRateController
+
+from .simulator import SimulatedSwiftPro
+from .simulator import SimulatedSerial
+from .simulator import CommandSender
+from .simulator import SenderStats
+
+from .collision import Box
+from .collision import Sphere
+from .collision import CollisionChecker
+from .collision import ClearanceResult
+
+from .planning import RRTConnect
+from .planning import MotionPlan
+
+from .surrogate import PolynomialSurrogate
+from .surrogate import fit_surrogate
+from .surrogate import forward_surrogate
+
+from .executor import BatchExecutor
+
+from .pipeline import PosePipeline
+from .pipeline import PoseBatch
+from .pipeline import PipelineStats
+
+from .linearization import linearize
+from .linearization import LinearizedPath
+
+from .timing import time_optimal
+from .timing import TimedPath
+
+from .registry import ModelRegistry
+from .registry import REGISTRY
@@ -13,7 +13,9 @@
 #
 #     You should have received a copy of the GNU General Public License
 #    along with this program. If not, see <http://www.gnu.org/licenses/>.
-from .test import main
+import sys
+
+from .cli import main
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,262 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from time import perf_counter
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Union
+
+import numpy as np
+
+from .dh_table import PARAMS
+from .dh_table import DHTable
+from .dh_table import CompactDHTable
+from .numeric import as_batch
+from .numeric import chain_frames
+
+TRANSLATIONS = ("Tx", "Ty", "Tz")
+
+
+def parameter_names(table: CompactDHTable) -> List[str]:
+    """
+    Obtains the names of the calibration parameters, in order: the four
+    Denavit-Hartenberg values of each row ("theta_1", "d_1", ...) followed by
+    the translations (Tx, Ty, Tz).
+    :param table: the compact Denavit-Hartenberg table.
+    :return: the list of names.
+    """
+    return [f"{param}_{i}" for i in range(1, len(table) + 1) for param in PARAMS] + \
+           list(TRANSLATIONS)
+
+
+def parameter_vector(table: CompactDHTable) -> np.ndarray:
+    """
+    Obtains the calibration parameters of a table. For the joint variables, the
+    value is the constant offset added to the joint.
+    :param table: the compact Denavit-Hartenberg table.
+    :return: the vector of parameters, following "parameter_names".
+    """
+    values = np.stack([table.rows[param] for param in PARAMS], axis=1).ravel()
+    return np.concatenate([values, [table.Tx, table.Ty, table.Tz]])
+
+
+def from_parameter_vector(table: CompactDHTable, vector: np.ndarray) -> CompactDHTable:
+    """
+    Builds a table with the same structure (joint variables and symbols) as the
+    given one but with the values of the parameter vector.
+    :param table: the compact Denavit-Hartenberg table used as template.
+    :param vector: the vector of parameters, following "parameter_names".
+    :return: the new compact table.
+    """
+    rows = table.rows.copy()
+    values = np.asarray(vector[:4 * len(rows)]).reshape(-1, 4)
+    for column, param in enumerate(PARAMS):
+        rows[param] = values[:, column]
+    return CompactDHTable(rows, table.symbols, *vector[4 * len(rows):],
+                          radii=table.radii)
+
+
+def identification_jacobian(table: CompactDHTable,
+                            q: np.ndarray) -> np.ndarray:
+    """
+    Analytically computes the derivatives of the end-effector position with
+    respect to every calibration parameter, for a batch of configurations. With
+    o(i) and x(i), z(i) the origin and axes of frame i:
+     - theta_i: z(i-1) x (p - o(i-1))
+     - d_i: z(i-1)
+     - a_i: x(i)
+     - alpha_i: x(i) x (p - o(i))
+     - Tx, Ty, Tz: the base axes, as the translations are applied in the base frame.
+    :param table: the compact Denavit-Hartenberg table.
+    :param q: the joint values, as a (N, dof) array.
+    :return: a (N, 3, 4n + 3) array.
+    """
+    frames = chain_frames(table, q)
+    origins = frames[..., :3, 3].copy()
+    origins[:, -1] -= (table.Tx, table.Ty, table.Tz)
+    end = origins[:, -1]
+    samples, n = origins.shape[:2]
+    previous_origins = np.zeros_like(origins)
+    previous_origins[:, 1:] = origins[:, :-1]
+    previous_z = np.empty_like(origins)
+    previous_z[:, 0] = (0., 0., 1.)
+    previous_z[:, 1:] = frames[:, :-1, :3, 2]
+    x_axes = frames[..., :3, 0]
+
+    jacobian = np.empty((samples, 3, 4 * n + 3))
+    jacobian[..., 0:4 * n:4] = np.cross(previous_z,
+                                        end[:, np.newaxis] - previous_origins
+                                        ).transpose(0, 2, 1)
+    jacobian[..., 1:4 * n:4] = previous_z.transpose(0, 2, 1)
+    jacobian[..., 2:4 * n:4] = x_axes.transpose(0, 2, 1)
+    jacobian[..., 3:4 * n:4] = np.cross(x_axes,
+                                        end[:, np.newaxis] - origins
+                                        ).transpose(0, 2, 1)
+    jacobian[..., 4 * n:] = np.eye(3)
+    return jacobian
+
+
+class CalibrationResult:
+    """
+    Result of a DH parameter calibration. The accessible params are:
+     - table: the calibrated CompactDHTable.
+     - parameters: dict with the calibrated value of each fitted parameter.
+     - corrections: dict with the change of each fitted parameter.
+     - initial_residuals: the position error norms with the nominal table.
+     - residuals: the position error norms with the calibrated table.
+     - iterations: the number of iterations run.
+     - converged: whether the tolerance was reached.
+     - time: the calibration time, in seconds.
+    """
+
+    def __init__(self,
+                 table: CompactDHTable,
+                 parameters: Dict[str, float],
+                 corrections: Dict[str, float],
+                 initial_residuals: np.ndarray,
+                 residuals: np.ndarray,
+                 iterations: int,
+                 converged: bool,
+                 time: float):
+        self.table = table
+        self.parameters = parameters
+        self.corrections = corrections
+        self.initial_residuals = initial_residuals
+        self.residuals = residuals
+        self.iterations = iterations
+        self.converged = converged
+        self.time = time
+
+    @staticmethod
+    def statistics(residuals: np.ndarray) -> Dict[str, float]:
+        """
+        :param residuals: the position error norms.
+        :return: dict with the "rms", "mean", "median", "p95" and "max" errors.
+        """
+        return {"rms": float(np.sqrt(np.mean(residuals ** 2))),
+                "mean": float(np.mean(residuals)),
+                "median": float(np.median(residuals)),
+                "p95": float(np.percentile(residuals, 95)),
+                "max": float(np.max(residuals))}
+
+    def __str__(self):
+        before = self.statistics(self.initial_residuals)
+        after = self.statistics(self.residuals)
+        result = f"Calibration {'converged' if self.converged else 'did not converge'}" \
+                 f" after {self.iterations} iterations - {self.time:.3f}s\n"
+        result += "{:>8}{:>14}{:>14}\n".format('', "nominal", "calibrated")
+        for key in before:
+            result += "{:>8}{:>14.6f}{:>14.6f}\n".format(key, before[key], after[key])
+        for name, correction in self.corrections.items():
+            result += "{:>8}{:>+14.6f}\n".format(name, correction)
+        return result
+
+
+def calibrate(table: Union[DHTable, CompactDHTable],
+              q: np.ndarray,
+              positions: np.ndarray,
+              fit: Sequence[str] = None,
+              max_iterations: int = 50,
+              tolerance: float = 1e-10,
+              damping: float = 1e-3,
+              rcond: float = 1e-10) -> CalibrationResult:
+    """
+    Fits the Denavit-Hartenberg values and the translations of a table to a set
+    of measurements by using batched Levenberg-Marquardt least squares, with the
+    analytic identification Jacobian.
+    Combinations of parameters that cannot be identified from positions alone
+    (for example, "d" of consecutive links with parallel axes) are detected from
+    the spectrum of the normal equations and kept at their nominal values.
+    :param table: the nominal Denavit-Hartenberg table.
+    :param q: the measured joint values, as a (N, dof) array.
+    :param positions: the measured end-effector positions, as a (N, 3) array.
+    :param fit: the names of the parameters to fit (see "parameter_names") -
+    default: all of them.
+    :param max_iterations: the maximum number of iterations - default: 50.
+    :param tolerance: relative decrease of the squared error below which the
+    calibration is considered converged - default: 1e-10.
+    :param damping: the initial Levenberg-Marquardt damping - default: 1e-3.
+    :param rcond: relative eigenvalue below which a direction of the scaled normal
+    equations is considered not identifiable - default: 1e-10.
+    :return: the CalibrationResult.
+    :raises ValueError when the measurements do not match or a parameter is unknown.
+    """
+    start = perf_counter()
+    table = table.compact() if isinstance(table, DHTable) else table
+    q = as_batch(q, len(table.symbols))
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    if len(positions) != len(q):
+        raise ValueError("There must be one measured position for each configuration")
+    names = parameter_names(table)
+    if fit is None:
+        fit = names
+    for name in fit:
+        if name not in names:
+            raise ValueError(f"Unknown parameter '{name}' - it must be one of: {names}")
+    columns = np.array([names.index(name) for name in fit])
+
+    def residuals_of(candidate: CompactDHTable) -> np.ndarray:
+        return positions - chain_frames(candidate, q, positions_only=True)[:, -1]
+
+    nominal = parameter_vector(table)
+    vector = nominal.copy()
+    current = table
+    residuals = residuals_of(current)
+    error = float(np.sum(residuals ** 2))
+    initial_residuals = np.linalg.norm(residuals, axis=1)
+    converged = False
+    iterations = 0
+    while iterations < max_iterations and not converged:
+        iterations += 1
+        jacobian = identification_jacobian(current, q)[..., columns]
+        normal = np.einsum("nip,niq->pq", jacobian, jacobian)
+        gradient = np.einsum("nip,ni->p", jacobian, residuals)
+        scale = np.sqrt(np.diag(normal))
+        scale[scale == 0] = 1.
+        # Directions that the measurements cannot identify are left untouched
+        values, vectors = np.linalg.eigh(normal / np.outer(scale, scale))
+        identifiable = values > rcond * values.max()
+        vectors = vectors[:, identifiable]
+        values = values[identifiable]
+        projected = vectors.T @ (gradient / scale)
+        while True:
+            step = vectors @ (projected / (values + damping)) / scale
+            candidate_vector = vector.copy()
+            candidate_vector[columns] += step
+            candidate = from_parameter_vector(table, candidate_vector)
+            candidate_residuals = residuals_of(candidate)
+            candidate_error = float(np.sum(candidate_residuals ** 2))
+            if candidate_error <= error:
+                break
+            damping *= 10
+            if damping > 1e12:
+                candidate_error = error
+                break
+        if candidate_error < error:
+            converged = (error - candidate_error) <= tolerance * max(error, 1e-300)
+            vector, current = candidate_vector, candidate
+            residuals, error = candidate_residuals, candidate_error
+            damping = max(damping / 10, 1e-12)
+        else:
+            converged = True
+    return CalibrationResult(current,
+                             {names[i]: float(vector[i]) for i in columns},
+                             {names[i]: float(vector[i] - nominal[i]) for i in columns},
+                             initial_residuals,
+                             np.linalg.norm(residuals, axis=1),
+                             iterations,
+                             converged,
+                             perf_counter() - start)
@@ -0,0 +1,339 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import sys
+
+from argparse import ArgumentParser
+from itertools import chain
+from itertools import islice
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Sequence
+from typing import TextIO
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+from sympy import pi
+from sympy import symbols
+from sympy import sympify
+
+from .dh_table import DHTable
+from .executor import BatchExecutor
+from .executor import OPERATIONS
+from .model import CompiledModel
+from .optimization import ExpressionBudget
+from .registry import REGISTRY
+
+COMMANDS = {"fk": "poses", "ik": "inverse", "jacobian": "jacobian"}
+"""
+Batch commands, as name: executor operation. "fk" takes joint values and gives
+(X, Y, Z, phi); "ik" takes (X, Y, Z, phi) and gives the uArm joints; "jacobian"
+takes joint values and gives the (6, dof) Jacobian, flattened by rows in CSV files.
+"""
+
+
+def uarm_table() -> Tuple[DHTable, Dict[str, Any], Any]:
+    """
+    :return: (table, phi, phi_e) for the uArm Swift Pro, as used by the demo.
+    """
+    t1, t2, t3 = symbols("theta_1 theta_2 theta_3")
+    table = DHTable()
+    table.add(theta=t1, d=106.1, a=13.2, alpha=(pi / 2)) \
+         .add(theta=t2, d=0, a=142, alpha=pi) \
+         .add(theta=t3, d=0, a=158.9, alpha=0)
+    table.Tx = 44.5
+    table.Tz = -13.2
+    return table, {'x': t2 - t3, 'y': 0, 'z': t1}, t2 - t3
+
+
+def load_table(path: Union[str, Path]) -> Tuple[DHTable, Dict[str, Any], Any]:
+    """
+    Loads a table from a JSON file with the keys "rows" (list of dicts with
+    "theta", 'd', 'a', "alpha" and, optionally, "radius"; symbolic values are
+    strings such as "theta_1"), "Tx", "Ty", "Tz", "phi" (dict with the 'x', 'y' and
+    'z' expressions) and "phi_e". Only "rows" is required.
+    :param path: the JSON file.
+    :return: (table, phi, phi_e).
+    :raises KeyError when there are no rows.
+    """
+    with open(path) as file:
+        description = json.load(file)
+    table = DHTable()
+    for row in description["rows"]:
+        table.add(theta=sympify(row["theta"]), d=sympify(row['d']),
+                  a=sympify(row['a']), alpha=sympify(row["alpha"]),
+                  radius=float(row.get("radius", 0.)))
+    table.Tx = float(description.get("Tx", 0.))
+    table.Ty = float(description.get("Ty", 0.))
+    table.Tz = float(description.get("Tz", 0.))
+    phi = {axis: sympify(value) for axis, value in description.get("phi", dict()).items()}
+    phi_e = sympify(description["phi_e"]) if "phi_e" in description else None
+    return table, phi, phi_e
+
+
+def _is_number(value: str) -> bool:
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _is_row(line: bytes) -> bool:
+    """
+    :return: whether the CSV line holds values - blank and comment ('#') lines are
+    skipped, as "np.loadtxt" does.
+    """
+    return bool(line.split(b'#', 1)[0].strip())
+
+
+def read_chunks(path: Union[str, Path],
+                chunk_size: int) -> Tuple[int, Iterator[np.ndarray]]:
+    """
+    Reads the rows of a ".npy" (memory-mapped) or CSV file in chunks, so files
+    larger than the memory can be processed. A non-numeric first row of a CSV
+    file is taken as its header; blank and comment ('#') lines are skipped.
+    :param path: the input file.
+    :param chunk_size: the number of rows of each chunk.
+    :return: (rows, iterator of (rows, columns) arrays).
+    :raises ValueError when a ".npy" file is not two-dimensional.
+    """
+    path = Path(path)
+    if path.suffix == ".npy":
+        data = np.load(path, mmap_mode='r')
+        if data.ndim != 2:
+            raise ValueError(f"{path} must contain a two-dimensional array")
+        return len(data), (np.asarray(data[start:start + chunk_size], dtype=np.float64)
+                           for start in range(0, len(data), chunk_size))
+    with open(path, "rb") as file:
+        rows = sum(1 for line in file if _is_row(line))
+        file.seek(0)
+        first = next((line for line in file if _is_row(line)), b"")
+        header = not all(_is_number(value)
+                         for value in first.split(b'#', 1)[0].decode().split(','))
+    rows -= int(header and rows > 0)
+
+    def chunks() -> Iterator[np.ndarray]:
+        with open(path) as text:
+            if header:
+                next(line for line in text if _is_row(line.encode()))
+            while True:
+                lines = list(islice(text, chunk_size))
+                if not lines:
+                    return
+                values = np.loadtxt(lines, delimiter=',', ndmin=2)
+                if values.size > 0:
+                    yield values
+
+    return rows, chunks()
+
+
+class ResultWriter:
+    """
+    Writes results as they are produced: to a CSV file, to a ".npy" file or, for
+    any other extension, to a raw memory-mapped float64 file in C order.
+    The accessible params are:
+     - path: the output file.
+     - shape: the shape of all the results.
+     - written: how many rows have been written.
+    """
+
+    def __init__(self, path: Union[str, Path], shape: Tuple[int, ...], header: Sequence[str]):
+        """
+        Creates the output file.
+        :param path: the output file.
+        :param shape: the shape of all the results, (rows, ...).
+        :param header: the name of each (flattened) column, for CSV files.
+        """
+        self.path = Path(path)
+        self.shape = shape
+        self.written = 0
+        self._text: TextIO = None
+        self._array: np.ndarray = None
+        if self.path.suffix == ".csv":
+            self._text = open(self.path, 'w')
+            self._text.write(','.join(header) + '\n')
+        elif shape[0] == 0:
+            # Empty files cannot be memory-mapped
+            if self.path.suffix == ".npy":
+                np.save(self.path, np.empty(shape))
+            else:
+                self.path.write_bytes(b"")
+        elif self.path.suffix == ".npy":
+            self._array = np.lib.format.open_memmap(self.path, mode="w+",
+                                                    dtype=np.float64, shape=shape)
+        else:
+            self._array = np.memmap(self.path, dtype=np.float64, mode="w+", shape=shape)
+
+    def write(self, values: np.ndarray):
+        """
+        Appends a block of results.
+        :param values: the results, as a (B, ...) array.
+        """
+        if self._text is not None:
+            np.savetxt(self._text, values.reshape(len(values), -1), delimiter=',',
+                       fmt="%.10g")
+        elif self._array is not None:
+            self._array[self.written:self.written + len(values)] = values
+        self.written += len(values)
+
+    def close(self):
+        """
+        Flushes and closes the output file.
+        """
+        if self._text is not None:
+            self._text.close()
+        if self._array is not None:
+            self._array.flush()
+            del self._array
+            self._array = None
+
+
+def _header(command: str, model: CompiledModel) -> List[str]:
+    if command == "fk":
+        return ['x', 'y', 'z', "phi"]
+    if command == "ik":
+        return [str(symbol) for symbol in model.symbols]
+    return [f"J{row}{column}" for row in range(6) for column in range(len(model.symbols))]
+
+
+def run_batch(command: str,
+              model: CompiledModel,
+              source: Union[str, Path],
+              target: Union[str, Path],
+              chunk_size: int = 100000,
+              workers: int = None,
+              progress: TextIO = None) -> Dict[str, float]:
+    """
+    Runs a batch command over an input file, chunk by chunk, and writes the
+    results to the output file.
+    :param command: one of COMMANDS.
+    :param model: the compiled model.
+    :param source: the input file (CSV or ".npy").
+    :param target: the output file (CSV, ".npy" or raw memory map).
+    :param chunk_size: the rows read and evaluated at once - default: 100000.
+    :param workers: evaluate each chunk with a BatchExecutor of this many processes
+    - default: in this process.
+    :param progress: where the progress is reported - default: nowhere.
+    :return: dict with the processed rows, the elapsed time and the throughput.
+    :raises ValueError when the command is not valid, the model cannot run it or the
+    input does not have the expected columns - before the output is created.
+    """
+    if command not in COMMANDS:
+        raise ValueError(f"command must be {list(COMMANDS)}")
+    operation = COMMANDS[command]
+    function, shape = OPERATIONS[operation]
+    dof = len(model.symbols)
+    columns = 4 if command == "ik" else dof
+    if command == "jacobian":
+        model.check_jacobian()
+    rows, chunks = read_chunks(source, chunk_size)
+    # The first chunk is checked before the output is created
+    first = next(chunks, None)
+    if first is not None and first.shape[1] != columns:
+        raise ValueError(f"'{command}' needs {columns} columns - got {first.shape[1]}")
+    chunks = chain([first], chunks) if first is not None else iter(())
+    writer = ResultWriter(target, (rows,) + shape(dof), _header(command, model))
+    executor = BatchExecutor(model, workers) if workers else None
+    start = perf_counter()
+    try:
+        for chunk in chunks:
+            if chunk.shape[1] != columns:
+                raise ValueError(f"'{command}' needs {columns} columns - got "
+                                 f"{chunk.shape[1]}")
+            if executor is not None:
+                writer.write(executor.run(operation, chunk))
+                executor.release()
+            else:
+                writer.write(function(model, chunk))
+            if progress is not None:
+                elapsed = perf_counter() - start
+                progress.write("\r{}/{} rows ({:.1f}%) - {:.0f} rows/s".format(
+                    writer.written, rows, 100. * writer.written / max(rows, 1),
+                    writer.written / elapsed if elapsed > 0 else 0.))
+                progress.flush()
+    finally:
+        writer.close()
+        if executor is not None:
+            executor.close()
+    elapsed = perf_counter() - start
+    if progress is not None:
+        progress.write('\n')
+    return {"rows": writer.written,
+            "time": elapsed,
+            "throughput": writer.written / elapsed if elapsed > 0 else float("inf")}
+
+
+def main(argv: Sequence[str] = None) -> int:
+    """
+    Command-line entry point: "python -m manipulator {fk,ik,jacobian} INPUT OUTPUT"
+    runs a batch command and "python -m manipulator [demo]" runs the demo.
+    :param argv: the arguments - default: the ones of the process.
+    :return: the exit code.
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = ArgumentParser(prog="python -m manipulator",
+                            description="Batch kinematics for DH manipulators")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("demo", help="run the uArm demo")
+    for command, description in (("fk", "forward kinematics: joints to (X, Y, Z, phi)"),
+                                 ("ik", "uArm inverse kinematics: (X, Y, Z, phi) to "
+                                        "joints"),
+                                 ("jacobian", "Jacobian matrix of each joint "
+                                              "configuration")):
+        subparser = commands.add_parser(command, help=description)
+        subparser.add_argument("input", help="input file: CSV or .npy")
+        subparser.add_argument("output", help="output file: CSV, .npy or any other "
+                                               "extension for a raw float64 memory map")
+        subparser.add_argument("--table", help="JSON file with the DH table - "
+                                               "default: the uArm")
+        subparser.add_argument("--chunk-size", type=int, default=100000,
+                               help="rows processed at once (default: 100000)")
+        subparser.add_argument("--workers", type=int, default=None,
+                               help="worker processes (default: none)")
+        subparser.add_argument("--max-operations", type=int, default=None,
+                               help="switch to numeric-only mode when a derived "
+                                    "matrix has more operations (default: no limit)")
+        subparser.add_argument("--quiet", action="store_true",
+                               help="do not report the progress")
+    arguments = parser.parse_args(argv)
+    if arguments.command in (None, "demo"):
+        from .test import main as demo
+        demo()
+        return 0
+    if arguments.command == "ik" and arguments.table:
+        parser.error("'ik' solves the uArm only - it cannot be used with --table")
+    table, phi, phi_e = load_table(arguments.table) if arguments.table else uarm_table()
+    try:
+        budget = ExpressionBudget(arguments.max_operations, action="numeric") \
+            if arguments.max_operations is not None else None
+        model = REGISTRY.compiled(table, phi, phi_e, optimize="none", budget=budget)
+        result = run_batch(arguments.command, model, arguments.input, arguments.output,
+                           arguments.chunk_size, arguments.workers,
+                           None if arguments.quiet else sys.stderr)
+    except (ValueError, OSError) as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+    if not arguments.quiet:
+        print("{rows} rows in {time:.3f}s - {throughput:.0f} rows/s".format(**result),
+              file=sys.stderr)
+    return 0
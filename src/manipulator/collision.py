@@ -0,0 +1,365 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+from .dh_table import DHTable
+from .dh_table import CompactDHTable
+from .numeric import as_batch
+from .numeric import chain_frames
+
+
+class Sphere:
+    """
+    Spherical obstacle. The accessible params are:
+     - center: the center, in the base frame.
+     - radius: the radius.
+    """
+
+    def __init__(self, center: Sequence[float], radius: float):
+        self.center = np.asarray(center, dtype=np.float64)
+        self.radius = float(radius)
+
+    def distance(self, points: np.ndarray) -> np.ndarray:
+        """
+        Signed distance from points to the surface - negative inside.
+        :param points: a (..., 3) array.
+        :return: a (...) array.
+        """
+        difference = points - self.center
+        return np.sqrt(np.einsum("...i,...i->...", difference, difference)) - self.radius
+
+    def segment_distance(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """
+        Signed distance from segments to the surface - negative when they cross it.
+        :param starts: the first point of each segment, as a (..., 3) array.
+        :param ends: the last point of each segment, as a (..., 3) array.
+        :return: a (...) array.
+        """
+        direction = ends - starts
+        length = np.einsum("...i,...i->...", direction, direction)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.einsum("...i,...i->...", self.center - starts, direction) / length
+        t = np.clip(np.nan_to_num(t), 0., 1.)
+        return self.distance(starts + t[..., np.newaxis] * direction)
+
+
+class Box:
+    """
+    Box obstacle, optionally rotated. The accessible params are:
+     - center: the center, in the base frame.
+     - size: the length of each side, along the box axes.
+     - rotation: the 3x3 matrix whose columns are the box axes in the base frame.
+    """
+
+    def __init__(self,
+                 center: Sequence[float],
+                 size: Sequence[float],
+                 rotation: np.ndarray = None):
+        self.center = np.asarray(center, dtype=np.float64)
+        self.size = np.asarray(size, dtype=np.float64)
+        self.rotation = np.eye(3) if rotation is None else \
+            np.asarray(rotation, dtype=np.float64)
+        self._half = self.size / 2.
+
+    def distance(self, points: np.ndarray) -> np.ndarray:
+        """
+        Signed distance from points to the surface - negative inside.
+        :param points: a (..., 3) array.
+        :return: a (...) array.
+        """
+        return self._local_distance((points - self.center) @ self.rotation)
+
+    def _local_distance(self, local: np.ndarray) -> np.ndarray:
+        # Reductions over the last axis of size 3 are slow, so work by component
+        x, y, z = np.moveaxis(np.abs(local) - self._half, -1, 0)
+        outside = np.sqrt(np.maximum(x, 0.) ** 2 + np.maximum(y, 0.) ** 2 +
+                          np.maximum(z, 0.) ** 2)
+        return outside + np.minimum(np.maximum(np.maximum(x, y), z), 0.)
+
+    def segment_distance(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """
+        Signed distance from segments to the surface - negative when they cross it,
+        then minus the depth of their deepest point.
+        Outside, the squared distance along a segment is a piecewise quadratic
+        function that changes wherever a coordinate crosses a face plane, so the
+        minimum is either at one of those crossings, at a segment end or at the
+        vertex of one of the quadratic pieces. Inside, the distance is the largest
+        of |p| - half: convex and piecewise linear, so the minimum is where a
+        coordinate is zero or where two faces are equally far. All these
+        candidates are evaluated at once.
+        :param starts: the first point of each segment, as a (..., 3) array.
+        :param ends: the last point of each segment, as a (..., 3) array.
+        :return: a (...) array.
+        """
+        shape = starts.shape[:-1]
+        starts = starts.reshape(-1, 3)
+        origin = (starts - self.center) @ self.rotation
+        direction = (ends.reshape(-1, 3) - starts) @ self.rotation
+        with np.errstate(invalid="ignore", divide="ignore"):
+            crossings = np.concatenate([(self._half - origin) / direction,
+                                        (-self._half - origin) / direction], axis=1)
+        crossings = np.clip(np.nan_to_num(crossings, nan=0., posinf=0., neginf=0.),
+                            0., 1.)
+        bounds = np.empty((len(origin), 8))
+        bounds[:, 0] = 0.
+        bounds[:, 1] = 1.
+        bounds[:, 2:] = crossings
+        bounds.sort(axis=1)
+        low, high = bounds[:, :-1], bounds[:, 1:]
+        # The faces each piece is outside of, and the vertex of its parabola
+        middle = origin[:, np.newaxis, :] + \
+            ((low + high) / 2.)[..., np.newaxis] * direction[:, np.newaxis, :]
+        active = np.abs(middle) > self._half
+        offset = np.where(active, origin[:, np.newaxis, :] -
+                          np.copysign(self._half, middle), 0.)
+        slope = np.where(active, direction[:, np.newaxis, :], 0.)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            vertices = -np.einsum("mki,mki->mk", offset, slope) / \
+                np.einsum("mki,mki->mk", slope, slope)
+        vertices = np.clip(np.nan_to_num(vertices), low, high)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            inside = [-origin / direction]
+            for i, j in ((0, 1), (0, 2), (1, 2)):
+                for si, sj in ((1., 1.), (1., -1.), (-1., 1.), (-1., -1.)):
+                    inside.append(((self._half[i] - si * origin[:, i]) -
+                                   (self._half[j] - sj * origin[:, j])) /
+                                  (si * direction[:, i] - sj * direction[:, j]))
+        inside = np.clip(np.nan_to_num(np.column_stack(inside), nan=0., posinf=0.,
+                                       neginf=0.), 0., 1.)
+        candidates = np.concatenate([bounds, vertices, inside], axis=1)
+        points = origin[:, np.newaxis, :] + \
+            candidates[..., np.newaxis] * direction[:, np.newaxis, :]
+        return self._local_distance(points).min(axis=1).reshape(shape)
+
+
+Obstacle = Union[Sphere, Box]
+
+
+def link_segments(table: CompactDHTable,
+                  q: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Obtains the line segments that model the links of the manipulator: each row
+    of the table moves from the previous frame origin along its Z axis ('d') and
+    then along the new X axis ('a'), and the last link ends at the end-effector.
+    :param table: the compact Denavit-Hartenberg table.
+    :param q: the joint values, as a (N, dof) array.
+    :return: (starts, ends, links) - the segment ends, as (N, S, 3) arrays, and
+    the 0-based row each segment belongs to, as a (S,) array.
+    """
+    q = as_batch(q, len(table.symbols))
+    frames = chain_frames(table, q)
+    n = frames.shape[1]
+    origins = frames[..., :3, 3].copy()
+    end_effector = origins[:, -1].copy()
+    origins[:, -1] -= (table.Tx, table.Ty, table.Tz)
+    a = table.rows['a'].copy()
+    if np.any(table.rows["joint"] == 2):
+        a = np.repeat(a[np.newaxis, :], len(origins), axis=0)
+        for i in np.flatnonzero(table.rows["joint"] == 2):
+            a[:, i] += q[:, table.joints[i]]
+    elbows = origins - a[..., np.newaxis] * frames[..., :3, 0]
+    points = np.empty((len(origins), 2 * n + 2, 3))
+    points[:, 0] = 0.
+    points[:, 1:2 * n:2] = elbows
+    points[:, 2:2 * n + 1:2] = origins
+    points[:, -1] = end_effector
+    links = np.minimum(np.arange(2 * n + 1) // 2, n - 1)
+    return points[:, :-1], points[:, 1:], links
+
+
+def segment_distance(starts: np.ndarray,
+                     ends: np.ndarray,
+                     other_starts: np.ndarray,
+                     other_ends: np.ndarray) -> np.ndarray:
+    """
+    Distance between the closest points of two sets of segments, pair by pair.
+    Degenerate (zero length) segments are handled as points.
+    :param starts: the first point of each segment, as a (..., 3) array.
+    :param ends: the last point of each segment, as a (..., 3) array.
+    :param other_starts: the first point of each other segment, as a (..., 3) array.
+    :param other_ends: the last point of each other segment, as a (..., 3) array.
+    :return: a (...) array.
+    """
+    first = ends - starts
+    second = other_ends - other_starts
+    offset = starts - other_starts
+    a = np.einsum("...i,...i->...", first, first)
+    b = np.einsum("...i,...i->...", first, second)
+    c = np.einsum("...i,...i->...", first, offset)
+    e = np.einsum("...i,...i->...", second, second)
+    f = np.einsum("...i,...i->...", second, offset)
+    denominator = a * e - b * b
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Closest point of the infinite lines, clamped to the first segment
+        s = np.where(denominator > 1e-12 * a * e,
+                     np.clip((b * f - c * e) / denominator, 0., 1.), 0.)
+        t = np.where(e > 0., (b * s + f) / e, 0.)
+        # Clamp to the second segment and recompute the first point
+        t = np.clip(t, 0., 1.)
+        s = np.where(a > 0., np.clip((b * t - c) / a, 0., 1.), 0.)
+    difference = offset + s[..., np.newaxis] * first - t[..., np.newaxis] * second
+    return np.sqrt(np.einsum("...i,...i->...", difference, difference))
+
+
+class ClearanceResult:
+    """
+    Minimum clearances of a batch of configurations, where the links are capsules.
+    Clearances are negative when the capsules overlap.
+    The accessible params are:
+     - environment: the clearance between the links and the obstacles, as a (N,)
+       array - infinite when there are no obstacles.
+     - environment_pairs: the (link, obstacle) indices of that minimum, as a (N, 2)
+       array - -1 when there are no obstacles.
+     - self_clearance: the clearance between non-adjacent links, as a (N,) array -
+       infinite when there are no such pairs.
+     - self_pairs: the (link, link) indices of that minimum, as a (N, 2) array - -1
+       when there are no such pairs.
+    Links are 0-based rows of the table.
+    """
+
+    def __init__(self,
+                 environment: np.ndarray,
+                 environment_pairs: np.ndarray,
+                 self_clearance: np.ndarray,
+                 self_pairs: np.ndarray):
+        self.environment = environment
+        self.environment_pairs = environment_pairs
+        self.self_clearance = self_clearance
+        self.self_pairs = self_pairs
+
+    @property
+    def minimum(self) -> np.ndarray:
+        """
+        :return: the smallest clearance of each configuration, as a (N,) array.
+        """
+        return np.minimum(self.environment, self.self_clearance)
+
+    def colliding(self, margin: float = 0.) -> np.ndarray:
+        """
+        :param margin: the smallest clearance accepted - default: 0.
+        :return: the indices of the configurations whose clearance is below it.
+        """
+        return np.flatnonzero(self.minimum <= margin)
+
+
+class CollisionChecker:
+    """
+    Checks batches of configurations against a set of obstacles and against
+    themselves. Links are modelled as capsules: the line segments of
+    "link_segments" inflated by the radius of their row in the table. All the
+    configurations, links and obstacles are evaluated with a few vectorized
+    operations over the intermediate frames.
+    The accessible params are:
+     - params: the compact Denavit-Hartenberg table.
+     - obstacles: the obstacles, as Sphere or Box instances.
+     - margin: the smallest clearance accepted.
+     - self_collision: whether "free" checks collisions between links.
+     - pairs: the (link, link) pairs checked for self collisions, as a (P, 2) array.
+    """
+
+    def __init__(self,
+                 params: Union[DHTable, CompactDHTable],
+                 obstacles: Sequence[Obstacle] = (),
+                 margin: float = 0.,
+                 self_collision: bool = False,
+                 ignore: Sequence[Tuple[int, int]] = ()):
+        """
+        Creates the collision checker.
+        :param params: the Denavit-Hartenberg params - the capsule radii are taken
+        from them.
+        :param obstacles: the obstacles - default: none.
+        :param margin: the smallest clearance accepted - default: 0.
+        :param self_collision: check collisions between links in "free" - default:
+        False, so "free" only checks the obstacles ("query" always reports both).
+        :param ignore: (link, link) pairs, 0-based, that are not checked for self
+        collisions besides the adjacent ones - default: none.
+        """
+        self.params = params.compact() if isinstance(params, DHTable) else params
+        self.obstacles = tuple(obstacles)
+        self.margin = margin
+        self.self_collision = self_collision
+        n = len(self.params)
+        ignored = {tuple(sorted(pair)) for pair in ignore}
+        self.pairs = np.array([(i, j) for i in range(n) for j in range(i + 2, n)
+                               if (i, j) not in ignored], dtype=np.int64).reshape(-1, 2)
+        _, _, links = link_segments(self.params, np.zeros((1, len(self.params.symbols))))
+        self._links = links
+        self._radii = self.params.radii[links]
+        # Every segment of one link against every segment of the other
+        segment_pairs = [(u, v) for i, j in self.pairs
+                         for u in np.flatnonzero(links == i)
+                         for v in np.flatnonzero(links == j)]
+        self._segment_pairs = np.array(segment_pairs, dtype=np.int64).reshape(-1, 2)
+
+    def _environment(self,
+                     starts: np.ndarray,
+                     ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.obstacles:
+            return np.full(len(starts), np.inf), np.full((len(starts), 2), -1)
+        distances = np.stack([obstacle.segment_distance(starts, ends)
+                              for obstacle in self.obstacles], axis=-1)
+        distances -= self._radii[:, np.newaxis]
+        flat = distances.reshape(len(starts), -1)
+        index = np.argmin(flat, axis=1)
+        segment, obstacle = np.divmod(index, len(self.obstacles))
+        pairs = np.stack([self._links[segment], obstacle], axis=1)
+        return flat[np.arange(len(flat)), index], pairs
+
+    def _self(self, starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if len(self._segment_pairs) == 0:
+            return np.full(len(starts), np.inf), np.full((len(starts), 2), -1)
+        u, v = self._segment_pairs.T
+        distances = segment_distance(starts[:, u], ends[:, u], starts[:, v], ends[:, v])
+        distances -= self._radii[u] + self._radii[v]
+        index = np.argmin(distances, axis=1)
+        pairs = np.stack([self._links[u[index]], self._links[v[index]]], axis=1)
+        return distances[np.arange(len(distances)), index], pairs
+
+    def query(self, q: np.ndarray) -> ClearanceResult:
+        """
+        Computes the link-to-obstacle and link-to-link clearances.
+        :param q: the joint values, as a (N, dof) array.
+        :return: the ClearanceResult.
+        """
+        starts, ends, _ = link_segments(self.params, q)
+        environment, environment_pairs = self._environment(starts, ends)
+        self_clearance, self_pairs = self._self(starts, ends)
+        return ClearanceResult(environment, environment_pairs, self_clearance, self_pairs)
+
+    def clearance(self, q: np.ndarray) -> np.ndarray:
+        """
+        Computes the distance between the links and the closest obstacle.
+        :param q: the joint values, as a (N, dof) array.
+        :return: a (N,) array - infinite when there are no obstacles.
+        """
+        starts, ends, _ = link_segments(self.params, q)
+        return self._environment(starts, ends)[0]
+
+    def free(self, q: np.ndarray) -> np.ndarray:
+        """
+        Checks which configurations are collision free.
+        :param q: the joint values, as a (N, dof) array.
+        :return: a (N,) boolean array.
+        """
+        starts, ends, _ = link_segments(self.params, q)
+        result = self._environment(starts, ends)[0] > self.margin
+        if self.self_collision:
+            result &= self._self(starts, ends)[0] > self.margin
+        return result
@@ -0,0 +1,258 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from math import ceil
+from time import perf_counter
+from time import sleep
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Tuple
+
+import numpy as np
+
+from .model import CompiledModel
+
+OVERRUN_POLICIES = ("skip", "catch_up")
+"""
+What to do when a tick finishes after the next deadline:
+ - skip: the missed ticks are dropped and the loop waits for the next deadline.
+ - catch_up: the missed ticks are run immediately, one after another.
+"""
+
+
+class LoopTelemetry:
+    """
+    Ring buffer with the timing of the last ticks of a control loop, plus global
+    counters. All times are in seconds.
+    The accessible params are:
+     - ticks: how many ticks have been run.
+     - misses: how many ticks finished after their deadline.
+     - skipped: how many ticks were dropped by the "skip" policy.
+     - compute_time: the step duration of the last ticks.
+     - jitter: the delay between the scheduled and the actual start.
+     - missed: whether each of the last ticks missed its deadline.
+    """
+
+    def __init__(self, size: int = 1024):
+        """
+        Creates the telemetry buffers.
+        :param size: how many ticks are kept - default: 1024.
+        """
+        self.size = size
+        self.ticks = 0
+        self.misses = 0
+        self.skipped = 0
+        self.compute_time = np.zeros(size)
+        self.jitter = np.zeros(size)
+        self.missed = np.zeros(size, dtype=bool)
+
+    def record(self, compute_time: float, jitter: float, missed: bool):
+        """
+        Stores the timing of a tick, overwriting the oldest one when full.
+        :param compute_time: the step duration.
+        :param jitter: the delay between the scheduled and the actual start.
+        :param missed: whether the tick finished after its deadline.
+        """
+        index = self.ticks % self.size
+        self.compute_time[index] = compute_time
+        self.jitter[index] = jitter
+        self.missed[index] = missed
+        self.ticks += 1
+        self.misses += int(missed)
+
+    def _recent(self, values: np.ndarray) -> np.ndarray:
+        if self.ticks < self.size:
+            return values[:self.ticks]
+        index = self.ticks % self.size
+        return np.concatenate([values[index:], values[:index]])
+
+    @property
+    def recent_compute_time(self) -> np.ndarray:
+        """
+        :return: the step durations kept, from the oldest to the newest.
+        """
+        return self._recent(self.compute_time)
+
+    @property
+    def recent_jitter(self) -> np.ndarray:
+        """
+        :return: the start delays kept, from the oldest to the newest.
+        """
+        return self._recent(self.jitter)
+
+    def histogram(self, field: str = "compute_time",
+                  bins: int = 20) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Obtains the histogram of the kept values.
+        :param field: "compute_time" or "jitter" - default: "compute_time".
+        :param bins: the number of bins - default: 20.
+        :return: (counts, edges), as returned by "numpy.histogram".
+        :raises ValueError when the field is not valid.
+        """
+        if field not in ("compute_time", "jitter"):
+            raise ValueError("field must be ['compute_time', 'jitter']")
+        return np.histogram(self._recent(getattr(self, field)), bins=bins)
+
+    def summary(self) -> Dict[str, float]:
+        """
+        :return: dict with the counters and the mean, p99 and max of the kept
+        compute times and jitters.
+        """
+        compute_time = self.recent_compute_time
+        jitter = self.recent_jitter
+        result = {"ticks": self.ticks, "misses": self.misses, "skipped": self.skipped}
+        for name, values in (("compute_time", compute_time), ("jitter", jitter)):
+            if len(values) > 0:
+                result[f"{name}_mean"] = float(values.mean())
+                result[f"{name}_p99"] = float(np.percentile(values, 99))
+                result[f"{name}_max"] = float(values.max())
+        return result
+
+    def __str__(self):
+        return '\n'.join("{:>18}: {:.6g}".format(key, value)
+                         for key, value in self.summary().items())
+
+
+class ControlLoop:
+    """
+    Fixed-rate loop runner. It calls a step function once per period, keeps the
+    deadlines on an absolute schedule (so errors do not accumulate) and records
+    the compute time, the jitter and the deadline misses of every tick.
+    The step function receives the tick number and the scheduled time (relative
+    to the start of the loop) and may return False for stopping the loop.
+    The clock and the sleep function can be replaced, for example for running
+    the loop against a simulated robot in virtual time.
+    """
+
+    def __init__(self,
+                 step: Callable[[int, float], Any],
+                 frequency: float,
+                 overrun: str = "skip",
+                 history: int = 1024,
+                 clock: Callable[[], float] = perf_counter,
+                 wait: Callable[[float], Any] = sleep):
+        """
+        Creates the control loop.
+        :param step: the function called on each tick.
+        :param frequency: the target frequency, in Hz.
+        :param overrun: the overrun policy - must be one of OVERRUN_POLICIES.
+        :param history: how many ticks are kept in the telemetry - default: 1024.
+        :param clock: function returning the current time, in seconds.
+        :param wait: function that sleeps for the given seconds.
+        :raises ValueError when the frequency or the policy are not valid.
+        """
+        if frequency <= 0:
+            raise ValueError("frequency must be positive")
+        if overrun not in OVERRUN_POLICIES:
+            raise ValueError(f"overrun must be {list(OVERRUN_POLICIES)}")
+        self.step = step
+        self.period = 1. / frequency
+        self.overrun = overrun
+        self.telemetry = LoopTelemetry(history)
+        self._clock = clock
+        self._wait = wait
+        self._running = False
+
+    def run(self, ticks: int = None, duration: float = None) -> LoopTelemetry:
+        """
+        Runs the loop until the step function returns False, "stop" is called or
+        the given number of ticks or duration is reached.
+        :param ticks: the maximum number of ticks.
+        :param duration: the maximum duration, in seconds.
+        :return: the loop telemetry.
+        """
+        self._running = True
+        start = self._clock()
+        tick = 0
+        while self._running and (ticks is None or tick < ticks):
+            scheduled = start + tick * self.period
+            if duration is not None and scheduled - start >= duration:
+                break
+            now = self._clock()
+            if now < scheduled:
+                self._wait(scheduled - now)
+                now = self._clock()
+            result = self.step(tick, scheduled - start)
+            finished = self._clock()
+            deadline = scheduled + self.period
+            self.telemetry.record(finished - now, now - scheduled, finished > deadline)
+            tick += 1
+            if result is False:
+                break
+            if finished > deadline and self.overrun == "skip":
+                late = ceil((finished - start) / self.period) - tick
+                if late > 0:
+                    self.telemetry.skipped += late
+                    tick += late
+        self._running = False
+        return self.telemetry
+
+    def stop(self):
+        """
+        Stops the loop after the current tick.
+        """
+        self._running = False
+
+
+class ResolvedRateController:
+    """
+    Resolved-rate step built on a CompiledModel: on each call it moves the joints
+    towards a Cartesian target with a velocity proportional to the position error,
+    mapped through the (pseudo-)inverse of the upper Jacobian.
+    """
+
+    def __init__(self,
+                 model: CompiledModel,
+                 gain: float = 1.,
+                 max_speed: float = None):
+        """
+        Creates the controller.
+        :param model: the compiled model - it must have a Jacobian.
+        :param gain: the proportional gain, in 1/s - default: 1.
+        :param max_speed: the largest joint speed allowed, if any. Faster velocities
+        are scaled down as a whole, so the commanded direction is kept.
+        """
+        self.model = model
+        self.gain = gain
+        self.max_speed = max_speed
+
+    def velocity(self, q: np.ndarray, target: np.ndarray) -> np.ndarray:
+        """
+        Computes the joint velocities towards the target.
+        :param q: the joint values, as a (N, dof) array.
+        :param target: the target positions, as a (N, 3) array.
+        :return: a (N, dof) array with the joint velocities.
+        """
+        pose, jacobian, _ = self.model.evaluate(q)
+        error = np.asarray(target, dtype=np.float64).reshape(-1, 3) - pose[:, :3]
+        inverse = np.linalg.pinv(jacobian[:, :3, :])
+        velocity = np.einsum("nij,nj->ni", inverse, self.gain * error)
+        if self.max_speed is not None:
+            # Clipping each joint on its own would change the direction of motion
+            largest = np.abs(velocity).max(axis=1, keepdims=True)
+            with np.errstate(divide="ignore"):
+                velocity = velocity * np.minimum(1., self.max_speed / largest)
+        return velocity
+
+    def __call__(self, q: np.ndarray, target: np.ndarray, dt: float) -> np.ndarray:
+        """
+        Integrates one step of the controller.
+        :param q: the joint values, as a (N, dof) array.
+        :param target: the target positions, as a (N, 3) array.
+        :param dt: the step duration, in seconds.
+        :return: the new joint values.
+        """
+        return np.asarray(q, dtype=np.float64) + self.velocity(q, target) * dt
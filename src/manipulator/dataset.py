@@ -0,0 +1,284 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import struct
+
+from pathlib import Path
+from typing import Any
+from typing import Iterator
+from typing import Sequence
+from typing import Union
+
+import numpy as np
+
+from .dh_table import DHTable
+from .dh_table import CompactDHTable
+
+FORMAT_NAME = "manipulator-dataset"
+FORMAT_VERSION = 1
+FIELDS = ('q', "pose", "jacobian")
+"""
+Fields that can be stored in a dataset: joint values, (X, Y, Z, Phi) pose and
+the Jacobian matrix.
+"""
+
+_HEADER_SIZE = 1024
+_MAGIC = np.lib.format.magic(1, 0)
+
+
+def dataset_dtype(dof: int, fields: Sequence[str] = ('q', "pose")) -> np.dtype:
+    """
+    Builds the structured dtype used for storing the records of a dataset.
+    :param dof: the number of joints of the manipulator.
+    :param fields: the fields to store - must be a subset of FIELDS.
+    :return: the structured dtype.
+    :raises ValueError when any field is not valid.
+    """
+    shapes = {'q': (dof,), "pose": (4,), "jacobian": (6, dof)}
+    for field in fields:
+        if field not in shapes:
+            raise ValueError(f"The field '{field}' is not valid - it must be: {FIELDS}")
+    return np.dtype([(field, np.float64, shapes[field]) for field in fields])
+
+
+def _meta_path(path: Union[str, Path]) -> Path:
+    return Path(f"{path}.json")
+
+
+def _header(dtype: np.dtype, length: int) -> bytes:
+    """
+    Generates a ".npy" header of a fixed size, so it can be rewritten in place
+    when new records are appended.
+    """
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % \
+             (np.lib.format.dtype_to_descr(dtype), length)
+    padding = _HEADER_SIZE - len(_MAGIC) - 2 - len(header) - 1
+    if padding < 0:
+        raise ValueError("The dataset dtype is too large for the header")
+    header += ' ' * padding + '\n'
+    return _MAGIC + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+def _read_header(path: Path) -> int:
+    """
+    Checks that a ".npy" file has the fixed size header written by
+    DatasetWriter and that its records are complete.
+    :return: the number of records of the header.
+    :raises ValueError when the file cannot be appended to.
+    """
+    with open(path, "rb") as file:
+        try:
+            version = np.lib.format.read_magic(file)
+            if version != (1, 0):
+                raise ValueError(f"unexpected format version {version}")
+            shape, fortran_order, stored = np.lib.format.read_array_header_1_0(file)
+        except ValueError as error:
+            raise ValueError(f"'{path}' is not a valid dataset: {error}") from error
+        if file.tell() != _HEADER_SIZE:
+            raise ValueError(f"'{path}' was not written by DatasetWriter, so records "
+                             f"cannot be appended to it")
+        if fortran_order or len(shape) != 1:
+            raise ValueError(f"'{path}' does not store a list of records")
+        size = file.seek(0, 2)
+    if size < _HEADER_SIZE + shape[0] * stored.itemsize:
+        raise ValueError(f"'{path}' is truncated: its header has {shape[0]} records")
+    return shape[0]
+
+
+class DatasetWriter:
+    """
+    Appendable writer for binary trajectory and pose datasets.
+    Records are stored as a ".npy" structured array, readable with "numpy.load"
+    (optionally memory-mapped), and the DHTable fingerprint is kept in a
+    "<path>.json" header next to it. The ".npy" header is updated after every
+    appended chunk, so the file is always readable: if the writer is
+    interrupted, the records written after the last header update are ignored
+    and dropped when the dataset is reopened for appending.
+    The writer can be used as a context manager:
+        with DatasetWriter("poses.npy", table) as writer:
+            writer.append(q=joints, pose=poses)
+    """
+
+    def __init__(self,
+                 path: Union[str, Path],
+                 table: Union[DHTable, CompactDHTable],
+                 fields: Sequence[str] = ('q', "pose"),
+                 mode: str = 'w'):
+        """
+        Creates a new writer for the dataset.
+        :param path: the ".npy" file in which records are written.
+        :param table: the Denavit-Hartenberg table that generated the data - joint
+        variables with a constant offset (theta_1 + pi / 2) count as joints.
+        :param fields: the fields to store - must be a subset of FIELDS.
+        :param mode: 'w' for creating (or truncating) the dataset or 'a' for
+        appending records to an existing one - default: 'w'.
+        :raises ValueError when the mode is not valid or, when appending, the
+        existing dataset does not match the table or the fields, or its ".npy"
+        header was not written by DatasetWriter.
+        """
+        if mode not in ('w', 'a'):
+            raise ValueError("mode must be ['w', 'a']")
+        self.path = Path(path)
+        table = table.compact() if isinstance(table, DHTable) else table
+        self.fingerprint = table.fingerprint()
+        self.dof = len(table.symbols)
+        self.fields = tuple(fields)
+        self.dtype = dataset_dtype(self.dof, self.fields)
+        self.length = 0
+        """
+        How many records does the dataset have
+        """
+        if mode == 'a' and self.path.exists():
+            length = _read_header(self.path)
+            dataset = Dataset(self.path, table)
+            if dataset.fields != self.fields:
+                raise ValueError(f"The dataset fields are {dataset.fields} but "
+                                 f"{self.fields} were requested")
+            del dataset
+            self.length = length
+            self._file = open(self.path, "r+b")
+            # Drop any record written after the last header update
+            self._file.truncate(self._end)
+        else:
+            self._file = open(self.path, "w+b")
+            self._file.write(_header(self.dtype, 0))
+            with open(_meta_path(self.path), 'w') as meta:
+                json.dump({"format": FORMAT_NAME,
+                           "version": FORMAT_VERSION,
+                           "fingerprint": self.fingerprint,
+                           "dof": self.dof,
+                           "fields": list(self.fields)}, meta, indent=2)
+
+    def append(self, **columns: Any) -> int:
+        """
+        Appends a batch of records to the dataset. Every field of the dataset must
+        be given, as an array-like whose first dimension is the number of records.
+        SymPy numbers are accepted and converted to floats.
+        :param columns: the values for each field - q=(N, dof), pose=(N, 4) and
+        jacobian=(N, 6, dof).
+        :return: the number of records written.
+        :raises KeyError when a field is missing or is not part of the dataset.
+        :raises ValueError when the columns have different lengths.
+        """
+        for key in columns:
+            if key not in self.fields:
+                raise KeyError(f"The field '{key}' is not part of the dataset - it "
+                               f"must be: {self.fields}")
+        length = None
+        records = None
+        for field in self.fields:
+            if field not in columns:
+                raise KeyError(f"Missing values for the field '{field}'")
+            values = np.asarray(columns[field], dtype=np.float64)
+            shape = self.dtype[field].shape
+            values = values.reshape((-1,) + shape)
+            if records is None:
+                length = values.shape[0]
+                records = np.empty(length, dtype=self.dtype)
+            elif values.shape[0] != length:
+                raise ValueError("All the fields must have the same number of records")
+            records[field] = values
+        self._file.seek(self._end)
+        self._file.write(records.tobytes())
+        # The records go first, so the header never counts missing ones
+        self._file.flush()
+        self.length += length
+        self._file.seek(0)
+        self._file.write(_header(self.dtype, self.length))
+        return length
+
+    @property
+    def _end(self) -> int:
+        return _HEADER_SIZE + self.length * self.dtype.itemsize
+
+    def flush(self):
+        """
+        Flushes the written data, so readers can access it.
+        """
+        self._file.flush()
+
+    def close(self):
+        """
+        Flushes and closes the dataset file.
+        """
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self) -> 'DatasetWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class Dataset:
+    """
+    Read access to a binary trajectory and pose dataset. Records are
+    memory-mapped by default, so only the accessed chunks are loaded.
+    The accessible params are:
+     - path: the ".npy" file.
+     - fingerprint: the fingerprint of the DHTable that generated the data.
+     - dof: the number of joints.
+     - fields: the stored fields.
+     - records: the structured array with the records.
+    Fields are accessible by using square brackets: dataset["pose"].
+    """
+
+    def __init__(self,
+                 path: Union[str, Path],
+                 table: Union[DHTable, CompactDHTable] = None,
+                 mmap_mode: str = 'r'):
+        """
+        Opens an existing dataset.
+        :param path: the ".npy" file of the dataset.
+        :param table: if given, the Denavit-Hartenberg table the dataset must
+        have been generated with.
+        :param mmap_mode: memory-map mode passed to "numpy.load" - use None for
+        loading the whole dataset in memory - default: 'r'.
+        :raises ValueError when the file is not a dataset or its fingerprint does
+        not match the table.
+        """
+        self.path = Path(path)
+        with open(_meta_path(self.path)) as meta:
+            header = json.load(meta)
+        if header.get("format") != FORMAT_NAME:
+            raise ValueError(f"'{self.path}' is not a {FORMAT_NAME} file")
+        if header["version"] > FORMAT_VERSION:
+            raise ValueError(f"Unsupported dataset version: {header['version']}")
+        self.fingerprint: str = header["fingerprint"]
+        self.dof: int = header["dof"]
+        self.fields = tuple(header["fields"])
+        if table is not None and table.fingerprint() != self.fingerprint:
+            raise ValueError("The dataset was generated with a different DHTable")
+        self.records: np.ndarray = np.load(self.path, mmap_mode=mmap_mode)
+        if self.records.dtype != dataset_dtype(self.dof, self.fields):
+            raise ValueError("The dataset records do not match its header")
+
+    def chunks(self, size: int) -> Iterator[np.ndarray]:
+        """
+        Iterates over the records in chunks, without loading the whole dataset.
+        :param size: the maximum number of records per chunk.
+        :return: an iterator over structured arrays of at most "size" records.
+        """
+        for start in range(0, len(self.records), size):
+            yield self.records[start:start + size]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, item):
+        return self.records[item]
@@ -13,10 +13,37 @@
 #
 #     You should have received a copy of the GNU General Public License
 #    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from hashlib import sha256
+from typing import Iterator
 from typing import List
+from typing import Tuple
 from typing import Union
+
+import numpy as np
+
+from sympy import Expr
+from sympy import srepr
+from sympy import sympify
+
 from .symbols import Symbol
 
+PARAMS = ("theta", 'd', 'a', "alpha")
+
+
+def _joint_symbol(value: Expr) -> Union[Symbol, None]:
+    """
+    Obtains the joint variable of a table value, this is, its only symbol when
+    the value is that symbol plus a constant offset.
+    :param value: the (sympified) table value.
+    :return: the symbol or None, for constants and any other expression.
+    """
+    free_symbols = value.free_symbols
+    if len(free_symbols) != 1:
+        return None
+    symbol = next(iter(free_symbols))
+    offset = value - symbol
+    return symbol if isinstance(offset, Expr) and not offset.free_symbols else None
+
 
 class DHTable:
     """
@@ -36,7 +63,8 @@ class DHTable:
                 'a': length,
                 'd': distance,
                 'alpha': angle with i + 1,
-                'theta': arm angle (symbol)
+                'theta': arm angle (symbol),
+                'radius': capsule radius (optional)
             }, ...
         }
         :param check: skip the checking of the structure of the dictionary.
@@ -46,11 +74,12 @@ class DHTable:
             check = False
         if check:
             for value in table:
-                assert len(value.keys()) == 4
-        self.__table = table
+                assert len(value.keys() - {"radius"}) == 4
+        self.__table = list()
         self.symbols = list()
         """
-        List of symbols used in DH-Table
+        List of symbols used in DH-Table - the joint variables, also when they
+        carry a constant offset (theta + pi / 2), as in CompactDHTable
         """
         self.max = 0
         """
@@ -68,7 +97,9 @@ class DHTable:
         """
         Translation in 'Z' axis
         """
-        self.__lengths = [set() for _ in range(4)]
+        for value in table:
+            self.add(value["theta"], value['d'], value['a'], value["alpha"],
+                     check_attrs=False, radius=value.get("radius", 0.))
 
     @staticmethod
     def _check_errors(theta: Union[Symbol, float],
@@ -92,7 +123,8 @@ class DHTable:
             d: Union[Symbol, float],
             a: Union[Symbol, float],
             alpha: Union[Symbol, float],
-            check_attrs: bool = True) -> 'DHTable':
+            check_attrs: bool = True,
+            radius: float = 0.) -> 'DHTable':
         """
         Add new params to the Denavit-Hartenberg table, in order. This method can safely
         be called by using the "Builder" structure (.add(...).add(...)...).
@@ -104,6 +136,8 @@ class DHTable:
         :param a: the length of the segment.
         :param alpha: the angle between Zi and Zi+1 (radians).
         :param check_attrs: whether to perform a check or not - default: True
+        :param radius: the radius of the capsule that wraps the link, used for
+        collision queries - default: 0.
         :return: the class itself.
         :raises AttributeError when there is two or more params whose type is Symbol.
         Disable "check_attrs" for not throwing any exception.
@@ -116,42 +150,38 @@ class DHTable:
             'a': a,
             'd': d,
             "alpha": alpha,
-            "theta": theta
+            "theta": theta,
+            "radius": radius
         })
         self.max += 1
-        if type(theta) is Symbol:
-            self.symbols.append(theta)
-        if type(d) is Symbol:
-            self.symbols.append(d)
-        if type(a) is Symbol:
-            self.symbols.append(a)
-        if type(alpha) is Symbol:
-            self.symbols.append(alpha)
-        self.__lengths[0].add(len(str(theta)))
-        self.__lengths[1].add(len(str(d)))
-        self.__lengths[2].add(len(str(a)))
-        self.__lengths[3].add(len(str(alpha)))
+        self.symbols.extend(self._row_symbols(self.__table[-1]))
         return self
 
+    @staticmethod
+    def _row_symbols(row: dict) -> List[Symbol]:
+        symbols = (_joint_symbol(sympify(row[key])) for key in PARAMS)
+        return [symbol for symbol in symbols if symbol is not None]
+
+    def _update_symbols(self):
+        self.symbols[:] = [symbol for row in self.__table
+                           for symbol in self._row_symbols(row)]
+
     def change(self, i: int, **kwargs):
         """
         Changes an existing param in the Denavit-Hartenber tables. 'i' (index) must
         exist.
 
         :param i: the table index (from 1 to n).
-        :param kwargs: the keys to modify - [theta, d, a, alpha]
+        :param kwargs: the keys to modify - [theta, d, a, alpha, radius]
         :raises IndexError when the 'i' does not exist.
         """
         i -= 1
         for key, value in kwargs.items():
             if key not in self.__table[i].keys():
                 raise KeyError(f"The key '{key}' is not a valid entry - it must be: "
-                               f"[theta, d, a, alpha]")
-            old_value = self.__table[i][key]
+                               f"[theta, d, a, alpha, radius]")
             self.__table[i][key] = value
-            if type(value) is Symbol:
-                if type(old_value) is Symbol:
-                    self.symbols.insert(self.symbols.index(old_value), value)
+        self._update_symbols()
 
     def remove(self, i: int) -> dict:
         """
@@ -162,18 +192,44 @@ class DHTable:
         """
         i -= 1
         item = self.__table.pop(i)
-        for key, value in item.items():
-            if type(item[key]) is Symbol:
-                self.symbols.remove(value)
+        self.max -= 1
+        self._update_symbols()
         return item
 
     def get(self) -> List[dict]:
         """
-        Obtains the table itself.
+        Obtains the table itself. Every row has the "theta", 'd', 'a', "alpha" and
+        "radius" keys - the radius is 0 for links without a capsule.
         :return: the Denavit-Hartenberg table.
         """
         return self.__table
 
+    def fingerprint(self) -> str:
+        """
+        Obtains a stable digest of the table contents, including the translations.
+        Two tables with the same rows and translations share the same fingerprint,
+        so it can be used for identifying the model that generated some data.
+        Tables without a compact form (see "compact") are digested from the SymPy
+        representation of their rows.
+        :return: the hexadecimal SHA-256 digest of the table.
+        """
+        try:
+            return self.compact().fingerprint()
+        except ValueError:
+            digest = sha256(srepr([[row[key] for key in PARAMS + ("radius",)]
+                                   for row in self.__table]).encode())
+            digest.update(np.array([self.Tx, self.Ty, self.Tz], "<f8").tobytes())
+            return digest.hexdigest()
+
+    def compact(self) -> 'CompactDHTable':
+        """
+        Obtains the compact, immutable and hashable representation of the table.
+        :return: the CompactDHTable with the same contents.
+        :raises ValueError when some value is not a number nor a joint variable plus
+        a constant offset.
+        """
+        return CompactDHTable.from_table(self)
+
     def __getitem__(self, item):
         assert isinstance(item, int)
         return self.__table[item]
@@ -185,11 +241,13 @@ class DHTable:
             yield i, element["theta"], element['d'], element['a'], element["alpha"]
 
     def __str__(self):
+        lengths = [max((len(str(values[key])) for values in self.__table), default=0)
+                   for key in PARAMS]
         row_format = "{}{}{}{}{}".format("{:>4}",
-                                         "{:>" + str(4 + max(self.__lengths[0])) + "}",
-                                         "{:>" + str(4 + max(self.__lengths[1])) + "}",
-                                         "{:>" + str(4 + max(self.__lengths[2])) + "}",
-                                         "{:>" + str(4 + max(self.__lengths[3])) + "}")
+                                         "{:>" + str(4 + lengths[0]) + "}",
+                                         "{:>" + str(4 + lengths[1]) + "}",
+                                         "{:>" + str(4 + lengths[2]) + "}",
+                                         "{:>" + str(4 + lengths[3]) + "}")
         result = row_format.format('i', "θᵢ", "dᵢ", "aᵢ", "αᵢ") + "\n"
         i = 1
         for values in self.__table:
@@ -200,3 +258,214 @@ class DHTable:
                                         str(values["alpha"])) + "\n"
             i += 1
         return result
+
+
+class CompactDHTable:
+    """
+    Compact and immutable representation of the Denavit-Hartenberg table, backed
+    by a NumPy structured array with one row per link. Each row stores the
+    numeric value of theta, d, a and alpha and, in "joint", which of them is
+    the joint variable (or -1 if the link is fixed). For the joint variable,
+    the stored value is the constant offset added to the symbol. The original
+    SymPy constants (for example, pi / 2) are kept too, so converting the table
+    back does not lose them to float64.
+    The accessible params are:
+     - rows: the read-only structured array.
+     - symbols: tuple with the joint symbols, in order.
+     - joints: for each row, the column of the joint values it uses (or -1).
+     - Tx, Ty, Tz: translations of the end-effector.
+     - radii: the capsule radius of each link, for collision queries.
+     - constants: for each row, the exact (theta, d, a, alpha) values - the offset
+       for the joint variable - or None when the table was built from floats.
+    Instances are hashable, so they can be used as keys for caches. The radii are
+    part of the fingerprint, as models with different radii collide differently.
+    """
+
+    __slots__ = ("rows", "symbols", "joints", "Tx", "Ty", "Tz", "radii", "constants",
+                 "_fingerprint")
+
+    dtype = np.dtype([("theta", "<f8"),
+                      ('d', "<f8"),
+                      ('a', "<f8"),
+                      ("alpha", "<f8"),
+                      ("joint", "i1")])
+
+    def __init__(self,
+                 rows: np.ndarray,
+                 symbols: Tuple[Symbol, ...],
+                 Tx: float = 0.,
+                 Ty: float = 0.,
+                 Tz: float = 0.,
+                 radii: np.ndarray = None,
+                 constants: Tuple[tuple, ...] = None):
+        """
+        Creates a new instance from an already built structured array. Use
+        "from_table" or "DHTable.compact" for converting an existing table.
+        :param rows: structured array with "CompactDHTable.dtype".
+        :param symbols: the joint symbols, one for each row whose "joint" is not -1.
+        :param Tx: translation in 'X' axis.
+        :param Ty: translation in 'Y' axis.
+        :param Tz: translation in 'Z' axis.
+        :param radii: the capsule radius of each row - default: all zero.
+        :param constants: the exact (theta, d, a, alpha) values of each row, whose
+        float64 approximations are in "rows" - default: the floats themselves.
+        :raises ValueError when the symbols do not match the joint rows or there is
+        not one radius and one set of constants for each row.
+        """
+        rows = np.array(rows, dtype=self.dtype)
+        rows.flags.writeable = False
+        variable = rows["joint"] >= 0
+        if int(variable.sum()) != len(symbols):
+            raise ValueError("There must be one symbol for each joint row")
+        joints = np.where(variable, np.cumsum(variable) - 1, -1)
+        joints.flags.writeable = False
+        radii = np.zeros(len(rows)) if radii is None else \
+            np.array(radii, dtype=np.float64)
+        if radii.shape != (len(rows),):
+            raise ValueError("There must be one radius for each row")
+        radii.flags.writeable = False
+        if constants is not None:
+            constants = tuple(tuple(row) for row in constants)
+            if len(constants) != len(rows) or \
+                    any(len(row) != len(PARAMS) for row in constants):
+                raise ValueError("There must be four constants for each row")
+        self.rows = rows
+        self.symbols = tuple(symbols)
+        self.joints = joints
+        self.Tx = float(Tx)
+        self.Ty = float(Ty)
+        self.Tz = float(Tz)
+        self.radii = radii
+        self.constants = constants
+        self._fingerprint = None
+
+    @classmethod
+    def from_table(cls, table: DHTable) -> 'CompactDHTable':
+        """
+        Converts a DHTable into its compact representation.
+        :param table: the Denavit-Hartenberg table.
+        :return: the compact table.
+        :raises ValueError when a row has more than one joint variable or a value
+        that is neither a number nor a symbol plus a constant offset.
+        """
+        rows = np.zeros(table.max, dtype=cls.dtype)
+        radii = [row.get("radius", 0.) for row in table.get()]
+        constants = list()
+        symbols = list()
+        for i, *values in table:
+            joint = -1
+            for column, original in enumerate(values):
+                value = sympify(original)
+                free_symbols = value.free_symbols
+                if len(free_symbols) == 0:
+                    rows[PARAMS[column]][i - 1] = float(value)
+                    continue
+                if joint != -1 or len(free_symbols) > 1:
+                    raise ValueError(f"Row {i} has more than one joint variable")
+                symbol = _joint_symbol(value)
+                if symbol is None:
+                    raise ValueError(f"Row {i}: '{value}' is not a joint variable "
+                                     f"plus a constant offset")
+                offset = value - symbol
+                rows[PARAMS[column]][i - 1] = float(offset)
+                values[column] = offset
+                joint = column
+                symbols.append(symbol)
+            rows["joint"][i - 1] = joint
+            constants.append(values)
+        return cls(rows, tuple(symbols), table.Tx, table.Ty, table.Tz, radii, constants)
+
+    def to_list(self) -> List[dict]:
+        """
+        Converts the table into the list of dicts used by DHTable. Joint values are
+        restored as their symbol plus the offset, if any, and the constants keep
+        their original (exact) values.
+        :return: the list of rows.
+        """
+        result = list()
+        for (_, theta, d, a, alpha), radius in zip(self, self.radii.tolist()):
+            result.append({'a': a, 'd': d, "alpha": alpha, "theta": theta,
+                           "radius": radius})
+        return result
+
+    def to_table(self) -> DHTable:
+        """
+        Converts the compact table back into a DHTable.
+        :return: the Denavit-Hartenberg table.
+        """
+        table = DHTable(self.to_list())
+        table.Tx = self.Tx
+        table.Ty = self.Ty
+        table.Tz = self.Tz
+        return table
+
+    def fingerprint(self) -> str:
+        """
+        Obtains a stable digest of the table contents, including the joint
+        symbols, the translations and the radii. Tables without radii (all zero)
+        keep the digest they had before radii existed.
+        :return: the hexadecimal SHA-256 digest of the table.
+        """
+        if self._fingerprint is None:
+            digest = sha256(self.rows.tobytes())
+            digest.update(','.join(str(symbol) for symbol in self.symbols).encode())
+            digest.update(np.array([self.Tx, self.Ty, self.Tz], "<f8").tobytes())
+            if self.radii.any():
+                digest.update(self.radii.astype("<f8").tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    @property
+    def max(self) -> int:
+        """
+        :return: how many rows does the table have.
+        """
+        return len(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[dict, 'CompactDHTable']:
+        """
+        Obtains a row, as a dict, or a slice of the table. Slices keep the
+        translations only if they contain the last row, as the translations are
+        applied to the end-effector.
+        """
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self.rows))
+            rows = self.rows[item]
+            symbols = tuple(self.symbols[j] for j in self.joints[item] if j >= 0)
+            constants = self.constants[item] if self.constants is not None else None
+            if step == 1 and stop == len(self.rows) and len(rows) > 0:
+                return CompactDHTable(rows, symbols, self.Tx, self.Ty, self.Tz,
+                                      self.radii[item], constants)
+            return CompactDHTable(rows, symbols, radii=self.radii[item],
+                                  constants=constants)
+        i = int(item) % len(self.rows)
+        _, theta, d, a, alpha = self._row(i)
+        return {'a': a, 'd': d, "alpha": alpha, "theta": theta,
+                "radius": float(self.radii[i])}
+
+    def _row(self, i: int) -> tuple:
+        *values, joint = self.rows[i].tolist()
+        if self.constants is not None:
+            values = list(self.constants[i])
+        if joint >= 0:
+            symbol = self.symbols[self.joints[i]]
+            values[joint] = symbol + values[joint] if values[joint] != 0 else symbol
+        return (i + 1, *values)
+
+    def __iter__(self) -> Iterator[tuple]:
+        for i in range(len(self.rows)):
+            yield self._row(i)
+
+    def __hash__(self):
+        return hash(self.fingerprint())
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactDHTable):
+            return NotImplemented
+        return self.fingerprint() == other.fingerprint()
+
+    def __str__(self):
+        return str(self.to_table())
@@ -0,0 +1,180 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from typing import Sequence
+from typing import Union
+
+import numpy as np
+
+from .dh_table import DHTable
+from .dh_table import CompactDHTable
+from .numeric import as_batch
+from .numeric import link_transforms
+
+
+class LinkInertia:
+    """
+    Inertial parameters of a link. All of them are expressed in the link frame,
+    this is, the frame placed at the end of the link by the Denavit-Hartenberg
+    convention (the frame of A(i-1)(i)).
+    The accessible params are:
+     - mass: the mass of the link.
+     - center: the center of mass, relative to the origin of the frame.
+     - inertia: the 3x3 inertia tensor about the center of mass.
+    """
+
+    __slots__ = ("mass", "center", "inertia")
+
+    def __init__(self,
+                 mass: float,
+                 center: Sequence[float] = (0., 0., 0.),
+                 inertia: Sequence[Sequence[float]] = None):
+        """
+        Creates the inertial parameters for a link.
+        :param mass: the mass of the link.
+        :param center: the center of mass in the link frame - default: the origin.
+        :param inertia: the inertia tensor about the center of mass - default: a
+        point mass (zero tensor).
+        :raises ValueError when the center or the tensor do not have valid shapes.
+        """
+        self.mass = float(mass)
+        self.center = np.asarray(center, dtype=np.float64)
+        self.inertia = np.zeros((3, 3)) if inertia is None else \
+            np.asarray(inertia, dtype=np.float64)
+        if self.center.shape != (3,) or self.inertia.shape != (3, 3):
+            raise ValueError("center must have 3 values and inertia must be 3x3")
+
+
+class InverseDynamics:
+    """
+    Inverse dynamics for an arbitrary serial manipulator, by using the recursive
+    Newton-Euler algorithm. Every configuration of a batch is solved at once: the
+    recursion runs over the links (O(n)) and each step is vectorized over the
+    configurations with NumPy.
+    Units must be consistent: if the table lengths are in millimetres, gravity
+    must be given in mm/s² and the inertia tensors in kg·mm².
+    The accessible params are:
+     - params: the compact Denavit-Hartenberg table.
+     - links: the LinkInertia of each link.
+     - gravity: the gravity vector in the base frame.
+    """
+
+    def __init__(self,
+                 params: Union[DHTable, CompactDHTable],
+                 links: Sequence[LinkInertia],
+                 gravity: Sequence[float] = (0., 0., -9.81)):
+        """
+        Generates a new instance for the inverse dynamics.
+        :param params: the Denavit-Hartenberg params.
+        :param links: the inertial parameters, one for each row of the table.
+        :param gravity: the gravity vector, in the base frame - default: -9.81 in Z.
+        :raises ValueError when the number of links does not match the table or
+        when a joint variable is neither theta (revolute) nor d (prismatic).
+        """
+        self.params = params.compact() if isinstance(params, DHTable) else params
+        if len(links) != len(self.params):
+            raise ValueError(f"There must be one LinkInertia for each row - "
+                             f"expected {len(self.params)}, got {len(links)}")
+        if np.any(self.params.rows["joint"] > 1):
+            raise ValueError("Only revolute (theta) and prismatic (d) joints are "
+                             "supported")
+        self.links = tuple(links)
+        self.gravity = np.asarray(gravity, dtype=np.float64)
+        alpha = self.params.rows["alpha"]
+        self._masses = np.array([link.mass for link in self.links])
+        self._centers = np.array([link.center for link in self.links])
+        self._inertias = np.array([link.inertia for link in self.links])
+        # Axis of the joint and origin of each frame, both expressed in that frame
+        self._axes = np.stack([np.zeros_like(alpha), np.sin(alpha), np.cos(alpha)],
+                              axis=1)
+
+    def torques(self,
+                q: np.ndarray,
+                qd: np.ndarray = None,
+                qdd: np.ndarray = None) -> np.ndarray:
+        """
+        Computes the joint torques (or forces, for prismatic joints) required for
+        following the given joint positions, velocities and accelerations.
+        :param q: the joint values, as a (N, dof) array.
+        :param qd: the joint velocities, as a (N, dof) array - default: zero.
+        :param qdd: the joint accelerations, as a (N, dof) array - default: zero.
+        :return: a (N, dof) array with the joint torques.
+        """
+        dof = len(self.params.symbols)
+        q = as_batch(q, dof)
+        qd = np.zeros_like(q) if qd is None else as_batch(qd, dof)
+        qdd = np.zeros_like(q) if qdd is None else as_batch(qdd, dof)
+        transforms = link_transforms(self.params, q)
+        rotations = transforms[..., :3, :3]
+        n = transforms.shape[1]
+        samples = len(q)
+        # Origin of frame i relative to frame i - 1, expressed in frame i
+        offsets = np.einsum("nkji,nkj->nki", rotations, transforms[..., :3, 3])
+        joints = self.params.joints
+        kinds = self.params.rows["joint"]
+
+        w = np.zeros((samples, 3))
+        wd = np.zeros((samples, 3))
+        vd = np.broadcast_to(-self.gravity, (samples, 3))
+        forces = np.empty((samples, n, 3))
+        moments = np.empty((samples, n, 3))
+        for i in range(n):
+            rotation = rotations[:, i]
+            offset = offsets[:, i]
+            w_prev = w
+            w = np.einsum("nji,nj->ni", rotation, w_prev)
+            wd = np.einsum("nji,nj->ni", rotation, wd)
+            vd = np.einsum("nji,nj->ni", rotation, vd)
+            if joints[i] >= 0:
+                axis = self._axes[i]
+                velocity = qd[:, joints[i], np.newaxis] * axis
+                acceleration = qdd[:, joints[i], np.newaxis] * axis
+                if kinds[i] == 0:
+                    wd = wd + acceleration + np.cross(w, velocity)
+                    w = w + velocity
+                else:
+                    vd = vd + acceleration + 2 * np.cross(w, velocity)
+            vd = vd + np.cross(wd, offset) + np.cross(w, np.cross(w, offset))
+            center = self._centers[i]
+            vc = vd + np.cross(wd, center) + np.cross(w, np.cross(w, center))
+            inertia = self._inertias[i]
+            forces[:, i] = self._masses[i] * vc
+            moments[:, i] = wd @ inertia.T + np.cross(w, w @ inertia.T)
+
+        result = np.empty((samples, dof))
+        f = np.zeros((samples, 3))
+        nt = np.zeros((samples, 3))
+        for i in range(n - 1, -1, -1):
+            offset = offsets[:, i]
+            if i + 1 < n:
+                rotation = rotations[:, i + 1]
+                nt = np.einsum("nij,nj->ni", rotation, nt) + \
+                     np.cross(offset, np.einsum("nij,nj->ni", rotation, f))
+                f = np.einsum("nij,nj->ni", rotation, f)
+            nt = nt + np.cross(offset + self._centers[i], forces[:, i]) + moments[:, i]
+            f = f + forces[:, i]
+            if joints[i] >= 0:
+                load = nt if kinds[i] == 0 else f
+                result[:, joints[i]] = load @ self._axes[i]
+        return result
+
+    def gravity_torques(self, q: np.ndarray) -> np.ndarray:
+        """
+        Computes the static joint torques required for holding the configurations
+        against gravity.
+        :param q: the joint values, as a (N, dof) array.
+        :return: a (N, dof) array with the joint torques.
+        """
+        return self.torques(q)
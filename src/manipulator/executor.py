@@ -0,0 +1,209 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from time import perf_counter
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+from .model import CompiledModel
+
+
+def _positions(model: CompiledModel, q: np.ndarray) -> np.ndarray:
+    return model.frames(q, positions_only=True)[:, -1]
+
+
+OPERATIONS: Dict[str, Tuple[Callable[[CompiledModel, np.ndarray], np.ndarray],
+                            Callable[[int], Tuple[int, ...]]]] = {
+    "positions": (_positions, lambda dof: (3,)),
+    "poses": (CompiledModel.poses, lambda dof: (4,)),
+    "jacobian": (CompiledModel.jacobian, lambda dof: (6, dof)),
+    "inverse_jacobian": (CompiledModel.inverse_jacobian, lambda dof: (dof, 3)),
+    "inverse": (CompiledModel.inverse, lambda dof: (3,)),
+}
+"""
+Operations that the executor can run, as name: (function, shape of each result
+given the number of joints). "inverse" takes (X, Y, Z, phi) rows; the rest take
+joint values.
+"""
+
+_worker_model: CompiledModel = None
+
+
+def _init_worker(model: CompiledModel):
+    global _worker_model
+    _worker_model = model
+
+
+def _attach(location: Union[str, Path],
+            shape: Tuple[int, ...]) -> Tuple[np.ndarray, SharedMemory]:
+    if isinstance(location, Path):
+        return np.load(location, mmap_mode="r+"), None
+    memory = SharedMemory(location)
+    return np.ndarray(shape, dtype=np.float64, buffer=memory.buf), memory
+
+
+def _run_shard(operation: str,
+               source: Tuple[Union[str, Path], Tuple[int, ...]],
+               target: Tuple[Union[str, Path], Tuple[int, ...]],
+               start: int,
+               stop: int,
+               chunk_size: int) -> int:
+    function, _ = OPERATIONS[operation]
+    inputs, input_memory = _attach(*source)
+    outputs, output_memory = _attach(*target)
+    try:
+        for begin in range(start, stop, chunk_size):
+            end = min(begin + chunk_size, stop)
+            outputs[begin:end] = function(_worker_model, inputs[begin:end])
+        if isinstance(outputs, np.memmap):
+            outputs.flush()
+    finally:
+        del inputs, outputs
+        for memory in (input_memory, output_memory):
+            if memory is not None:
+                memory.close()
+    return stop - start
+
+
+class BatchExecutor:
+    """
+    Runs a CompiledModel over large batches in a pool of worker processes. The
+    model is sent to each worker only once, when the pool starts, and every batch
+    is split in shards whose inputs and results are exchanged through shared
+    memory (or a memory-mapped ".npy" file), so only the shard bounds are pickled.
+    Results kept in shared memory belong to the executor: they stay valid until it
+    is closed, so copy them (or write them to a file) before that.
+    The accessible params are:
+     - model: the CompiledModel.
+     - workers: the number of worker processes.
+     - chunk_size: the number of rows a worker evaluates at once.
+     - throughput: the rows per second of the last batch.
+    """
+
+    def __init__(self,
+                 model: CompiledModel,
+                 workers: int = None,
+                 chunk_size: int = 65536):
+        """
+        Starts the worker pool.
+        :param model: the compiled model - see "Manipulator.compile".
+        :param workers: the number of worker processes - default: one per CPU.
+        :param chunk_size: the number of rows evaluated at once - default: 65536.
+        """
+        self.model = model
+        self.chunk_size = chunk_size
+        self.throughput = 0.
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                         initargs=(model,))
+        self._memory: List[SharedMemory] = list()
+
+    def _shared(self, shape: Tuple[int, ...]) -> Tuple[np.ndarray, SharedMemory]:
+        size = max(int(np.prod(shape)) * np.dtype(np.float64).itemsize, 1)
+        memory = SharedMemory(create=True, size=size)
+        return np.ndarray(shape, dtype=np.float64, buffer=memory.buf), memory
+
+    def run(self,
+            operation: str,
+            inputs: np.ndarray,
+            out: Union[str, Path] = None,
+            shards: int = None) -> np.ndarray:
+        """
+        Evaluates an operation for every row of the inputs.
+        :param operation: the operation - must be one of OPERATIONS.
+        :param inputs: the joint values (or points, for "inverse"), as a (N, D)
+        array.
+        :param out: a ".npy" file for the results, which are then returned as a
+        memory map - default: shared memory owned by the executor.
+        :param shards: the number of shards - default: four per worker.
+        :return: the results, as a (N, ...) array.
+        :raises ValueError when the operation is not valid.
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"operation must be {list(OPERATIONS)}")
+        start = perf_counter()
+        inputs = np.asarray(inputs, dtype=np.float64)
+        if inputs.ndim == 1:
+            inputs = inputs[np.newaxis, :]
+        shape = (len(inputs),) + OPERATIONS[operation][1](len(self.model.symbols))
+        shared_inputs, input_memory = self._shared(inputs.shape)
+        shared_inputs[...] = inputs
+        if out is None:
+            outputs, output_memory = self._shared(shape)
+            self._memory.append(output_memory)
+            target = (output_memory.name, shape)
+        else:
+            out = Path(out)
+            outputs = np.lib.format.open_memmap(out, mode="w+", dtype=np.float64,
+                                                shape=shape)
+            target = (out, shape)
+        try:
+            if shards is None:
+                shards = 4 * self.workers
+            bounds = np.linspace(0, len(inputs), max(shards, 1) + 1).astype(int)
+            futures = [self._pool.submit(_run_shard, operation,
+                                         (input_memory.name, inputs.shape), target,
+                                         int(begin), int(end), self.chunk_size)
+                       for begin, end in zip(bounds[:-1], bounds[1:]) if end > begin]
+            wait(futures)
+            for future in futures:
+                # Raise the first error, if any
+                future.result()
+        finally:
+            del shared_inputs
+            input_memory.close()
+            input_memory.unlink()
+        elapsed = perf_counter() - start
+        self.throughput = len(inputs) / elapsed if elapsed > 0 else float("inf")
+        return outputs
+
+    def release(self):
+        """
+        Releases the shared memory of all the results returned so far, keeping the
+        workers - those results must not be used afterwards. Useful when a stream
+        of batches is run and each result is copied elsewhere.
+        """
+        for memory in self._memory:
+            try:
+                memory.close()
+            except BufferError:
+                # Some result is still referenced: the mapping is kept alive
+                pass
+            memory.unlink()
+        self._memory.clear()
+
+    def close(self):
+        """
+        Stops the workers and releases the shared memory of all the results.
+        """
+        self._pool.shutdown()
+        self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
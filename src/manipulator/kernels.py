@@ -0,0 +1,232 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from time import perf_counter
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+
+from sympy import Expr
+from sympy import Matrix
+from sympy import lambdify
+
+from .numeric import as_batch
+from .symbols import Symbol
+
+
+class CompiledExpressions:
+    """
+    Batched numeric evaluator for a list of SymPy expressions. The expressions are
+    compiled with NumPy and, by default, common subexpressions are computed only
+    once for all of them.
+    The accessible params are:
+     - symbols: the input symbols, in the order of the columns of the input.
+     - size: how many expressions are evaluated.
+    """
+
+    def __init__(self,
+                 symbols: Sequence[Symbol],
+                 expressions: Sequence[Expr],
+                 cse: bool = True):
+        """
+        Compiles the expressions.
+        :param symbols: the input symbols.
+        :param expressions: the expressions to evaluate.
+        :param cse: whether to eliminate common subexpressions - default: True.
+        """
+        self.symbols = tuple(symbols)
+        self.size = len(expressions)
+        self._expressions = list(expressions)
+        self._cse = cse
+        self._function = lambdify(self.symbols, self._expressions, modules="numpy",
+                                  cse=cse)
+
+    def __call__(self, q: np.ndarray) -> np.ndarray:
+        """
+        Evaluates the expressions for a batch of inputs.
+        :param q: the input values, as a (N, len(symbols)) array.
+        :return: a (N, size) array with the values of the expressions - NaN where
+        they are not real.
+        """
+        q = as_batch(q, len(self.symbols))
+        with np.errstate(invalid="ignore"):
+            values = self._function(*q.T)
+        result = np.empty((len(q), self.size))
+        for i, value in enumerate(values):
+            result[:, i] = value
+        return result
+
+    def __getstate__(self):
+        # Generated functions cannot be pickled, so they are compiled again
+        return self.symbols, self._expressions, self._cse
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+class FusedKernel:
+    """
+    Fused evaluator for the end-effector pose, the Jacobian matrix and the
+    determinant of its upper (linear velocity) part. All the outputs are compiled
+    together, so the shared terms (sines, cosines and their products) are
+    evaluated once per configuration.
+    The accessible params are:
+     - symbols: the joint symbols, in the order of the columns of the input.
+     - pose: the (X, Y, Z, Phi_x, Phi_y, Phi_z) expressions.
+     - jacobian: the Jacobian matrix.
+     - det: the determinant expression, or None when the upper part of the
+       Jacobian is not square.
+    """
+
+    def __init__(self,
+                 symbols: Sequence[Symbol],
+                 pose: Matrix,
+                 jacobian: Matrix,
+                 det: Expr = None):
+        """
+        Compiles the fused kernel.
+        :param symbols: the joint symbols.
+        :param pose: the pose expressions, as a column matrix.
+        :param jacobian: the Jacobian of the pose with respect to the symbols.
+        :param det: the determinant of the upper Jacobian, if any.
+        """
+        self.symbols = tuple(symbols)
+        self.pose = pose
+        self.jacobian = jacobian
+        self.det = det
+        self._compiled = CompiledExpressions(self.symbols, self._expressions())
+        self._separate: List[CompiledExpressions] = None
+
+    def _expressions(self) -> List[Expr]:
+        expressions = list(self.pose) + list(self.jacobian)
+        if self.det is not None:
+            expressions.append(self.det)
+        return expressions
+
+    def _split(self, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        rows, cols = self.jacobian.shape
+        pose = values[:, :rows]
+        jacobian = values[:, rows:rows + rows * cols].reshape(-1, rows, cols)
+        det = values[:, -1] if self.det is not None else None
+        return pose, jacobian, det
+
+    def __call__(self, q: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Evaluates the pose, the Jacobian and its determinant.
+        :param q: the joint values, as a (N, dof) array.
+        :return: (pose, jacobian, det) as (N, 6), (N, 6, dof) and (N,) arrays - det
+        is None when the upper Jacobian is not square.
+        """
+        return self._split(self._compiled(q))
+
+    def separate(self, q: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Evaluates the same outputs with a different evaluator for each of them,
+        as it was done before the fused kernel. Used as a reference.
+        :param q: the joint values, as a (N, dof) array.
+        :return: (pose, jacobian, det), as returned by calling the kernel.
+        """
+        if self._separate is None:
+            self._separate = [CompiledExpressions(self.symbols, list(self.pose)),
+                              CompiledExpressions(self.symbols, list(self.jacobian))]
+            if self.det is not None:
+                self._separate.append(CompiledExpressions(self.symbols, [self.det]))
+        values = np.concatenate([evaluator(q) for evaluator in self._separate], axis=1)
+        return self._split(values)
+
+    def measure_speedup(self, q: np.ndarray, repeat: int = 10) -> float:
+        """
+        Measures the speedup of the fused kernel over the separate evaluation.
+        :param q: the joint values used for the measure, as a (N, dof) array.
+        :param repeat: how many times each evaluation is run - the best one is kept.
+        :return: the separate evaluation time divided by the fused one.
+        """
+        self.separate(q)
+        fused = separate = float("inf")
+        for _ in range(repeat):
+            start = perf_counter()
+            self(q)
+            fused = min(fused, perf_counter() - start)
+            start = perf_counter()
+            self.separate(q)
+            separate = min(separate, perf_counter() - start)
+        return separate / fused
+
+
+class DerivativeKernel:
+    """
+    Fused evaluator for the Jacobian matrix and the kinematic Hessian, which give
+    the second-order terms needed at acceleration level: J'(q, q') = H(q) q' and
+    x'' = J q'' + J' q'. Both are compiled together, sharing the common
+    subexpressions.
+    The accessible params are:
+     - symbols: the joint symbols, in the order of the columns of the input.
+     - jacobian: the Jacobian matrix.
+     - hessian: list with the derivative of the Jacobian with respect to each
+       symbol.
+    """
+
+    def __init__(self,
+                 symbols: Sequence[Symbol],
+                 jacobian: Matrix,
+                 hessian: Sequence[Matrix]):
+        """
+        Compiles the kernel.
+        :param symbols: the joint symbols.
+        :param jacobian: the Jacobian matrix.
+        :param hessian: the derivative of the Jacobian for each symbol.
+        """
+        self.symbols = tuple(symbols)
+        self.jacobian = jacobian
+        self.hessian = list(hessian)
+        expressions = list(jacobian)
+        for matrix in self.hessian:
+            expressions.extend(matrix)
+        self._compiled = CompiledExpressions(self.symbols, expressions)
+
+    def __call__(self, q: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluates the Jacobian and the Hessian.
+        :param q: the joint values, as a (N, dof) array.
+        :return: (jacobian, hessian) as (N, 6, dof) and (N, 6, dof, dof) arrays -
+        hessian[n, i, j, k] is the derivative of jacobian[n, i, j] with respect to
+        the k-th joint.
+        """
+        rows, cols = self.jacobian.shape
+        values = self._compiled(q)
+        jacobian = values[:, :rows * cols].reshape(-1, rows, cols)
+        hessian = values[:, rows * cols:].reshape(-1, len(self.hessian), rows, cols)
+        return jacobian, hessian.transpose(0, 2, 3, 1)
+
+    def jacobian_derivative(self,
+                            q: np.ndarray,
+                            qd: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluates the Jacobian and its time derivative.
+        :param q: the joint values, as a (N, dof) array.
+        :param qd: the joint velocities, as a (N, dof) array.
+        :return: (jacobian, jacobian_derivative), both (N, 6, dof) arrays.
+        """
+        jacobian, hessian = self(q)
+        qd = as_batch(qd, len(self.symbols))
+        return jacobian, np.einsum("nijk,nk->nij", hessian, qd)
+
+    def __getstate__(self):
+        return self.symbols, self.jacobian, self.hessian
+
+    def __setstate__(self, state):
+        self.__init__(*state)
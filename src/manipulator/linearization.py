@@ -0,0 +1,163 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from typing import Callable
+from typing import Union
+
+import numpy as np
+
+from .dh_table import DHTable
+from .dh_table import CompactDHTable
+from .numeric import chain_frames
+
+
+class LinearizedPath:
+    """
+    Joint-space waypoints that follow a Cartesian path within a tolerance when
+    they are linearly interpolated. The accessible params are:
+     - s: the path parameter of each waypoint - the integer part is the index of
+       the Cartesian segment and the fraction the position along it.
+     - q: the joint waypoints, as a (K, dof) array.
+     - points: the Cartesian point of each waypoint, as a (K, D) array.
+     - errors: the midpoint deviation of each joint segment, as a (K - 1,) array.
+     - ik_points: how many points were solved by the inverse kinematics.
+     - ik_calls: how many (batched) calls were made to the inverse kinematics.
+     - converged: whether every segment is within the tolerance - False when the
+       maximum depth was reached somewhere.
+    """
+
+    def __init__(self,
+                 s: np.ndarray,
+                 q: np.ndarray,
+                 points: np.ndarray,
+                 errors: np.ndarray,
+                 ik_points: int,
+                 ik_calls: int,
+                 converged: bool):
+        self.s = s
+        self.q = q
+        self.points = points
+        self.errors = errors
+        self.ik_points = ik_points
+        self.ik_calls = ik_calls
+        self.converged = converged
+
+    @property
+    def max_error(self) -> float:
+        return float(self.errors.max(initial=0.))
+
+    def __len__(self):
+        return len(self.q)
+
+    def __str__(self):
+        return f"{len(self.q)} waypoints - {self.ik_points} IK points in " \
+               f"{self.ik_calls} calls - max midpoint error {self.max_error:.4g}" + \
+               ("" if self.converged else " (maximum depth reached)")
+
+
+def linearize(params: Union[DHTable, CompactDHTable],
+              inverse: Callable[[np.ndarray], np.ndarray],
+              points: np.ndarray,
+              tolerance: float = 0.1,
+              max_depth: int = 16) -> LinearizedPath:
+    """
+    Converts a piecewise linear Cartesian path into the fewest joint waypoints
+    whose linear joint interpolation stays within a tolerance of it. The inverse
+    kinematics is only solved at the ends of each segment; the joint midpoint is
+    checked with the forward kinematics against the Cartesian midpoint and the
+    segment is split in two only when the deviation exceeds the tolerance. All
+    the segments of one subdivision level are solved in a single batched call.
+    Joint differences are wrapped to [-pi, pi) - the IK may jump by 2 pi across
+    the atan2 branch cut - and the returned waypoints are unwrapped, so they are
+    interpolated the short way round.
+    For the uArm: linearize(manipulator.params, manipulator.uarm_ik.compile(),
+    points) with (X, Y, Z, phi) points.
+    :param params: the Denavit-Hartenberg params.
+    :param inverse: batched inverse kinematics - it receives a (N, D) array of
+    points and returns a (N, dof) array of joints (NaN when unreachable).
+    :param points: the Cartesian path vertices, as a (M, D) array whose first three
+    columns are (X, Y, Z) - the rest (for example, phi) are interpolated too.
+    :param tolerance: the largest position deviation allowed - default: 0.1.
+    :param max_depth: the most times a segment is split - default: 16.
+    :return: the LinearizedPath.
+    :raises ValueError when there are less than two points or some point along the
+    path cannot be reached.
+    """
+    params = params.compact() if isinstance(params, DHTable) else params
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 2 or len(points) < 2:
+        raise ValueError("The path must have at least two points")
+    ik_calls = 0
+    ik_points = 0
+
+    def solve(s: np.ndarray) -> np.ndarray:
+        nonlocal ik_calls, ik_points
+        ik_calls += 1
+        ik_points += len(s)
+        q = np.asarray(inverse(at(s)), dtype=np.float64)
+        unreachable = ~np.all(np.isfinite(q), axis=1)
+        if unreachable.any():
+            raise ValueError(f"The point {at(s[unreachable][:1])[0]} cannot be reached")
+        return q
+
+    def at(s: np.ndarray) -> np.ndarray:
+        index = np.minimum(np.floor(s).astype(np.intp), len(points) - 2)
+        fraction = (s - index)[:, np.newaxis]
+        return points[index] + fraction * (points[index + 1] - points[index])
+
+    s = np.arange(len(points), dtype=np.float64)
+    q = solve(s)
+    # Segments still to check, as the indices of their ends in "nodes_s" / "nodes_q"
+    nodes_s = list(s)
+    nodes_q = list(q)
+    starts = np.arange(len(points) - 1)
+    ends = starts + 1
+    depth = 0
+    accepted = list()
+    converged = True
+    while len(starts) > 0:
+        s0, s1 = np.array(nodes_s)[starts], np.array(nodes_s)[ends]
+        q0, q1 = np.array(nodes_q)[starts], np.array(nodes_q)[ends]
+        difference = np.remainder(q1 - q0 + np.pi, 2 * np.pi) - np.pi
+        middle = (s0 + s1) / 2.
+        position = chain_frames(params, q0 + difference / 2.,
+                                positions_only=True)[:, -1]
+        errors = np.linalg.norm(position - at(middle)[:, :3], axis=1)
+        good = errors <= tolerance
+        if depth >= max_depth:
+            converged = converged and bool(good.all())
+            good[:] = True
+        accepted.extend(zip(starts[good], ends[good], errors[good]))
+        bad = np.flatnonzero(~good)
+        if len(bad) == 0:
+            break
+        new_q = solve(middle[bad])
+        new_indices = np.arange(len(nodes_s), len(nodes_s) + len(bad))
+        nodes_s.extend(middle[bad])
+        nodes_q.extend(new_q)
+        starts, ends = (np.concatenate([starts[bad], new_indices]),
+                        np.concatenate([new_indices, ends[bad]]))
+        depth += 1
+
+    nodes_s = np.array(nodes_s)
+    order = np.argsort(nodes_s)
+    segment_errors = dict((start, error) for start, _, error in accepted)
+    return LinearizedPath(nodes_s[order],
+                          np.unwrap(np.array(nodes_q)[order], axis=0),
+                          at(nodes_s[order]),
+                          np.array([segment_errors[index] for index in order[:-1]]),
+                          ik_points,
+                          ik_calls,
+                          converged)
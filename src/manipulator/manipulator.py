@@ -13,24 +13,46 @@
 #
 #     You should have received a copy of the GNU General Public License
 #    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import warnings
+
+from time import perf_counter
 from typing import Union
 from typing import Tuple
 from typing import Dict
 from typing import Any
+from typing import List
+from typing import Sequence
 
 from sympy import Matrix
 from sympy import symbols
-from sympy import simplify
 
 from numbers import Number
 
+import numpy as np
+
 from . import sin
 from . import cos
 from . import sqrt
 from . import atan2
 from . import Symbol
 from . import DHTable
+from . import CompactDHTable
 from . import to_latrix
+from . import Optimization
+
+from .optimization import DerivationReport
+from .optimization import ExpressionBudget
+from .optimization import ExpressionStats
+from .optimization import apply_optimization
+from .optimization import eliminate_subexpressions
+from .optimization import expression_size
+from .optimization import expression_stats
+from .numeric import chain_frames
+from .numeric import geometric_jacobian
+from .kernels import CompiledExpressions
+from .kernels import FusedKernel
+from .kernels import DerivativeKernel
+from .model import CompiledModel
 
 
 class ForwardKinematics:
@@ -44,41 +66,89 @@ class ForwardKinematics:
          - params: DHTable.
          - transformation_matrices: dict with the forward transformation matrices.
          - phi_e: expression for phi_e.
+         - compact_params: CompactDHTable used for the numeric evaluations - built
+           on first use, so tables that only have a symbolic form still work.
+         - report: DerivationReport with the derivation time and matrices' sizes.
+         - budget: the ExpressionBudget for the matrices, if any.
+         - numeric_only: whether the budget was exceeded and the symbolic matrices
+           were dropped - only the numeric evaluations are available then.
     Matrices are accessible by using square brackets: fk["A03"].
     """
 
-    def __init__(self, params: DHTable, optimize: bool = True):
+    def __init__(self,
+                 params: DHTable,
+                 optimize: Union[bool, str, Optimization] = True,
+                 budget: ExpressionBudget = None):
         """
         Generates a new instance for the class. It calculates the forward
         transformation matrices (symbolically) in order to use them later
         and not calculating them every time they are needed.
         :param params: the Denavit-Hartenberg params.
-        :param optimize: whether to optimize or not the matrices - requires more
-        computation time - default: True
+        :param optimize: the optimization level for the matrices - higher levels
+        require more computation time. Booleans are accepted: True is the "full"
+        level and False is "none" - default: True
+        :param budget: limits for the size of the matrices - default: no limits.
         """
         self.params = params
+        self._compact_params: CompactDHTable = None
         self.transformation_matrices: Dict[str, Matrix] = {}
-        self._calc_matrices(optimize)
+        self.report: DerivationReport = None
+        self.budget = budget
+        self.numeric_only = False
+        self._calc_matrices(Optimization.parse(optimize))
         self.phi_e = None
+        self._phi_evaluator: CompiledExpressions = None
 
-    def _calc_matrices(self, optimize: bool):
+    def _calc_matrices(self, level: Optimization):
         """
         Internal function which iteratively calculates the required transformation
         matrices.
-        :param optimize: whether to optimize or not the matrices.
+        :param level: the optimization level for the matrices.
         """
+        start = perf_counter()
+        stats: Dict[str, ExpressionStats] = dict()
         for i, theta, d, a, alpha in self.params:
             self.transformation_matrices[f"A{i - 1}{i}"] = \
                 self._matrix(theta, d, a, alpha)
-        for i in range(2, self.params.max + 1):
-            self.transformation_matrices[f"A0{i}"] = \
+        for i in range(1, self.params.max + 1):
+            matrix = self.transformation_matrices["A01"] if i == 1 else \
                 self.transformation_matrices[f"A0{i - 1}"] * \
                 self.transformation_matrices[f"A{i - 1}{i}"]
-            if optimize:
-                self.transformation_matrices[f"A0{i}"].simplify()
-        self.transformation_matrices[f"A0{self.params.max}"][0, 3] += self.params.Tx
-        self.transformation_matrices[f"A0{self.params.max}"][1, 3] += self.params.Ty
-        self.transformation_matrices[f"A0{self.params.max}"][2, 3] += self.params.Tz
+            # The raw product is measured, so a runaway expression is caught before
+            # paying for its optimization
+            if self.budget is not None and \
+                    not self.budget.check(matrix, f"A0{i}", stats) and self.budget.numeric:
+                # The rest would be even larger: drop them all and keep the numeric
+                # evaluations only
+                self.numeric_only = True
+                self.transformation_matrices.clear()
+                break
+            if i > 1:
+                self.transformation_matrices[f"A0{i}"] = apply_optimization(matrix, level)
+        if not self.numeric_only:
+            self.transformation_matrices[f"A0{self.params.max}"][0, 3] += self.params.Tx
+            self.transformation_matrices[f"A0{self.params.max}"][1, 3] += self.params.Ty
+            self.transformation_matrices[f"A0{self.params.max}"][2, 3] += self.params.Tz
+        subexpressions = dict()
+        if level is Optimization.CSE:
+            subexpressions = {name: eliminate_subexpressions(matrix)
+                              for name, matrix in self.transformation_matrices.items()}
+        elapsed = perf_counter() - start
+        self.report = DerivationReport(
+            level, elapsed, {name: expression_size(matrix, subexpressions.get(name))
+                             for name, matrix in self.transformation_matrices.items()},
+            stats, subexpressions)
+
+    @property
+    def compact_params(self) -> CompactDHTable:
+        """
+        :return: the compact table for the numeric evaluations.
+        :raises ValueError when some value is not a joint variable plus a constant
+        offset, so the table cannot be evaluated numerically.
+        """
+        if self._compact_params is None:
+            self._compact_params = self.params.compact()
+        return self._compact_params
 
     def set_phi(self, expression: Union[Symbol, Number]):
         """
@@ -86,6 +156,7 @@ class ForwardKinematics:
         :param expression: expression - can be a Symbol or a number.
         """
         self.phi_e = expression
+        self._phi_evaluator = None
 
     def point(self,
               subs: Dict[Symbol, Any],
@@ -96,14 +167,60 @@ class ForwardKinematics:
         :param matrix_index: the transformation matrix in which apply the values.
         By default, it is the forward transformation matrix.
         :return: (X, Y, Z, Phi) as a tuple.
+        :raises KeyError, in numeric-only mode, when some joint has no value.
+        :raises ValueError, in numeric-only mode, when the matrix is not a base
+        frame A0i.
         """
         if matrix_index is None:
             matrix_index = f"A0{self.params.max}"
+        if self.numeric_only:
+            # Only the base frames A0i can be evaluated without the matrices
+            frame = matrix_index[2:]
+            if not matrix_index.startswith("A0") or not frame.isdigit() or \
+                    not 1 <= int(frame) <= self.params.max:
+                raise ValueError(f"Only A01 ... A0{self.params.max} can be evaluated "
+                                 f"in numeric-only mode - got '{matrix_index}'")
+            q = [float(subs[symbol]) for symbol in self.compact_params.symbols]
+            position = self.frames(q, positions_only=True)[0, int(frame) - 1]
+            return position[0], position[1], position[2], \
+                self.phi_e.subs(subs) if self.phi_e is not None else None
         return self.transformation_matrices[matrix_index].subs(subs)[0, 3], \
                self.transformation_matrices[matrix_index].subs(subs)[1, 3], \
                self.transformation_matrices[matrix_index].subs(subs)[2, 3], \
                self.phi_e.subs(subs) if self.phi_e is not None else None
 
+    def frames(self, q: np.ndarray, positions_only: bool = False) -> np.ndarray:
+        """
+        Numerically evaluates all the intermediate frames (A01 ... A0n) for a
+        batch of configurations, in a single pass that shares the products of
+        the previous frames.
+        :param q: the joint values, as a (N, dof) array whose columns follow the
+        order of "compact_params.symbols". A single configuration is accepted.
+        :param positions_only: return only the origin of each frame.
+        :return: a (N, n, 4, 4) array or, if "positions_only", a (N, n, 3) array.
+        :raises ValueError when the table cannot be evaluated numerically.
+        """
+        return chain_frames(self.compact_params, q, positions_only)
+
+    def poses(self, q: np.ndarray) -> np.ndarray:
+        """
+        Numerically obtains the (X, Y, Z, Phi) coordinates for a batch of
+        configurations.
+        :param q: the joint values, as a (N, dof) array whose columns follow the
+        order of "compact_params.symbols".
+        :return: a (N, 4) array - Phi is NaN when phi_e has not been set.
+        :raises ValueError when the table cannot be evaluated numerically.
+        """
+        positions = self.frames(q, positions_only=True)[:, -1]
+        if self.phi_e is None:
+            phi = np.full((len(positions), 1), np.nan)
+        else:
+            if self._phi_evaluator is None:
+                self._phi_evaluator = CompiledExpressions(self.compact_params.symbols,
+                                                          [self.phi_e])
+            phi = self._phi_evaluator(q)
+        return np.concatenate([positions, phi], axis=1)
+
     def __getitem__(self, item):
         return self.transformation_matrices.get(item)
 
@@ -148,31 +265,53 @@ class InverseKinematics:
      - m_jacobian: Jacobian matrix.
      - i_jacobian: inverse Jacobian.
      - pinv_jacobian: pseudo-inverse Jacobian.
+     - m_hessian: kinematic Hessian, as the derivative of the Jacobian matrix with
+       respect to each joint (see "hessian").
+     - report: DerivationReport with the derivation time and expressions' sizes.
+     - budget: the ExpressionBudget for the derived expressions, if any.
+     - numeric_only: whether the budget was exceeded (here or in the forward
+       kinematics) and no symbolic Jacobian is available - use the numeric
+       "Manipulator.geometric_jacobian" and "CompiledModel.inverse_jacobian".
 
     For accessing the inverse matrix, it is better to use the "inverse" property,
     as it will return the pseudo-inverse or the inverse, in case the latest one
     does not exists.
     """
 
-    def __init__(self, forward_kinematics: ForwardKinematics, phi_e: dict = None):
+    def __init__(self,
+                 forward_kinematics: ForwardKinematics,
+                 phi_e: dict = None,
+                 budget: ExpressionBudget = None):
         """
         Generates a new instance for the inverse kinematics class.
         :param forward_kinematics: the forward kinematics for the manipulator.
         :param phi_e: the Phi_e dict which relates the 'x', 'y' and 'z' expressions.
+        :param budget: limits for the size of the derived expressions - default: the
+        forward kinematics one.
         """
         self._end_effector_matrix = forward_kinematics[
             f"A0{forward_kinematics.params.max}"]
         self._phi_e = phi_e if phi_e is not None else dict()
         self.params = forward_kinematics.params
-        self.Xe = self._end_effector_matrix[0, 3]
-        self.Ye = self._end_effector_matrix[1, 3]
-        self.Ze = self._end_effector_matrix[2, 3]
+        self.budget = budget if budget is not None else forward_kinematics.budget
+        self.numeric_only = forward_kinematics.numeric_only
+        if self.numeric_only:
+            self.Xe = self.Ye = self.Ze = None
+        else:
+            self.Xe = self._end_effector_matrix[0, 3]
+            self.Ye = self._end_effector_matrix[1, 3]
+            self.Ze = self._end_effector_matrix[2, 3]
         self.det = None
         self.upper_jacobian = None
         self.lower_jacobian = None
         self.m_jacobian = None
         self.i_jacobian = None
         self.pinv_jacobian = None
+        self.m_hessian: List[Matrix] = None
+        self.report: DerivationReport = None
+        self._hessian_subs = None
+        self._derivatives: DerivativeKernel = None
+        self._jacobians: Dict[Tuple[Symbol, ...], Matrix] = dict()
 
     def set_phi(self, xyz: str, expression: Union[Symbol, Number]):
         """
@@ -184,33 +323,157 @@ class InverseKinematics:
         if xyz.lower() not in ['x', 'y', 'z']:
             raise AttributeError("xyz attribute must be ['x', 'y', 'z']")
         self._phi_e[xyz.lower()] = expression
+        # The cached derivatives depend on phi
+        self.m_hessian = None
+        self._derivatives = None
+        self._jacobians.clear()
 
-    def jacobian(self, subs: list = None) -> Matrix:
+    def jacobian(self,
+                 subs: list = None,
+                 optimize: Union[bool, str, Optimization] = True) -> Matrix:
         """
         Calculates the Jacobian matrix. If the determinant is '0', then it
         calculates the pseudo-inverse.
         :param subs: list of symbols that will be used for calculating the
         difference for the Jacobian.
-        :return: the Jacobian matrix.
-        """
-        smatrix = Matrix([self.Xe,
-                          self.Ye,
-                          self.Ze,
-                          self._phi_e['x'],
-                          self._phi_e['y'],
-                          self._phi_e['z']])
+        :param optimize: the optimization level for the determinant and the
+        inverse - default: True ("full").
+        :return: the Jacobian matrix, or None when it exceeded the budget and the
+        model switched to numeric-only mode.
+        :raises ValueError when the model is already numeric-only.
+        """
+        level = Optimization.parse(optimize)
+        start = perf_counter()
+        stats: Dict[str, ExpressionStats] = dict()
+        smatrix = self._smatrix()
         if subs is None:
             subs = self.params.symbols
         self.m_jacobian = smatrix.jacobian(subs)
+        if not self._within_budget(self.m_jacobian, "jacobian", stats):
+            self.numeric_only = True
+            self.m_jacobian = None
+            self.report = DerivationReport(level, perf_counter() - start, dict(), stats)
+            return None
         self.upper_jacobian = self.m_jacobian[:3, :]
         self.lower_jacobian = self.m_jacobian[3:, :]
-        self.det = self.upper_jacobian.det().simplify()
-        if self.det != 0:
-            self.i_jacobian = simplify(self.upper_jacobian ** -1)
-        else:
-            self.pinv_jacobian = self.upper_jacobian.pinv()
+        self.i_jacobian = None
+        self.pinv_jacobian = None
+        # Every expression is measured before it is optimized or inverted; when
+        # one exceeds the budget, the Jacobian is kept and the inverse is left to
+        # the numeric evaluation
+        fallback = "the inverse is left to the numeric evaluation"
+        self.det = self.upper_jacobian.det()
+        if self._within_budget(self.det, "det", stats, fallback):
+            self.det = apply_optimization(self.det, level)
+            if self.det != 0:
+                inverse = self.upper_jacobian ** -1 if level is Optimization.FULL else \
+                    self.upper_jacobian.adjugate() / self.det
+                if self._within_budget(inverse, "inverse", stats, fallback):
+                    self.i_jacobian = apply_optimization(inverse, level)
+            else:
+                inverse = self.upper_jacobian.pinv()
+                if self._within_budget(inverse, "inverse", stats, fallback):
+                    self.pinv_jacobian = inverse
+        derived = {"jacobian": self.m_jacobian, "det": self.det}
+        if self.inverse is not None:
+            derived["inverse"] = self.inverse
+        subexpressions = dict()
+        if level is Optimization.CSE:
+            subexpressions = {name: eliminate_subexpressions(expression)
+                              for name, expression in derived.items()}
+        elapsed = perf_counter() - start
+        sizes = {name: expression_size(expression, subexpressions.get(name))
+                 for name, expression in derived.items()}
+        self.report = DerivationReport(level, elapsed, sizes, stats, subexpressions)
         return self.m_jacobian
 
+    def _within_budget(self,
+                       expression: Matrix,
+                       name: str,
+                       stats: Dict[str, ExpressionStats],
+                       fallback: str = "switching to numeric-only mode") -> bool:
+        # False only when the budget is exceeded and its action is "numeric"
+        if self.budget is None:
+            return True
+        return self.budget.check(expression, name, stats, fallback) or \
+            not self.budget.numeric
+
+    def kernel(self, subs: list = None) -> FusedKernel:
+        """
+        Compiles a fused numeric kernel that evaluates the end-effector pose, the
+        Jacobian matrix and the determinant of its upper part at once, sharing
+        the common subexpressions. It does not depend on "jacobian" being called.
+        :param subs: list of symbols that will be used for calculating the
+        difference for the Jacobian - they are the columns of the kernel input.
+        :return: the compiled kernel.
+        """
+        smatrix = self._smatrix()
+        if subs is None:
+            subs = self.params.symbols
+        jacobian = self._symbolic_jacobian(subs)
+        upper_jacobian = jacobian[:3, :]
+        det = upper_jacobian.det() if upper_jacobian.is_square else None
+        return FusedKernel(subs, smatrix, jacobian, det)
+
+    def hessian(self, subs: list = None) -> List[Matrix]:
+        """
+        Calculates the kinematic Hessian: the derivative of the Jacobian matrix
+        with respect to each joint. As mixed partial derivatives commute, only the
+        upper triangle is differentiated and the rest is mirrored. The result is
+        cached until phi or the symbols change.
+        :param subs: list of symbols that will be used for calculating the
+        difference for the Jacobian.
+        :return: list with the (6, dof) derivative for each symbol.
+        """
+        subs = list(self.params.symbols) if subs is None else list(subs)
+        if self.m_hessian is None or self._hessian_subs != subs:
+            jacobian = self._symbolic_jacobian(subs)
+            hessian = [Matrix.zeros(*jacobian.shape) for _ in subs]
+            for k, symbol in enumerate(subs):
+                for j in range(k, len(subs)):
+                    column = jacobian[:, j].diff(symbol)
+                    hessian[k][:, j] = column
+                    hessian[j][:, k] = column
+            self.m_hessian = hessian
+            self._hessian_subs = subs
+            self._derivatives = None
+        return self.m_hessian
+
+    def derivatives(self, subs: list = None) -> DerivativeKernel:
+        """
+        Compiles a numeric kernel for the Jacobian, its time derivative and the
+        kinematic Hessian. The kernel is cached with the Hessian, so it is only
+        derived and compiled once.
+        :param subs: list of symbols that will be used for calculating the
+        difference for the Jacobian - they are the columns of the kernel input.
+        :return: the compiled kernel.
+        """
+        hessian = self.hessian(subs)
+        if self._derivatives is None:
+            subs = self._hessian_subs
+            self._derivatives = DerivativeKernel(subs, self._symbolic_jacobian(subs),
+                                                 hessian)
+        return self._derivatives
+
+    def _symbolic_jacobian(self, subs: Sequence[Symbol]) -> Matrix:
+        # The kernels and the Hessian share a single derivation for each set of
+        # symbols, until phi changes
+        key = tuple(subs)
+        if key not in self._jacobians:
+            self._jacobians[key] = self._smatrix().jacobian(list(subs))
+        return self._jacobians[key]
+
+    def _smatrix(self) -> Matrix:
+        if self.numeric_only:
+            raise ValueError("The model is numeric-only (its expression budget was "
+                             "exceeded) - use the geometric Jacobian instead")
+        return Matrix([self.Xe,
+                       self.Ye,
+                       self.Ze,
+                       self._phi_e['x'],
+                       self._phi_e['y'],
+                       self._phi_e['z']])
+
     @property
     def inverse(self):
         """
@@ -218,15 +481,33 @@ class InverseKinematics:
         """
         return self.pinv_jacobian if self.i_jacobian is None else self.i_jacobian
 
+    @property
+    def phi_set(self) -> bool:
+        """
+        :return: whether phi has been set for the 'x', 'y' and 'z' axes, as the
+        Jacobian needs.
+        """
+        return all(axis in self._phi_e for axis in "xyz")
+
+
+def _deprecated_phi():
+    warnings.warn("The 'phi' argument of 'eval' is deprecated and ignored: the "
+                  "position implies phi_e = theta_2 - theta_3", DeprecationWarning,
+                  stacklevel=3)
+
 
 class UArmInverseKinematics:
     """
-    uArm Inverse Kinematics class wrapper for the uArm robotic arm.
+    uArm Inverse Kinematics class wrapper for the uArm robotic arm. It gives the
+    solution with the arm in front of the base and theta_3 in [0, pi], which is
+    the one the uArm works with.
     Accessible values are:
      - X_e: X value.
      - Y_e: Y value.
      - Z_e: Z value.
-     - phi: phi value.
+     - phi: phi value - kept as an input of the compiled evaluator, but the
+       solution does not need it, as phi_e = theta_2 - theta_3 is implied by the
+       position.
      - theta_1: expression for theta_1.
      - theta_2: expression for theta_2.
      - theta_3: expression for theta_3.
@@ -238,36 +519,70 @@ class UArmInverseKinematics:
         :param params: the Denavit-Hartenberg params.
         """
         self.X_e, self.Y_e, self.Z_e, self.phi = symbols("X_e Y_e Z_e phi_e")
+        # The arm moves in the vertical plane at theta_1: "reach" is the distance
+        # from the shoulder along that plane and "height" the one above it
+        reach = sqrt(((self.X_e - params.Tx) ** 2) + (self.Y_e ** 2)) - params[0]['a']
+        height = self.Z_e - params[0]['d'] - params.Tz
         cos_t3 = (
-                (self.X_e ** 2) + (self.Z_e ** 2) -
-                (params[1]['a'] ** 2) - (params[2]['a'] ** 2)
+                ((reach ** 2) + (height ** 2) -
+                 (params[1]['a'] ** 2) - (params[2]['a'] ** 2))
                 /
-                2 * params[1]['a'] * params[2]['a']
+                (2 * params[1]['a'] * params[2]['a'])
         )
         sin_t3 = (
             sqrt(1 - (cos_t3 ** 2))
         )
-        self.theta_1 = atan2(self.Y_e, self.X_e + params.Tx + params[0]['d'])
+        self.theta_1 = atan2(self.Y_e, self.X_e - params.Tx)
         self.theta_3 = atan2(sin_t3, cos_t3)
-        self.theta_2 = self.phi + self.theta_3
+        # phi_e = theta_2 - theta_3 is implied by the position, so theta_2 is
+        # obtained from the geometry, which keeps the solution consistent with it
+        self.theta_2 = atan2(height, reach) + \
+            atan2(params[2]['a'] * sin_t3, params[1]['a'] + params[2]['a'] * cos_t3)
+        self._evaluator: CompiledExpressions = None
+
+    def compile(self) -> CompiledExpressions:
+        """
+        Compiles the (theta_1, theta_2, theta_3) expressions into a batched numeric
+        evaluator whose inputs are (X_e, Y_e, Z_e, phi). Unreachable points
+        evaluate to NaN.
+        :return: the compiled expressions.
+        """
+        if self._evaluator is None:
+            self._evaluator = CompiledExpressions(
+                (self.X_e, self.Y_e, self.Z_e, self.phi),
+                [self.theta_1, self.theta_2, self.theta_3])
+        return self._evaluator
+
+    def eval_batch(self, points: np.ndarray) -> np.ndarray:
+        """
+        With a batch of points, numerically returns the joints at which the robotic
+        arm achieves each of them.
+        :param points: the (X, Y, Z, phi) values, as a (N, 4) array.
+        :return: a (N, 3) array with (theta_1, theta_2, theta_3) - NaN for the
+        points the robot cannot reach.
+        """
+        return self.compile()(points)
 
     def eval(self,
              Xe: Union[Symbol, Number],
              Ye: Union[Symbol, Number],
              Ze: Union[Symbol, Number],
-             phi: Union[Symbol, Number]) -> Tuple[Union[Symbol, Number],
-                                                  Union[Symbol, Number],
-                                                  Union[Symbol, Number]]:
+             phi: Union[Symbol, Number] = None) -> Tuple[Union[Symbol, Number],
+                                                         Union[Symbol, Number],
+                                                         Union[Symbol, Number]]:
         """
         With a given point, returns the joints at which the robotic arm achieves
         that position.
         :param Xe: X position.
         :param Ye: Y position.
         :param Ze: Z position.
-        :param phi: phi value.
+        :param phi: deprecated and ignored, as phi_e = theta_2 - theta_3 is implied
+        by the position - passing it issues a DeprecationWarning.
         :return: (theta_1, theta_2, theta_3) as a tuple.
         """
-        subs = {self.X_e: Xe, self.Y_e: Ye, self.Z_e: Ze, self.phi: phi}
+        if phi is not None:
+            _deprecated_phi()
+        subs = {self.X_e: Xe, self.Y_e: Ye, self.Z_e: Ze}
         theta_1 = self.theta_1.subs(subs).evalf(chop=True)
         theta_3 = self.theta_3.subs(subs).evalf(chop=True)
         theta_2 = self.theta_2.subs(subs).evalf(chop=True)
@@ -283,9 +598,12 @@ class Manipulator:
      - uarm_ik: the uArm inverse kinematics.
     """
 
-    def __init__(self, params: DHTable, optimize: bool = True):
+    def __init__(self,
+                 params: DHTable,
+                 optimize: Union[bool, str, Optimization] = True,
+                 budget: ExpressionBudget = None):
         self.params = params
-        self.direct_kinematics = ForwardKinematics(params, optimize)
+        self.direct_kinematics = ForwardKinematics(params, optimize, budget)
         self.inverse_kinematics = InverseKinematics(self.direct_kinematics)
         self.uarm_ik = UArmInverseKinematics(params)
 
@@ -297,9 +615,31 @@ class Manipulator:
         :param matrix_index: the transformation matrix in which apply the values.
         By default, it is the forward transformation matrix.
         :return: (X, Y, Z, Phi) as a tuple.
+        :raises ValueError, in numeric-only mode, when the matrix is not a base
+        frame A0i.
         """
         return self.direct_kinematics.point(subs, matrix_index)
 
+    def frames(self, q: np.ndarray, positions_only: bool = False) -> np.ndarray:
+        """
+        Numerically evaluates all the intermediate frames (A01 ... A0n) for a
+        batch of configurations.
+        :param q: the joint values, as a (N, dof) array.
+        :param positions_only: return only the origin of each frame.
+        :return: a (N, n, 4, 4) array or, if "positions_only", a (N, n, 3) array.
+        """
+        return self.direct_kinematics.frames(q, positions_only)
+
+    def geometric_jacobian(self, q: np.ndarray) -> np.ndarray:
+        """
+        Numerically evaluates the geometric Jacobian from the frames, for a batch
+        of configurations. It needs neither phi nor any symbolic derivation, so it
+        is the one to use for long chains - its lower rows are the angular velocity.
+        :param q: the joint values, as a (N, dof) array.
+        :return: a (N, 6, dof) array.
+        """
+        return geometric_jacobian(self.direct_kinematics.compact_params, q)
+
     def set_phi(self, xyz: str, expression: Union[Symbol, Number]):
         """
         Sets the Phi_e expression, which relates the angle to an axis.
@@ -309,15 +649,61 @@ class Manipulator:
         """
         self.inverse_kinematics.set_phi(xyz, expression)
 
-    def jacobian(self, subs: list = None) -> Matrix:
+    def jacobian(self,
+                 subs: list = None,
+                 optimize: Union[bool, str, Optimization] = True) -> Matrix:
         """
         Calculates the Jacobian matrix. If the determinant is '0', then it
         calculates the pseudo-inverse.
         :param subs: list of symbols that will be used for calculating the
         difference for the Jacobian.
+        :param optimize: the optimization level for the determinant and the
+        inverse - default: True ("full").
         :return: the Jacobian matrix.
         """
-        return self.inverse_kinematics.jacobian(subs)
+        return self.inverse_kinematics.jacobian(subs, optimize)
+
+    def kernel(self, subs: list = None) -> FusedKernel:
+        """
+        Compiles a fused numeric kernel for the end-effector pose, the Jacobian
+        matrix and its determinant.
+        :param subs: list of symbols that will be used for calculating the
+        difference for the Jacobian.
+        :return: the compiled kernel.
+        """
+        return self.inverse_kinematics.kernel(subs)
+
+    def hessian(self, subs: list = None) -> List[Matrix]:
+        """
+        Calculates the kinematic Hessian (derivative of the Jacobian matrix with
+        respect to each joint).
+        :param subs: list of symbols that will be used for calculating the
+        difference for the Jacobian.
+        :return: list with the (6, dof) derivative for each symbol.
+        """
+        return self.inverse_kinematics.hessian(subs)
+
+    def derivatives(self, subs: list = None) -> DerivativeKernel:
+        """
+        Compiles (once) a numeric kernel for the Jacobian, its time derivative and
+        the kinematic Hessian.
+        :param subs: list of symbols that will be used for calculating the
+        difference for the Jacobian.
+        :return: the compiled kernel.
+        """
+        return self.inverse_kinematics.derivatives(subs)
+
+    def compile(self, subs: list = None, derivatives: bool = False) -> CompiledModel:
+        """
+        Compiles a frozen snapshot of the manipulator (FK, Jacobian and uArm IK)
+        that can be shared between threads. Phi must be set before compiling.
+        :param subs: list of symbols that will be used for calculating the
+        difference for the Jacobian.
+        :param derivatives: include the Hessian and Jacobian derivative kernel -
+        default: False.
+        :return: the compiled model.
+        """
+        return CompiledModel.from_manipulator(self, subs, derivatives)
 
     @property
     def inverse(self):
@@ -326,23 +712,53 @@ class Manipulator:
         """
         return self.inverse_kinematics.inverse
 
+    @property
+    def numeric_only(self) -> bool:
+        """
+        :return: whether an expression budget was exceeded and only the numeric
+        evaluations (frames, poses, geometric Jacobian) are available.
+        """
+        return self.inverse_kinematics.numeric_only
+
+    def expression_stats(self) -> Dict[str, ExpressionStats]:
+        """
+        Measures every symbolic matrix derived so far: the transformation
+        matrices, phi_e and, when derived, the Jacobian, its determinant and
+        inverse and the Hessian.
+        :return: dict with the ExpressionStats of each matrix, by name.
+        """
+        inverse_kinematics = self.inverse_kinematics
+        expressions = dict(self.direct_kinematics.transformation_matrices)
+        expressions["phi_e"] = self.direct_kinematics.phi_e
+        expressions["jacobian"] = inverse_kinematics.m_jacobian
+        expressions["det"] = inverse_kinematics.det
+        expressions["inverse"] = inverse_kinematics.inverse
+        for symbol, matrix in zip(inverse_kinematics._hessian_subs or (),
+                                  inverse_kinematics.m_hessian or ()):
+            expressions[f"hessian_{symbol}"] = matrix
+        return {name: expression_stats(expression, name)
+                for name, expression in expressions.items() if expression is not None}
+
     def eval(self,
              Xe: Union[Symbol, Number],
              Ye: Union[Symbol, Number],
              Ze: Union[Symbol, Number],
-             phi: Union[Symbol, Number]) -> Tuple[Union[Symbol, Number],
-                                                  Union[Symbol, Number],
-                                                  Union[Symbol, Number]]:
+             phi: Union[Symbol, Number] = None) -> Tuple[Union[Symbol, Number],
+                                                         Union[Symbol, Number],
+                                                         Union[Symbol, Number]]:
         """
         With a given point, returns the joints at which the robotic arm achieves
         that position.
         :param Xe: X position.
         :param Ye: Y position.
         :param Ze: Z position.
-        :param phi: phi value.
+        :param phi: deprecated and ignored, as phi_e = theta_2 - theta_3 is implied
+        by the position - passing it issues a DeprecationWarning.
         :return: (theta_1, theta_2, theta_3) as a tuple.
         """
-        return self.uarm_ik.eval(Xe, Ye, Ze, phi)
+        if phi is not None:
+            _deprecated_phi()
+        return self.uarm_ik.eval(Xe, Ye, Ze)
 
     def to_latrix(self, matrix_type: str, matrix_index: str) -> str:
         """
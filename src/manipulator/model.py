@@ -0,0 +1,219 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from typing import Tuple
+
+import numpy as np
+
+from .dh_table import CompactDHTable
+from .kernels import CompiledExpressions
+from .kernels import DerivativeKernel
+from .kernels import FusedKernel
+from .numeric import as_batch
+from .numeric import chain_frames
+from .numeric import geometric_jacobian
+
+
+class CompiledModel:
+    """
+    Frozen, compiled snapshot of a Manipulator. It holds no mutable state: every
+    evaluation only reads the compact table and the compiled expressions and
+    works with NumPy arrays, so a single instance can be shared by many threads.
+    The accessible params are:
+     - params: the compact Denavit-Hartenberg table.
+     - symbols: the joint symbols, in the order of the columns of the inputs.
+     - fingerprint: the fingerprint of the table.
+     - numeric_only: whether the manipulator exceeded its expression budget, so
+       there is no Jacobian (the geometric one is always available).
+    Use "Manipulator.compile" for obtaining it.
+    """
+
+    __slots__ = ("params", "symbols", "fingerprint", "numeric_only", "_phi", "_kernel",
+                 "_inverse", "_derivatives")
+
+    def __init__(self,
+                 params: CompactDHTable,
+                 phi: CompiledExpressions = None,
+                 kernel: FusedKernel = None,
+                 inverse: CompiledExpressions = None,
+                 derivatives: DerivativeKernel = None,
+                 numeric_only: bool = False):
+        """
+        Creates the snapshot from already compiled parts.
+        :param params: the compact Denavit-Hartenberg table.
+        :param phi: the compiled phi_e expression, if any.
+        :param kernel: the fused pose, Jacobian and determinant kernel, if any.
+        :param inverse: the compiled uArm inverse kinematics, if any.
+        :param derivatives: the Hessian and Jacobian derivative kernel, if any.
+        :param numeric_only: whether the manipulator exceeded its expression budget
+        - default: False.
+        """
+        object.__setattr__(self, "params", params)
+        object.__setattr__(self, "symbols", params.symbols)
+        object.__setattr__(self, "fingerprint", params.fingerprint())
+        object.__setattr__(self, "numeric_only", numeric_only)
+        object.__setattr__(self, "_phi", phi)
+        object.__setattr__(self, "_kernel", kernel)
+        object.__setattr__(self, "_inverse", inverse)
+        object.__setattr__(self, "_derivatives", derivatives)
+
+    @classmethod
+    def from_manipulator(cls,
+                         manipulator,
+                         subs: list = None,
+                         derivatives: bool = False) -> 'CompiledModel':
+        """
+        Compiles the current state of a manipulator. Later changes to the
+        manipulator (for example, "set_phi") do not affect the snapshot.
+        :param manipulator: the Manipulator.
+        :param subs: the joint symbols for the Jacobian - default: the table ones.
+        :param derivatives: include the Hessian and Jacobian derivative kernel -
+        default: False.
+        :return: the compiled model.
+        """
+        direct_kinematics = manipulator.direct_kinematics
+        params = direct_kinematics.compact_params
+        phi = None
+        derivative_kernel = None
+        if direct_kinematics.phi_e is not None:
+            phi = CompiledExpressions(params.symbols, [direct_kinematics.phi_e])
+        subs = subs if subs is not None else list(params.symbols)
+        inverse_kinematics = manipulator.inverse_kinematics
+        kernel = None
+        # Without phi for every axis or in numeric-only mode there is no Jacobian;
+        # any other failure is raised
+        if inverse_kinematics.phi_set and not inverse_kinematics.numeric_only:
+            kernel = inverse_kinematics.kernel(subs)
+            if derivatives:
+                derivative_kernel = inverse_kinematics.derivatives(subs)
+        return cls(params, phi, kernel, manipulator.uarm_ik.compile(), derivative_kernel,
+                   inverse_kinematics.numeric_only)
+
+    def frames(self, q: np.ndarray, positions_only: bool = False) -> np.ndarray:
+        """
+        Evaluates all the intermediate frames (A01 ... A0n).
+        :param q: the joint values, as a (N, dof) array.
+        :param positions_only: return only the origin of each frame.
+        :return: a (N, n, 4, 4) array or, if "positions_only", a (N, n, 3) array.
+        """
+        return chain_frames(self.params, q, positions_only)
+
+    def poses(self, q: np.ndarray) -> np.ndarray:
+        """
+        Obtains the (X, Y, Z, Phi) coordinates.
+        :param q: the joint values, as a (N, dof) array.
+        :return: a (N, 4) array - Phi is NaN when phi_e was not set.
+        """
+        q = as_batch(q, len(self.symbols))
+        positions = chain_frames(self.params, q, positions_only=True)[:, -1]
+        phi = self._phi(q) if self._phi is not None else np.full((len(q), 1), np.nan)
+        return np.concatenate([positions, phi], axis=1)
+
+    def evaluate(self, q: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Evaluates the fused kernel.
+        :param q: the joint values, as a (N, dof) array.
+        :return: (pose, jacobian, det) as (N, 6), (N, 6, dof) and (N,) arrays.
+        :raises ValueError when the model has no Jacobian.
+        """
+        self.check_jacobian()
+        return self._kernel(q)
+
+    def check_jacobian(self):
+        """
+        Checks that the model has a Jacobian, before running a long batch.
+        :raises ValueError when the model has no Jacobian, telling why.
+        """
+        if self._kernel is not None:
+            return
+        if self.numeric_only:
+            raise ValueError("The model is numeric-only (its expression budget was "
+                             "exceeded), so it has no Jacobian - use the geometric "
+                             "Jacobian or a larger budget")
+        raise ValueError("The model has no Jacobian - set phi for 'x', 'y' and "
+                         "'z' before compiling it")
+
+    def jacobian(self, q: np.ndarray) -> np.ndarray:
+        """
+        Evaluates the Jacobian matrix.
+        :param q: the joint values, as a (N, dof) array.
+        :return: a (N, 6, dof) array.
+        :raises ValueError when the model has no Jacobian.
+        """
+        return self.evaluate(q)[1]
+
+    def geometric_jacobian(self, q: np.ndarray) -> np.ndarray:
+        """
+        Evaluates the geometric Jacobian from the frames - it does not need phi
+        and its lower rows are the angular velocity. See
+        "numeric.geometric_jacobian".
+        :param q: the joint values, as a (N, dof) array.
+        :return: a (N, 6, dof) array.
+        """
+        return geometric_jacobian(self.params, q)
+
+    def inverse_jacobian(self, q: np.ndarray) -> np.ndarray:
+        """
+        Evaluates the inverse of the upper (linear velocity) Jacobian or, where it
+        is singular or not square, its pseudo-inverse.
+        :param q: the joint values, as a (N, dof) array.
+        :return: a (N, dof, 3) array.
+        :raises ValueError when the model has no Jacobian.
+        """
+        return np.linalg.pinv(self.jacobian(q)[:, :3, :])
+
+    def hessian(self, q: np.ndarray) -> np.ndarray:
+        """
+        Evaluates the kinematic Hessian.
+        :param q: the joint values, as a (N, dof) array.
+        :return: a (N, 6, dof, dof) array - [n, i, j, k] is the derivative of the
+        Jacobian element (i, j) with respect to the k-th joint.
+        :raises ValueError when the model was compiled without derivatives.
+        """
+        return self._derivative_kernel()(q)[1]
+
+    def jacobian_derivative(self, q: np.ndarray, qd: np.ndarray) -> np.ndarray:
+        """
+        Evaluates the time derivative of the Jacobian matrix.
+        :param q: the joint values, as a (N, dof) array.
+        :param qd: the joint velocities, as a (N, dof) array.
+        :return: a (N, 6, dof) array.
+        :raises ValueError when the model was compiled without derivatives.
+        """
+        return self._derivative_kernel().jacobian_derivative(q, qd)[1]
+
+    def _derivative_kernel(self) -> DerivativeKernel:
+        if self._derivatives is None:
+            raise ValueError("The model has no derivatives - compile it with "
+                             "'derivatives=True' after setting phi")
+        return self._derivatives
+
+    def inverse(self, points: np.ndarray) -> np.ndarray:
+        """
+        Solves the uArm inverse kinematics.
+        :param points: the (X, Y, Z, phi) values, as a (N, 4) array.
+        :return: a (N, 3) array with the joints - NaN for unreachable points.
+        """
+        return self._inverse(points)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("CompiledModel is immutable")
+
+    def __delattr__(self, item):
+        raise AttributeError("CompiledModel is immutable")
+
+    def __reduce__(self):
+        return CompiledModel, (self.params, self._phi, self._kernel, self._inverse,
+                               self._derivatives, self.numeric_only)
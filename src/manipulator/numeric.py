@@ -0,0 +1,183 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from typing import Tuple
+
+import numpy as np
+
+from .dh_table import PARAMS
+from .dh_table import CompactDHTable
+
+
+def as_batch(q: np.ndarray, dof: int) -> np.ndarray:
+    """
+    Converts joint values into a (N, dof) float array.
+    :param q: a single configuration (dof,) or a batch of them (N, dof).
+    :param dof: the number of joints.
+    :return: the (N, dof) array.
+    :raises ValueError when the values do not have "dof" columns.
+    """
+    q = np.asarray(q, dtype=np.float64)
+    if q.ndim == 1:
+        q = q[np.newaxis, :]
+    if q.ndim != 2 or q.shape[1] != dof:
+        raise ValueError(f"Joint values must have shape (N, {dof}) - got {q.shape}")
+    return q
+
+
+def dh_params(table: CompactDHTable,
+              q: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Obtains the Denavit-Hartenberg parameters of every link for a batch of
+    configurations.
+    :param table: the compact Denavit-Hartenberg table.
+    :param q: the joint values, as a (N, dof) array.
+    :return: (theta, d, a, alpha), each of them a (N, n) array.
+    """
+    q = as_batch(q, len(table.symbols))
+    values = [np.repeat(table.rows[param][np.newaxis, :], len(q), axis=0)
+              for param in PARAMS]
+    for i, (joint, column) in enumerate(zip(table.rows["joint"], table.joints)):
+        if joint >= 0:
+            values[joint][:, i] += q[:, column]
+    return values[0], values[1], values[2], values[3]
+
+
+def link_transforms(table: CompactDHTable, q: np.ndarray) -> np.ndarray:
+    """
+    Evaluates the transformation matrix of every link, A(i-1)(i), for a batch of
+    configurations.
+    :param table: the compact Denavit-Hartenberg table.
+    :param q: the joint values, as a (N, dof) array.
+    :return: a (N, n, 4, 4) array.
+    """
+    return dh_transforms(*dh_params(table, q))
+
+
+def dh_transforms(theta: np.ndarray,
+                  d: np.ndarray,
+                  a: np.ndarray,
+                  alpha: np.ndarray) -> np.ndarray:
+    """
+    Evaluates the Denavit-Hartenberg transformation matrices for arrays of
+    parameters, so every sample can use its own table.
+    :param theta: "theta" values, as a (N, n) array.
+    :param d: 'd' values, as a (N, n) array.
+    :param a: 'a' values, as a (N, n) array.
+    :param alpha: "alpha" values, as a (N, n) array.
+    :return: a (N, n, 4, 4) array.
+    """
+    ct, st = np.cos(theta), np.sin(theta)
+    ca, sa = np.cos(alpha), np.sin(alpha)
+    matrices = np.zeros(theta.shape + (4, 4))
+    matrices[..., 0, 0] = ct
+    matrices[..., 0, 1] = -ca * st
+    matrices[..., 0, 2] = sa * st
+    matrices[..., 0, 3] = a * ct
+    matrices[..., 1, 0] = st
+    matrices[..., 1, 1] = ca * ct
+    matrices[..., 1, 2] = -sa * ct
+    matrices[..., 1, 3] = a * st
+    matrices[..., 2, 1] = sa
+    matrices[..., 2, 2] = ca
+    matrices[..., 2, 3] = d
+    matrices[..., 3, 3] = 1.
+    return matrices
+
+
+def chain_frames(table: CompactDHTable,
+                 q: np.ndarray,
+                 positions_only: bool = False) -> np.ndarray:
+    """
+    Evaluates every intermediate frame, A01 ... A0n, for a batch of
+    configurations in a single pass: each frame reuses the product of the
+    previous ones. The end-effector translations (Tx, Ty, Tz) are applied to the
+    last frame, as ForwardKinematics does.
+    :param table: the compact Denavit-Hartenberg table.
+    :param q: the joint values, as a (N, dof) array.
+    :param positions_only: return only the origin of each frame.
+    :return: a (N, n, 4, 4) array or, if "positions_only", a (N, n, 3) array.
+    """
+    frames = multiply_chain(link_transforms(table, q))
+    if frames.shape[1] > 0:
+        frames[:, -1, :3, 3] += (table.Tx, table.Ty, table.Tz)
+    if positions_only:
+        return np.ascontiguousarray(frames[..., :3, 3])
+    return frames
+
+
+def multiply_chain(transforms: np.ndarray) -> np.ndarray:
+    """
+    Accumulates the link transformation matrices into the frames A01 ... A0n, in
+    place, reusing each product for the next frame.
+    :param transforms: the link transformation matrices, as a (N, n, 4, 4) array.
+    :return: the same array, containing the frames.
+    """
+    for i in range(1, transforms.shape[1]):
+        transforms[:, i] = transforms[:, i - 1] @ transforms[:, i]
+    return transforms
+
+
+def geometric_jacobian(table: CompactDHTable, q: np.ndarray) -> np.ndarray:
+    """
+    Evaluates the geometric Jacobian for a batch of configurations, directly from
+    the frames and with no symbolic differentiation, so it works for chains of any
+    length at O(n) per sample. The column of a revolute joint is z x (pe - o)
+    (linear) and z (angular), where z and o are the axis and origin of the frame
+    before the joint; for a prismatic joint, it is z and zero. Variable 'a' and
+    "alpha" act along and about the X axis of the link frame.
+    Unlike the Jacobian of InverseKinematics, whose lower rows differentiate the
+    phi_e expressions, the lower rows here are the angular velocity.
+    :param table: the compact Denavit-Hartenberg table.
+    :param q: the joint values, as a (N, dof) array.
+    :return: a (N, 6, dof) array.
+    """
+    q = as_batch(q, len(table.symbols))
+    frames = multiply_chain(link_transforms(table, q))
+    rows = np.flatnonzero(table.joints >= 0)
+    if len(rows) == 0:
+        return np.zeros((len(q), 6, 0))
+    # (Tx, Ty, Tz) are a constant offset in the base frame, so they do not move
+    # with the joints and are left out of the lever arms
+    end_effector = frames[:, -1:, :3, 3]
+    kind = table.rows["joint"][rows]
+    # theta and d act along the Z axis of the previous frame (the base one for the
+    # first link); a and alpha along the X axis of the link frame
+    on_z = kind <= 1
+    rotational = (kind == 0) | (kind == 3)
+    x, z, o = frames[..., :3, 0], frames[..., :3, 2], frames[..., :3, 3]
+    axes = np.empty((len(q), len(rows), 3))
+    origins = np.empty((len(q), len(rows), 3))
+    previous = rows[on_z] - 1
+    first = previous < 0
+    axes[:, on_z] = z[:, previous]
+    origins[:, on_z] = o[:, previous]
+    axes[:, np.flatnonzero(on_z)[first]] = (0., 0., 1.)
+    origins[:, np.flatnonzero(on_z)[first]] = 0.
+    axes[:, ~on_z] = x[:, rows[~on_z]]
+    origins[:, ~on_z] = o[:, rows[~on_z]]
+    # The columns are filled as rows of a (N, dof, 6) array, which is faster
+    columns = table.joints[rows]
+    jacobian = np.zeros((len(q), len(table.symbols), 6))
+    jacobian[:, columns[~rotational], :3] = axes[:, ~rotational]
+    axes = axes[:, rotational]
+    levers = end_effector - origins[:, rotational]
+    linear = np.empty_like(axes)
+    linear[..., 0] = axes[..., 1] * levers[..., 2] - axes[..., 2] * levers[..., 1]
+    linear[..., 1] = axes[..., 2] * levers[..., 0] - axes[..., 0] * levers[..., 2]
+    linear[..., 2] = axes[..., 0] * levers[..., 1] - axes[..., 1] * levers[..., 0]
+    jacobian[:, columns[rotational], :3] = linear
+    jacobian[:, columns[rotational], 3:] = axes
+    return np.ascontiguousarray(jacobian.transpose(0, 2, 1))
@@ -0,0 +1,351 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import sys
+import warnings
+
+from enum import Enum
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+from sympy import Basic
+from sympy import Expr
+from sympy import Matrix
+from sympy import Symbol
+from sympy import count_ops
+from sympy import cse
+from sympy import simplify
+from sympy import sympify
+from sympy import trigsimp
+
+
+class Optimization(Enum):
+    """
+    Optimization levels for the symbolic derivations:
+     - NONE: expressions are kept as they are derived - fastest derivation.
+     - TRIG: only trigonometric simplifications (trigsimp) are applied.
+     - CSE: common subexpressions are eliminated (sympy "cse") as part of the
+       derivation. The expressions keep their form; the reduced form is kept in
+       the DerivationReport, whose sizes count its operations.
+     - FULL: full "simplify" - slowest derivation, smallest expressions.
+    """
+    NONE = "none"
+    TRIG = "trig"
+    CSE = "cse"
+    FULL = "full"
+
+    @classmethod
+    def parse(cls, value: Union[bool, str, 'Optimization']) -> 'Optimization':
+        """
+        Obtains the optimization level for the given value. Booleans are kept
+        for backwards compatibility: True is FULL and False is NONE.
+        :param value: the optimization level, its name or a boolean.
+        :return: the optimization level.
+        :raises ValueError when the value is not a valid level.
+        """
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, bool):
+            return cls.FULL if value else cls.NONE
+        try:
+            return cls(str(value).lower())
+        except ValueError:
+            raise ValueError(f"optimize must be a boolean or one of: "
+                             f"{[level.value for level in cls]}") from None
+
+
+def apply_optimization(expression: Union[Expr, Matrix],
+                       level: Optimization) -> Union[Expr, Matrix]:
+    """
+    Applies the optimization level to an expression or a matrix. The CSE level
+    does not change them: see "eliminate_subexpressions".
+    :param expression: the expression or matrix to optimize.
+    :param level: the optimization level.
+    :return: the optimized expression - a new object if it changed.
+    """
+    if level is Optimization.TRIG:
+        if isinstance(expression, Matrix):
+            return expression.applyfunc(trigsimp)
+        return trigsimp(expression)
+    if level is Optimization.FULL:
+        if isinstance(expression, Matrix):
+            # "simplify" would return an immutable matrix; keep it mutable
+            result = expression.copy()
+            result.simplify()
+            return result
+        return simplify(expression)
+    return expression
+
+
+Subexpressions = Tuple[List[Tuple[Symbol, Expr]], List[Expr]]
+"""
+Result of a common subexpression elimination: (replacements, reduced entries).
+"""
+
+
+def eliminate_subexpressions(expression: Union[Expr, Matrix]) -> Subexpressions:
+    """
+    Eliminates the common subexpressions of an expression or of all the entries
+    of a matrix.
+    :param expression: the expression or matrix.
+    :return: (replacements, reduced entries) - the entries in row order.
+    """
+    expressions = list(expression) if isinstance(expression, Matrix) else [expression]
+    return cse(expressions)
+
+
+def expression_size(expression: Union[Expr, Matrix],
+                    subexpressions: Subexpressions = None) -> int:
+    """
+    Counts the operations required for evaluating an expression or a matrix.
+    :param expression: the expression or matrix.
+    :param subexpressions: its reduced form, if any - then its operations, the
+    ones of the replacements included, are counted instead.
+    :return: the number of operations.
+    """
+    if subexpressions is not None:
+        replacements, expressions = subexpressions
+        return sum(count_ops(value) for _, value in replacements) + \
+            sum(count_ops(value) for value in expressions)
+    expressions = list(expression) if isinstance(expression, Matrix) else [expression]
+    return sum(count_ops(value) for value in expressions)
+
+
+class DerivationReport:
+    """
+    Summary of a symbolic derivation. The accessible params are:
+     - level: the optimization level used.
+     - time: derivation time, in seconds.
+     - sizes: dict with the number of operations of each derived expression.
+     - stats: dict with the ExpressionStats of each derived expression, filled
+       when the derivation has an ExpressionBudget.
+     - subexpressions: dict with the reduced form of each derived expression,
+       filled at the CSE level.
+    """
+
+    def __init__(self,
+                 level: Optimization,
+                 time: float,
+                 sizes: Dict[str, int],
+                 stats: Dict[str, 'ExpressionStats'] = None,
+                 subexpressions: Dict[str, Subexpressions] = None):
+        self.level = level
+        self.time = time
+        self.sizes = sizes
+        self.stats = stats if stats is not None else dict()
+        self.subexpressions = subexpressions if subexpressions is not None else dict()
+
+    @property
+    def total_size(self) -> int:
+        """
+        :return: the number of operations of all the derived expressions.
+        """
+        return sum(self.sizes.values())
+
+    def __str__(self):
+        result = f"Optimization: {self.level.value} - {self.time:.3f}s - " \
+                 f"{self.total_size} operations\n"
+        for name, size in self.sizes.items():
+            result += "{:>8}{:>10}\n".format(name, size)
+        for stats in self.stats.values():
+            result += f"{stats}\n"
+        return result
+
+
+class ExpressionStats:
+    """
+    Size of an expression or a matrix of expressions. The accessible params are:
+     - name: the name of the expression.
+     - shape: the shape of the matrix - (1, 1) for a single expression.
+     - operations: the number of operations of each entry, as an array with the
+       matrix shape.
+     - depth: the depth of the tree of each entry, as an array with the matrix
+       shape.
+     - nodes: how many different nodes the trees have - shared subtrees are only
+       counted once, as SymPy only stores them once.
+     - memory: the approximate footprint of those nodes, in bytes.
+    """
+
+    def __init__(self,
+                 name: str,
+                 operations: np.ndarray,
+                 depth: np.ndarray,
+                 nodes: int,
+                 memory: int):
+        self.name = name
+        self.shape = operations.shape
+        self.operations = operations
+        self.depth = depth
+        self.nodes = nodes
+        self.memory = memory
+
+    @property
+    def total_operations(self) -> int:
+        """
+        :return: the number of operations of all the entries.
+        """
+        return int(self.operations.sum())
+
+    @property
+    def max_depth(self) -> int:
+        """
+        :return: the depth of the deepest entry.
+        """
+        return int(self.depth.max(initial=0))
+
+    def __str__(self):
+        return "{:>8}: {}x{} - {} operations (max. {} per entry) - depth {} - " \
+               "{} nodes - {:.1f} KiB".format(self.name, *self.shape,
+                                              self.total_operations,
+                                              int(self.operations.max(initial=0)),
+                                              self.max_depth, self.nodes,
+                                              self.memory / 1024)
+
+
+def _trees(expressions: List[Basic]) -> Tuple[List[int], int, int]:
+    """
+    Walks the expression trees once, iteratively, sharing the work of repeated
+    subtrees.
+    :return: (depth of each expression, unique nodes, their size in bytes).
+    """
+    depths: Dict[int, int] = dict()
+    memory = 0
+    for root in expressions:
+        pending = [(root, False)]
+        while pending:
+            node, expanded = pending.pop()
+            if id(node) in depths:
+                continue
+            if expanded:
+                depths[id(node)] = 1 + max((depths[id(arg)] for arg in node.args), default=0)
+                memory += sys.getsizeof(node) + sys.getsizeof(node.args)
+                continue
+            pending.append((node, True))
+            pending.extend((arg, False) for arg in node.args if id(arg) not in depths)
+    return [depths[id(root)] for root in expressions], len(depths), memory
+
+
+def expression_stats(expression: Union[Expr, Matrix], name: str = "") -> ExpressionStats:
+    """
+    Measures an expression or a matrix: operations and tree depth of each entry,
+    plus the unique nodes and their approximate memory footprint.
+    :param expression: the expression or matrix.
+    :param name: the name for the report.
+    :return: the ExpressionStats.
+    """
+    if hasattr(expression, "shape"):
+        shape = expression.shape
+        entries = [sympify(entry) for entry in expression]
+    else:
+        shape = (1, 1)
+        entries = [sympify(expression)]
+    depth, nodes, memory = _trees(entries)
+    operations = np.array([count_ops(entry) for entry in entries], dtype=np.int64)
+    return ExpressionStats(name, operations.reshape(shape),
+                           np.array(depth, dtype=np.int64).reshape(shape), nodes, memory)
+
+
+class ExpressionBudgetWarning(UserWarning):
+    """
+    Warning issued when a derived expression exceeds its ExpressionBudget.
+    """
+
+
+class ExpressionBudget:
+    """
+    Limits for the size of each derived matrix. When a derivation exceeds them,
+    an ExpressionBudgetWarning is issued and, with the "numeric" action, the
+    derivation stops and the model switches to numeric-only mode (see
+    "Manipulator.numeric_only").
+    Expressions are measured as they are derived, before they are optimized or
+    inverted, so a runaway expression is caught before paying for those passes.
+    The accessible params are:
+     - max_operations: the most operations of a matrix, or None.
+     - max_depth: the deepest tree of an entry, or None.
+     - max_memory: the largest approximate footprint of a matrix, in bytes, or None.
+     - action: "warn" or "numeric".
+    """
+
+    ACTIONS = ("warn", "numeric")
+
+    def __init__(self,
+                 max_operations: int = None,
+                 max_depth: int = None,
+                 max_memory: int = None,
+                 action: str = "warn"):
+        """
+        Creates the budget.
+        :param max_operations: the most operations of a matrix - default: no limit.
+        :param max_depth: the deepest tree of an entry - default: no limit.
+        :param max_memory: the largest footprint of a matrix, in bytes - default: no
+        limit.
+        :param action: what to do when a limit is exceeded - "warn" or "numeric" -
+        default: "warn".
+        :raises ValueError when the action is not valid.
+        """
+        if action not in self.ACTIONS:
+            raise ValueError(f"action must be one of: {list(self.ACTIONS)}")
+        self.max_operations = max_operations
+        self.max_depth = max_depth
+        self.max_memory = max_memory
+        self.action = action
+
+    def exceeded(self, stats: ExpressionStats) -> List[str]:
+        """
+        :param stats: the measures of a matrix.
+        :return: the description of each exceeded limit - empty if none.
+        """
+        result = list()
+        if self.max_operations is not None and stats.total_operations > self.max_operations:
+            result.append(f"{stats.total_operations} operations > {self.max_operations}")
+        if self.max_depth is not None and stats.max_depth > self.max_depth:
+            result.append(f"depth {stats.max_depth} > {self.max_depth}")
+        if self.max_memory is not None and stats.memory > self.max_memory:
+            result.append(f"{stats.memory} bytes > {self.max_memory}")
+        return result
+
+    def check(self,
+              expression: Union[Expr, Matrix],
+              name: str,
+              stats: Dict[str, ExpressionStats] = None,
+              fallback: str = "switching to numeric-only mode") -> bool:
+        """
+        Measures an expression and warns when it exceeds the budget.
+        :param expression: the expression or matrix.
+        :param name: its name, for the warning and the stats.
+        :param stats: dict where the measures are stored, if any.
+        :param fallback: what happens with the "numeric" action, for the warning.
+        :return: True when the expression is within the budget.
+        """
+        measures = expression_stats(expression, name)
+        if stats is not None:
+            stats[name] = measures
+        exceeded = self.exceeded(measures)
+        if exceeded:
+            warnings.warn(f"'{name}' exceeds the expression budget: {', '.join(exceeded)}"
+                          + (f" - {fallback}" if self.numeric else ""),
+                          ExpressionBudgetWarning, stacklevel=3)
+        return not exceeded
+
+    @property
+    def numeric(self) -> bool:
+        """
+        :return: whether exceeding the budget switches to numeric-only mode.
+        """
+        return self.action == "numeric"
@@ -0,0 +1,314 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import asyncio
+
+from queue import Empty
+from queue import Full
+from queue import Queue
+from threading import Event
+from threading import Thread
+from time import perf_counter
+from typing import AsyncIterable
+from typing import AsyncIterator
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+
+from .kernels import FusedKernel
+from .manipulator import ForwardKinematics
+
+STAGES = ("queue", "batch", "compute", "total")
+"""
+Pipeline stages whose latency is measured, for each micro-batch:
+ - queue: how long the oldest reading waited before being taken from the queue.
+ - batch: how long it took to fill the micro-batch.
+ - compute: the FK (and Jacobian) evaluation time.
+ - total: from the arrival of the oldest reading until the batch is delivered.
+"""
+
+_END = object()
+
+
+class PoseBatch:
+    """
+    Result of a micro-batch. The accessible params are:
+     - q: the joint readings, as a (B, dof) array.
+     - poses: the (X, Y, Z, Phi) coordinates, as a (B, 4) array.
+     - jacobian: the Jacobian matrices, as a (B, 6, dof) array, or None.
+     - arrival: the arrival time of each reading (perf_counter), as a (B,) array.
+    """
+
+    def __init__(self,
+                 q: np.ndarray,
+                 poses: np.ndarray,
+                 jacobian: np.ndarray,
+                 arrival: np.ndarray):
+        self.q = q
+        self.poses = poses
+        self.jacobian = jacobian
+        self.arrival = arrival
+
+    def __len__(self):
+        return len(self.q)
+
+
+class PipelineStats:
+    """
+    Ring buffers with the latency of each stage (see STAGES) for the last
+    micro-batches, plus global counters. All times are in seconds.
+    The accessible params are:
+     - readings: how many readings have been processed.
+     - batches: how many micro-batches have been delivered.
+     - latencies: dict with the ring buffer of each stage.
+    """
+
+    def __init__(self, size: int = 1024):
+        """
+        Creates the buffers.
+        :param size: how many batches are kept - default: 1024.
+        """
+        self.size = size
+        self.readings = 0
+        self.batches = 0
+        self.latencies = {stage: np.zeros(size) for stage in STAGES}
+
+    def record(self, readings: int, **latencies: float):
+        """
+        Stores the latencies of a batch, overwriting the oldest one when full.
+        :param readings: the number of readings of the batch.
+        :param latencies: the latency of each stage.
+        """
+        index = self.batches % self.size
+        for stage, value in latencies.items():
+            self.latencies[stage][index] = value
+        self.batches += 1
+        self.readings += readings
+
+    def recent(self, stage: str) -> np.ndarray:
+        """
+        :param stage: one of STAGES.
+        :return: the latencies kept for the stage, from the oldest to the newest.
+        """
+        values = self.latencies[stage]
+        if self.batches < self.size:
+            return values[:self.batches]
+        index = self.batches % self.size
+        return np.concatenate([values[index:], values[:index]])
+
+    def summary(self) -> Dict[str, float]:
+        """
+        :return: dict with the counters and the mean, p99 and max of each stage.
+        """
+        result = {"readings": self.readings, "batches": self.batches}
+        for stage in STAGES:
+            values = self.recent(stage)
+            if len(values) > 0:
+                result[f"{stage}_mean"] = float(values.mean())
+                result[f"{stage}_p99"] = float(np.percentile(values, 99))
+                result[f"{stage}_max"] = float(values.max())
+        return result
+
+    def __str__(self):
+        return '\n'.join("{:>14}: {:.6g}".format(key, value)
+                         for key, value in self.summary().items())
+
+
+class PosePipeline:
+    """
+    Streaming pipeline that turns joint readings into poses. Readings are taken
+    from an iterator (in a reader thread) or an async iterator (in a task) and
+    put into a bounded queue: when the consumer falls behind, the queue fills
+    and the reader stops pulling from the source (backpressure). The consumer
+    groups the readings in micro-batches, which are delivered when full or when
+    the oldest reading has waited "max_delay", and evaluates them with the
+    batched forward kinematics and, optionally, a fused Jacobian kernel.
+    The accessible params are:
+     - forward_kinematics: the ForwardKinematics.
+     - kernel: the FusedKernel used for the Jacobian, if any.
+     - batch_size: the largest micro-batch.
+     - max_delay: the longest a reading waits for its batch to fill, in seconds.
+     - queue_size: the capacity of the reading queue.
+     - stats: the PipelineStats.
+    """
+
+    def __init__(self,
+                 forward_kinematics: ForwardKinematics,
+                 kernel: FusedKernel = None,
+                 batch_size: int = 64,
+                 max_delay: float = 0.01,
+                 queue_size: int = 1024,
+                 history: int = 1024):
+        """
+        Creates the pipeline.
+        :param forward_kinematics: the forward kinematics - see
+        "Manipulator.direct_kinematics".
+        :param kernel: the fused kernel for the Jacobian - see "Manipulator.kernel" -
+        default: no Jacobian.
+        :param batch_size: the largest micro-batch - default: 64.
+        :param max_delay: the longest a reading waits for its batch, in seconds -
+        default: 0.01.
+        :param queue_size: the capacity of the reading queue - default: 1024.
+        :param history: how many batches are kept in the stats - default: 1024.
+        """
+        self.forward_kinematics = forward_kinematics
+        self.kernel = kernel
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.stats = PipelineStats(history)
+
+    def _compute(self,
+                 readings: List[Tuple[float, Sequence[float]]],
+                 started: float) -> PoseBatch:
+        batched = perf_counter()
+        arrival = np.array([reading[0] for reading in readings])
+        q = np.array([reading[1] for reading in readings], dtype=np.float64)
+        poses = self.forward_kinematics.poses(q)
+        jacobian = self.kernel(q)[1] if self.kernel is not None else None
+        finished = perf_counter()
+        self.stats.record(len(q),
+                          queue=started - arrival[0],
+                          batch=batched - started,
+                          compute=finished - batched,
+                          total=finished - arrival[0])
+        return PoseBatch(q, poses, jacobian, arrival)
+
+    def _read(self, readings: Iterable[Sequence[float]], queue: Queue, stop: Event):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return
+                except Full:
+                    continue
+
+        try:
+            for reading in readings:
+                if stop.is_set():
+                    return
+                put((perf_counter(), reading))
+            put(_END)
+        except BaseException as error:
+            put(error)
+
+    def process(self, readings: Iterable[Sequence[float]]) -> Iterator[PoseBatch]:
+        """
+        Processes a stream of readings.
+        :param readings: iterator of joint readings, each one with "dof" values.
+        :return: iterator of PoseBatch, in the order of the readings.
+        :raises any exception raised by the readings iterator.
+        """
+        queue = Queue(self.queue_size)
+        stop = Event()
+        reader = Thread(target=self._read, args=(readings, queue, stop), daemon=True)
+        reader.start()
+        try:
+            finished = False
+            while not finished:
+                item = queue.get()
+                started = perf_counter()
+                batch = list()
+                while True:
+                    if item is _END:
+                        finished = True
+                        break
+                    if isinstance(item, BaseException):
+                        raise item
+                    batch.append(item)
+                    remaining = batch[0][0] + self.max_delay - perf_counter()
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = queue.get(timeout=remaining) if remaining > 0 else \
+                            queue.get_nowait()
+                    except Empty:
+                        break
+                if batch:
+                    yield self._compute(batch, started)
+        finally:
+            stop.set()
+
+    async def aprocess(self,
+                       readings: AsyncIterable[Sequence[float]]) -> AsyncIterator[PoseBatch]:
+        """
+        Processes an asynchronous stream of readings. The evaluation runs in the
+        default executor, so the event loop keeps serving the source meanwhile.
+        :param readings: async iterator of joint readings.
+        :return: async iterator of PoseBatch, in the order of the readings.
+        :raises any exception raised by the readings iterator.
+        """
+        queue = asyncio.Queue(self.queue_size)
+
+        async def read():
+            try:
+                async for reading in readings:
+                    await queue.put((perf_counter(), reading))
+                await queue.put(_END)
+            except asyncio.CancelledError:
+                # The pipeline was closed, as "stop" for the reader thread
+                raise
+            except BaseException as error:
+                await queue.put(error)
+
+        loop = asyncio.get_running_loop()
+        reader = asyncio.ensure_future(read())
+        # A pending "get" is kept between batches instead of being cancelled, so
+        # no reading is lost when the batch deadline expires
+        getter = None
+
+        async def next_item(timeout: float = None):
+            nonlocal getter
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if not done:
+                return None
+            item, getter = getter.result(), None
+            return item
+
+        try:
+            finished = False
+            while not finished:
+                item = await next_item()
+                started = perf_counter()
+                batch = list()
+                while item is not None:
+                    if item is _END:
+                        finished = True
+                        break
+                    if isinstance(item, BaseException):
+                        raise item
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    remaining = batch[0][0] + self.max_delay - perf_counter()
+                    if getter is None and not queue.empty():
+                        item = queue.get_nowait()
+                    elif remaining > 0:
+                        item = await next_item(remaining)
+                    else:
+                        item = None
+                if batch:
+                    yield await loop.run_in_executor(None, self._compute, batch, started)
+        finally:
+            reader.cancel()
+            if getter is not None:
+                getter.cancel()
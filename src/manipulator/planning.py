@@ -0,0 +1,242 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from time import perf_counter
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+
+from .collision import CollisionChecker
+
+
+class MotionPlan:
+    """
+    Result of a planning query. The accessible params are:
+     - path: the waypoints, as a (M, dof) array, or None when no path was found.
+     - iterations: the number of planner iterations.
+     - nodes: the number of nodes of both trees.
+     - checks: the number of configurations checked for collisions.
+     - time: the planning time, in seconds.
+    """
+
+    def __init__(self,
+                 path: np.ndarray,
+                 iterations: int,
+                 nodes: int,
+                 checks: int,
+                 time: float):
+        self.path = path
+        self.iterations = iterations
+        self.nodes = nodes
+        self.checks = checks
+        self.time = time
+
+    @property
+    def success(self) -> bool:
+        return self.path is not None
+
+    @property
+    def length(self) -> float:
+        """
+        :return: the joint-space length of the path - infinite if there is none.
+        """
+        if self.path is None:
+            return float("inf")
+        return float(np.linalg.norm(np.diff(self.path, axis=0), axis=1).sum())
+
+    def __str__(self):
+        result = "path found" if self.success else "no path found"
+        if self.success:
+            result += f" - {len(self.path)} waypoints, length {self.length:.4f}"
+        return result + f" - {self.iterations} iterations, {self.nodes} nodes, " \
+                        f"{self.checks} checks, {self.time * 1e3:.2f}ms"
+
+
+class _Tree:
+    def __init__(self, root: np.ndarray, capacity: int):
+        self.nodes = np.empty((capacity, len(root)))
+        self.parents = np.empty(capacity, dtype=np.int64)
+        self.nodes[0] = root
+        self.parents[0] = -1
+        self.size = 1
+
+    def nearest(self, q: np.ndarray) -> int:
+        difference = self.nodes[:self.size] - q
+        return int(np.argmin(np.einsum("ij,ij->i", difference, difference)))
+
+    def add(self, nodes: np.ndarray, parent: int) -> int:
+        if self.size + len(nodes) > len(self.nodes):
+            self.nodes = np.concatenate([self.nodes, np.empty_like(self.nodes)])
+            self.parents = np.concatenate([self.parents, np.empty_like(self.parents)])
+        indices = np.arange(self.size, self.size + len(nodes))
+        self.nodes[indices] = nodes
+        self.parents[indices] = np.concatenate([[parent], indices[:-1]])
+        self.size += len(nodes)
+        return self.size - 1
+
+    def branch(self, index: int) -> np.ndarray:
+        indices = list()
+        while index >= 0:
+            indices.append(index)
+            index = self.parents[index]
+        return self.nodes[indices]
+
+
+class RRTConnect:
+    """
+    Bidirectional rapidly-exploring random tree planner (RRT-Connect) over the
+    joint space. Every extension walks the straight segment towards the target
+    in steps of "resolution" and checks all of them with a single batched call
+    to the collision checker, keeping the free prefix.
+    The accessible params are:
+     - checker: the CollisionChecker.
+     - limits: the (low, high) values of each joint, as a (dof, 2) array.
+     - step: the largest joint-space distance covered by an extension.
+     - resolution: the joint-space distance between checked configurations.
+    """
+
+    def __init__(self,
+                 checker: CollisionChecker,
+                 limits: Sequence[Tuple[float, float]] = None,
+                 step: float = 0.5,
+                 resolution: float = 0.02,
+                 seed: int = None):
+        """
+        Creates the planner.
+        :param checker: the collision checker.
+        :param limits: (low, high) of each joint - default: (-pi, pi).
+        :param step: the largest distance covered by an extension - default: 0.5.
+        :param resolution: the distance between checked configurations - default:
+        0.02.
+        :param seed: the seed for the random generator.
+        """
+        self.checker = checker
+        dof = len(checker.params.symbols)
+        if limits is None:
+            limits = [(-np.pi, np.pi)] * dof
+        self.limits = np.asarray(limits, dtype=np.float64)
+        self.step = step
+        self.resolution = resolution
+        self._generator = np.random.default_rng(seed)
+        self._checks = 0
+
+    def _free_prefix(self, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+        """
+        Obtains the configurations from "start" (excluded) towards "end" that can
+        be reached without collisions.
+        """
+        distance = np.linalg.norm(end - start)
+        count = max(int(np.ceil(distance / self.resolution)), 1)
+        fractions = np.arange(1, count + 1) / count
+        samples = start + fractions[:, np.newaxis] * (end - start)
+        samples[-1] = end
+        self._checks += count
+        collisions = np.flatnonzero(~self.checker.free(samples))
+        return samples[:collisions[0]] if len(collisions) > 0 else samples
+
+    def _nodes(self, start: np.ndarray, path: np.ndarray) -> np.ndarray:
+        # Keep one node every "step" along the free segment
+        distances = np.linalg.norm(path - start, axis=1)
+        marks = np.floor(distances / self.step)
+        keep = np.flatnonzero(np.diff(np.concatenate([[0], marks])) > 0)
+        return path[np.union1d(keep, [len(path) - 1])]
+
+    def _extend(self, tree: _Tree, target: np.ndarray, connect: bool) -> Tuple[int, bool]:
+        index = tree.nearest(target)
+        start = tree.nodes[index]
+        end = target
+        distance = np.linalg.norm(target - start)
+        if not connect and distance > self.step:
+            end = start + (target - start) * (self.step / distance)
+        path = self._free_prefix(start, end)
+        if len(path) == 0:
+            return -1, False
+        last = tree.add(self._nodes(start, path), index)
+        return last, np.array_equal(path[-1], target)
+
+    def plan(self,
+             start: Sequence[float],
+             goal: Sequence[float],
+             max_iterations: int = 5000,
+             timeout: float = None,
+             shortcut: int = 50) -> MotionPlan:
+        """
+        Plans a collision-free joint-space path.
+        :param start: the initial joint values.
+        :param goal: the final joint values.
+        :param max_iterations: the maximum number of iterations - default: 5000.
+        :param timeout: the maximum planning time, in seconds - default: none.
+        :param shortcut: the number of shortcutting attempts on the found path -
+        default: 50, 0 to disable it.
+        :return: the MotionPlan.
+        :raises ValueError when the start or the goal are in collision.
+        """
+        begin = perf_counter()
+        self._checks = 2
+        start = np.asarray(start, dtype=np.float64)
+        goal = np.asarray(goal, dtype=np.float64)
+        free = self.checker.free(np.stack([start, goal]))
+        if not free.all():
+            raise ValueError(f"The {'start' if not free[0] else 'goal'} "
+                             f"configuration is in collision")
+        trees = [_Tree(start, 1024), _Tree(goal, 1024)]
+        iteration = 0
+        path = None
+        while iteration < max_iterations and \
+                (timeout is None or perf_counter() - begin < timeout):
+            iteration += 1
+            sample = self._generator.uniform(self.limits[:, 0], self.limits[:, 1])
+            index, _ = self._extend(trees[0], sample, connect=False)
+            if index >= 0:
+                other, reached = self._extend(trees[1], trees[0].nodes[index],
+                                              connect=True)
+                if reached:
+                    path = np.concatenate([trees[0].branch(index)[::-1],
+                                           trees[1].branch(other)[1:]])
+                    if iteration % 2 == 0:
+                        # The trees were swapped, so the path goes from the goal
+                        path = path[::-1]
+                    break
+            trees.reverse()
+        if path is not None and shortcut > 0:
+            path = self.shortcut(path, shortcut)
+        return MotionPlan(path, iteration, trees[0].size + trees[1].size, self._checks,
+                          perf_counter() - begin)
+
+    def shortcut(self, path: np.ndarray, attempts: int = 50) -> np.ndarray:
+        """
+        Shortens a path by replacing random sub-paths with straight segments
+        whenever they are collision free.
+        :param path: the waypoints, as a (M, dof) array.
+        :param attempts: the number of attempts - default: 50.
+        :return: the shortened path.
+        """
+        path = np.asarray(path, dtype=np.float64)
+        tried = set()
+        for _ in range(attempts):
+            candidates = (len(path) - 1) * (len(path) - 2) // 2
+            if len(tried) >= candidates:
+                break
+            i, j = np.sort(self._generator.choice(len(path), 2, replace=False))
+            if j - i < 2 or (i, j) in tried:
+                continue
+            segment = self._free_prefix(path[i], path[j])
+            if len(segment) > 0 and np.array_equal(segment[-1], path[j]):
+                path = np.concatenate([path[:i + 1], path[j:]])
+                tried.clear()
+            else:
+                tried.add((i, j))
+        return path
@@ -0,0 +1,288 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import sys
+
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+from types import CodeType
+from types import FunctionType
+from types import ModuleType
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+from sympy import Basic
+from sympy import srepr
+from sympy import sympify
+
+from .dh_table import DHTable
+from .manipulator import Manipulator
+from .model import CompiledModel
+from .optimization import ExpressionBudget
+from .optimization import Optimization
+
+
+def approximate_size(value: Any) -> int:
+    """
+    Approximates the memory footprint of an object graph: containers, object
+    attributes, SymPy expression trees and NumPy buffers are followed and every
+    object is counted once. Modules and classes are not followed, and functions
+    only count their code, so shared library state is left out.
+    :param value: the root object.
+    :return: the approximate size, in bytes.
+    """
+    seen = set()
+    pending = [value]
+    total = 0
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, (type, ModuleType)):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, np.ndarray):
+            if item.base is None:
+                total += item.nbytes
+        elif isinstance(item, Basic):
+            pending.extend(item.args)
+        elif isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+        elif isinstance(item, FunctionType):
+            pending.append(item.__code__)
+        elif isinstance(item, CodeType):
+            pending.extend(item.co_consts)
+        if not isinstance(item, Basic):
+            pending.extend(getattr(item, "__dict__", {}).values())
+            for cls in type(item).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    if isinstance(slot, str) and hasattr(item, slot) and \
+                            slot not in ("__dict__", "__weakref__"):
+                        pending.append(getattr(item, slot))
+    return total
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of derived manipulators and compiled models, keyed by the
+    table fingerprint, the optimization level, the phi settings and the
+    expression budget, so the same robot variant is only derived once. The least
+    recently used entries are evicted when there are more than "max_models" of
+    them or when their approximate footprint exceeds "max_memory". An entry that
+    alone exceeds the memory budget is returned but not kept.
+    The cached manipulators are never handed out: each caller gets its own copy,
+    which it may modify (for example, with "set_phi"). Compiled models are
+    immutable, so they are shared.
+    The accessible params are:
+     - max_models: the largest number of entries.
+     - max_memory: the largest approximate footprint of the entries, in bytes, or
+       None for no limit.
+     - hits: how many requests were served from the cache.
+     - misses: how many requests had to derive a model.
+     - evictions: how many entries have been evicted.
+    """
+
+    def __init__(self,
+                 max_models: int = 16,
+                 max_memory: int = None,
+                 size_of: Callable[[Any], int] = approximate_size):
+        """
+        Creates an empty registry.
+        :param max_models: the largest number of entries - default: 16.
+        :param max_memory: the memory budget, in bytes - default: no limit.
+        :param size_of: estimates the footprint of an entry - default:
+        "approximate_size".
+        :raises ValueError when "max_models" is not positive.
+        """
+        if max_models < 1:
+            raise ValueError("max_models must be at least 1")
+        self.max_models = max_models
+        self.max_memory = max_memory
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size_of = size_of
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, int]]' = OrderedDict()
+        self._building: Dict[Hashable, Lock] = dict()
+        self._lock = Lock()
+
+    @staticmethod
+    def key(table: DHTable,
+            phi: Dict[str, Any] = None,
+            phi_e: Any = None,
+            optimize: Union[bool, str, Optimization] = True,
+            budget: ExpressionBudget = None) -> Tuple:
+        """
+        Obtains the key that identifies a manipulator.
+        :param table: the Denavit-Hartenberg table.
+        :param phi: the inverse kinematics phi, as {'x': ..., 'y': ..., 'z': ...}.
+        :param phi_e: the forward kinematics phi.
+        :param optimize: the optimization level.
+        :param budget: the expression budget, if any.
+        :return: the key, as a tuple.
+        """
+        phi = phi if phi is not None else dict()
+        return (table.fingerprint(),
+                Optimization.parse(optimize).value,
+                tuple(sorted((axis.lower(), srepr(sympify(expression)))
+                             for axis, expression in phi.items())),
+                srepr(sympify(phi_e)) if phi_e is not None else None,
+                (budget.max_operations, budget.max_depth, budget.max_memory,
+                 budget.action) if budget is not None else None)
+
+    def manipulator(self,
+                    table: DHTable,
+                    phi: Dict[str, Any] = None,
+                    phi_e: Any = None,
+                    optimize: Union[bool, str, Optimization] = True,
+                    jacobian: bool = False,
+                    budget: ExpressionBudget = None) -> Manipulator:
+        """
+        Obtains a copy of the cached manipulator for the given settings, deriving
+        it on a miss.
+        :param table: the Denavit-Hartenberg table.
+        :param phi: the inverse kinematics phi, as {'x': ..., 'y': ..., 'z': ...}.
+        :param phi_e: the forward kinematics phi.
+        :param optimize: the optimization level - default: True ("full").
+        :param jacobian: whether the symbolic Jacobian (and its inverse) is derived
+        too - default: False.
+        :param budget: limits for the size of the derived expressions - default:
+        no limits.
+        :return: the Manipulator - a private copy, so modifying it does not
+        affect the cache.
+        """
+        key = ("manipulator", self.key(table, phi, phi_e, optimize, budget), jacobian)
+
+        def build() -> Manipulator:
+            manipulator = Manipulator(table, optimize, budget)
+            if phi_e is not None:
+                manipulator.direct_kinematics.set_phi(phi_e)
+            for axis, expression in (phi or dict()).items():
+                manipulator.set_phi(axis, expression)
+            if jacobian:
+                manipulator.jacobian(optimize=optimize)
+            return manipulator
+
+        return deepcopy(self._get(key, build))
+
+    def compiled(self,
+                 table: DHTable,
+                 phi: Dict[str, Any] = None,
+                 phi_e: Any = None,
+                 optimize: Union[bool, str, Optimization] = True,
+                 subs: list = None,
+                 derivatives: bool = False,
+                 budget: ExpressionBudget = None) -> CompiledModel:
+        """
+        Obtains the shared compiled model for the given settings. On a miss, it is
+        compiled from a copy of the (also cached) manipulator.
+        :param table: the Denavit-Hartenberg table.
+        :param phi: the inverse kinematics phi, as {'x': ..., 'y': ..., 'z': ...}.
+        :param phi_e: the forward kinematics phi.
+        :param optimize: the optimization level - default: True ("full").
+        :param subs: the joint symbols for the Jacobian - default: the table ones.
+        :param derivatives: include the Hessian and Jacobian derivative kernel -
+        default: False.
+        :param budget: limits for the size of the derived expressions - default:
+        no limits. Numeric-only models have no Jacobian.
+        :return: the CompiledModel.
+        """
+        key = ("compiled", self.key(table, phi, phi_e, optimize, budget),
+               tuple(str(symbol) for symbol in subs) if subs is not None else None,
+               derivatives)
+        return self._get(key, lambda: self.manipulator(table, phi, phi_e, optimize,
+                                                       budget=budget)
+                         .compile(subs, derivatives))
+
+    def _get(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            building = self._building.setdefault(key, Lock())
+        # Only one thread derives each model; the rest wait for it
+        with building:
+            try:
+                with self._lock:
+                    if key in self._entries:
+                        self.hits += 1
+                        self._entries.move_to_end(key)
+                        return self._entries[key][0]
+                    self.misses += 1
+                value = build()
+                size = self._size_of(value)
+                with self._lock:
+                    self._entries[key] = (value, size)
+                    self._evict()
+            finally:
+                # Also when "build" fails, so the key can be derived again
+                with self._lock:
+                    if self._building.get(key) is building:
+                        del self._building[key]
+        return value
+
+    def _evict(self):
+        while len(self._entries) > self.max_models or \
+                (self.max_memory is not None and self.memory > self.max_memory):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def memory(self) -> int:
+        """
+        :return: the approximate footprint of all the entries, in bytes.
+        """
+        return sum(size for _, size in self._entries.values())
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: dict with the counters, the number of entries and their footprint.
+        """
+        with self._lock:
+            return {"entries": len(self._entries),
+                    "memory": self.memory,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions}
+
+    def clear(self):
+        """
+        Removes every entry. The counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return '\n'.join("{:>10}: {}".format(key, value)
+                         for key, value in self.stats().items())
+
+
+REGISTRY = ModelRegistry()
+"""
+The process-wide registry.
+"""
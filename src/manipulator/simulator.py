@@ -0,0 +1,434 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+import re
+
+from collections import deque
+from queue import Empty
+from queue import Queue
+from threading import Thread
+from time import perf_counter
+from time import sleep
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+from .dh_table import DHTable
+from .dh_table import CompactDHTable
+from .numeric import chain_frames
+
+_COMMAND = re.compile(r"^#(\d+)\s+(\S+)(.*)$")
+_ARGUMENT = re.compile(r"([A-Z])(-?(?:\d+\.?\d*|\.\d+))")
+
+OK = "ok"
+E_UNKNOWN = "E20"
+"""
+Error code for commands that do not exist.
+"""
+E_PARAMETER = "E21"
+"""
+Error code for wrong or missing parameters.
+"""
+E_UNREACHABLE = "E22"
+"""
+Error code for positions out of range.
+"""
+
+
+class SimulatedSwiftPro:
+    """
+    In-process stand-in for a uArm Swift Pro. It accepts the G-code style commands
+    of the real device ("#<n> <command> <arguments>", answered with "$<n> <reply>"),
+    buffers the motions and integrates the joints towards each target at the
+    configured speed limits, all the joints arriving at the same time. Positions
+    are reported with the forward kinematics of the table.
+    Supported commands:
+     - G0 / G1 X Y Z: move the end-effector to a position (mm).
+     - G2202 N V: move a joint (0-based) to an angle (degrees).
+     - P2200: current joint angles (degrees) - "ok J1=.. J2=..".
+     - P2220: current end-effector position - "ok X .. Y .. Z ..".
+     - M2200: whether the arm is moving - "ok V1" or "ok V0".
+    Motions are accepted while there is room in the buffer; when it is full, the
+    reply is delayed until the current motion finishes, as the real device does.
+    """
+
+    def __init__(self,
+                 params: Union[DHTable, CompactDHTable],
+                 speed_limits: Union[float, Sequence[float]] = np.pi,
+                 buffer_size: int = 16,
+                 latency: float = 0.,
+                 q: Sequence[float] = None,
+                 clock: Callable[[], float] = perf_counter,
+                 wait: Callable[[float], Any] = sleep):
+        """
+        Creates the simulated device.
+        :param params: the Denavit-Hartenberg params.
+        :param speed_limits: the largest speed of all the joints or of each of them,
+        in rad/s - default: pi.
+        :param buffer_size: how many motions can be queued - default: 16.
+        :param latency: processing time of each command, in seconds - default: 0.
+        :param q: the initial joint values - default: all zero.
+        :param clock: function returning the current time, in seconds.
+        :param wait: function that sleeps for the given seconds.
+        """
+        self.params = params.compact() if isinstance(params, DHTable) else params
+        dof = len(self.params.symbols)
+        self.speed_limits = np.broadcast_to(
+            np.asarray(speed_limits, dtype=np.float64), (dof,)).copy()
+        self.buffer_size = buffer_size
+        self.latency = latency
+        self.q = np.zeros(dof) if q is None else np.asarray(q, dtype=np.float64)
+        self._clock = clock
+        self._wait = wait
+        self._queue = deque()
+        self._segment_start = clock()
+        self._handlers: Dict[str, Callable[[Dict[str, float]], str]] = {
+            "G0": self._move,
+            "G1": self._move,
+            "G2202": self._move_joint,
+            "P2200": self._joints,
+            "P2220": self._position,
+            "M2200": self._moving,
+        }
+
+    def handle(self, line: str) -> str:
+        """
+        Processes a command line.
+        :param line: the command, as "#<n> <command> <arguments>".
+        :return: the reply, as "$<n> <reply>" - or an empty string when the line
+        is not a command.
+        """
+        match = _COMMAND.match(line.strip())
+        if match is None:
+            return ''
+        number, command, arguments = match.groups()
+        if self.latency > 0:
+            self._wait(self.latency)
+        handler = self._handlers.get(command.upper())
+        if handler is None:
+            return f"${number} {E_UNKNOWN}"
+        arguments = {key: float(value) for key, value in _ARGUMENT.findall(arguments)}
+        return f"${number} {handler(arguments)}"
+
+    def update(self) -> np.ndarray:
+        """
+        Integrates the motions up to the current time.
+        :return: the current joint values.
+        """
+        now = self._clock()
+        while self._queue:
+            target = self._queue[0]
+            duration = self._duration(target)
+            if now < self._segment_start + duration:
+                fraction = (now - self._segment_start) / duration
+                return self.q + fraction * (target - self.q)
+            self._queue.popleft()
+            self._segment_start += duration
+            self.q = target
+        self._segment_start = now
+        return self.q
+
+    def _duration(self, target: np.ndarray) -> float:
+        return float(np.max(np.abs(target - self.q) / self.speed_limits, initial=0.))
+
+    def _enqueue(self, target: np.ndarray) -> str:
+        self.update()
+        while len(self._queue) >= self.buffer_size:
+            remaining = self._segment_start + self._duration(self._queue[0]) - \
+                        self._clock()
+            self._wait(max(remaining, 0.))
+            self.update()
+        if not self._queue:
+            self._segment_start = self._clock()
+        self._queue.append(target)
+        return OK
+
+    def _last_target(self) -> np.ndarray:
+        return self._queue[-1] if self._queue else self.q
+
+    def _move(self, arguments: Dict[str, float]) -> str:
+        if not {'X', 'Y', 'Z'} <= arguments.keys():
+            return E_PARAMETER
+        target = solve_position(self.params, self._last_target(),
+                                np.array([arguments['X'], arguments['Y'],
+                                          arguments['Z']]))
+        if target is None:
+            return E_UNREACHABLE
+        return self._enqueue(target)
+
+    def _move_joint(self, arguments: Dict[str, float]) -> str:
+        if not {'N', 'V'} <= arguments.keys() or \
+                not 0 <= int(arguments['N']) < len(self.q):
+            return E_PARAMETER
+        target = self._last_target().copy()
+        target[int(arguments['N'])] = np.radians(arguments['V'])
+        return self._enqueue(target)
+
+    def _joints(self, _: Dict[str, float]) -> str:
+        angles = np.degrees(self.update())
+        return OK + ''.join(f" J{i + 1}={value:.4f}" for i, value in enumerate(angles))
+
+    def _position(self, _: Dict[str, float]) -> str:
+        x, y, z = chain_frames(self.params, self.update(), positions_only=True)[0, -1]
+        return f"{OK} X{x:.4f} Y{y:.4f} Z{z:.4f}"
+
+    def _moving(self, _: Dict[str, float]) -> str:
+        self.update()
+        return f"{OK} V{1 if self._queue else 0}"
+
+
+def solve_position(params: CompactDHTable,
+                   q: np.ndarray,
+                   target: np.ndarray,
+                   tolerance: float = 1e-6,
+                   iterations: int = 100) -> Union[np.ndarray, None]:
+    """
+    Numerically finds the joints that place the end-effector at a position, with
+    damped least squares over a finite-difference Jacobian, starting from "q".
+    :param params: the compact Denavit-Hartenberg table.
+    :param q: the initial joint values.
+    :param target: the end-effector position.
+    :param tolerance: the largest position error accepted - default: 1e-6.
+    :param iterations: the maximum number of iterations - default: 100.
+    :return: the joint values, or None when the position is not reached.
+    """
+    q = np.asarray(q, dtype=np.float64).copy()
+    step = 1e-6
+    offsets = np.concatenate([np.zeros((1, len(q))), step * np.eye(len(q))])
+    for _ in range(iterations):
+        positions = chain_frames(params, q + offsets, positions_only=True)[:, -1]
+        error = target - positions[0]
+        if np.linalg.norm(error) <= tolerance:
+            return q
+        jacobian = ((positions[1:] - positions[0]) / step).T
+        damping = 1e-6 * np.trace(jacobian.T @ jacobian) + 1e-12
+        q += np.linalg.solve(jacobian.T @ jacobian + damping * np.eye(len(q)),
+                             jacobian.T @ error)
+    return None
+
+
+class SimulatedSerial:
+    """
+    Serial-port-like transport for a SimulatedSwiftPro: lines written are
+    processed by the device in a background thread and the replies can be read
+    with "readline", so commands can be pipelined as with the real port.
+    """
+
+    def __init__(self, device: SimulatedSwiftPro, timeout: float = None):
+        """
+        Starts the device thread.
+        :param device: the simulated device.
+        :param timeout: the default "readline" timeout, in seconds, as the one of
+        a pyserial port - default: wait forever.
+        """
+        self.device = device
+        self.timeout = timeout
+        self._input: Queue = Queue()
+        self._output: Queue = Queue()
+        self._buffer = b''
+        self._thread = Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            line = self._input.get()
+            if line is None:
+                return
+            reply = self.device.handle(line)
+            if reply:
+                self._output.put((reply + '\n').encode())
+
+    def write(self, data: bytes) -> int:
+        """
+        Sends data to the device.
+        :param data: one or more lines, ended by '\\n'.
+        :return: the number of bytes written.
+        """
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b'\n')
+        for line in lines:
+            self._input.put(line.decode())
+        return len(data)
+
+    def readline(self, timeout: float = None) -> bytes:
+        """
+        Reads a reply.
+        :param timeout: the maximum time to wait, in seconds - default: the port
+        one.
+        :return: the reply line, or empty bytes on timeout.
+        """
+        try:
+            return self._output.get(timeout=timeout if timeout is not None
+                                    else self.timeout)
+        except Empty:
+            return b''
+
+    def close(self):
+        """
+        Stops the device thread.
+        """
+        self._input.put(None)
+        self._thread.join()
+
+
+def serve_pty(device: SimulatedSwiftPro) -> Tuple[str, Thread]:
+    """
+    Exposes a simulated device on a pseudo-terminal, so any serial client (for
+    example, pyserial) can connect to it. Only available on POSIX systems.
+    :param device: the simulated device.
+    :return: (path, thread) - the path of the terminal to open and the daemon
+    thread that serves it.
+    """
+    import pty
+    import tty
+
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+
+    def serve():
+        buffer = b''
+        while True:
+            try:
+                data = os.read(master, 4096)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            *lines, buffer = buffer.replace(b'\r', b'').split(b'\n')
+            for line in lines:
+                reply = device.handle(line.decode(errors="replace"))
+                if reply:
+                    os.write(master, (reply + '\n').encode())
+
+    thread = Thread(target=serve, daemon=True)
+    thread.start()
+    return os.ttyname(slave), thread
+
+
+class SenderStats:
+    """
+    Statistics of a CommandSender run. The accessible params are:
+     - commands: how many commands were sent.
+     - errors: how many replies were errors, plus the commands without reply.
+     - duration: the total time, in seconds.
+     - latencies: the round-trip latency of each replied command, in seconds.
+     - timeouts: how many commands got no reply in time.
+    """
+
+    def __init__(self,
+                 commands: int,
+                 errors: int,
+                 duration: float,
+                 latencies: np.ndarray,
+                 timeouts: int = 0):
+        self.commands = commands
+        self.errors = errors
+        self.duration = duration
+        self.latencies = latencies
+        self.timeouts = timeouts
+
+    @property
+    def throughput(self) -> float:
+        """
+        :return: the commands per second.
+        """
+        return self.commands / self.duration if self.duration > 0 else float("inf")
+
+    def __str__(self):
+        result = f"{self.commands} commands ({self.errors} errors, {self.timeouts} " \
+                 f"timeouts) in " \
+                 f"{self.duration:.3f}s - {self.throughput:.1f} commands/s\n"
+        if len(self.latencies) > 0:
+            p50, p99 = np.percentile(self.latencies, [50, 99]) * 1e3
+            result += f"latency: p50 {p50:.3f}ms, p99 {p99:.3f}ms, " \
+                      f"max {self.latencies.max() * 1e3:.3f}ms\n"
+        return result
+
+
+class CommandSender:
+    """
+    Pipelined command sender: it keeps up to "window" commands in flight, numbers
+    them and matches the replies by their number, measuring the round-trip
+    latency of each command. The port must provide "write(bytes)" and
+    "readline() -> bytes", like SimulatedSerial or a pyserial port, and its
+    "readline" must time out (returning empty bytes) for lost replies to be
+    detected.
+    """
+
+    def __init__(self, port, window: int = 8, timeout: float = 1.):
+        """
+        Creates the sender.
+        :param port: the serial port.
+        :param window: the maximum number of commands in flight - default: 8.
+        :param timeout: how long a reply is waited for, in seconds - a command
+        without reply by then is counted as an error - default: 1.
+        """
+        self.port = port
+        self.window = window
+        self.timeout = timeout
+        self.replies: Dict[int, str] = dict()
+        self._number = 0
+
+    def send_all(self, commands: Iterable[str]) -> SenderStats:
+        """
+        Sends all the commands, pipelined, and waits for every reply or its
+        timeout. Lines that are not replies to a pending command are ignored.
+        :param commands: the commands, without the "#<n>" prefix (for example,
+        "G0 X200 Y0 Z100").
+        :return: the SenderStats.
+        """
+        pending: Dict[int, float] = dict()
+        latencies: List[float] = list()
+        errors = 0
+        timeouts = 0
+        sent = 0
+        start = perf_counter()
+        iterator = iter(commands)
+        exhausted = False
+        while not exhausted or pending:
+            while not exhausted and len(pending) < self.window:
+                command = next(iterator, None)
+                if command is None:
+                    exhausted = True
+                    break
+                self._number += 1
+                sent += 1
+                pending[self._number] = perf_counter()
+                self.port.write(f"#{self._number} {command}\n".encode())
+            if not pending:
+                break
+            reply = self.port.readline().decode(errors="replace").strip()
+            number, _, text = reply[1:].partition(' ')
+            if reply.startswith('$') and number.isdigit() and int(number) in pending:
+                latencies.append(perf_counter() - pending.pop(int(number)))
+                self.replies[int(number)] = text
+                errors += int(not text.startswith(OK))
+            # Lost replies would keep their commands in flight forever
+            now = perf_counter()
+            for expired in [key for key, time in pending.items()
+                            if now - time > self.timeout]:
+                del pending[expired]
+                timeouts += 1
+        return SenderStats(sent, errors + timeouts, perf_counter() - start,
+                           np.array(latencies), timeouts)
@@ -0,0 +1,260 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+from .dh_table import DHTable
+from .dh_table import CompactDHTable
+from .dynamics import LinkInertia
+from .numeric import as_batch
+from .numeric import chain_frames
+
+
+class GravityLoad:
+    """
+    Static joint torques required for holding the manipulator against gravity,
+    computed from the intermediate frames (A01 ... A0n) and the mass of each link.
+    An optional payload is modelled as a point mass attached to the end-effector.
+    The accessible params are:
+     - params: the compact Denavit-Hartenberg table.
+     - links: the LinkInertia of each link - only mass and center are used.
+     - gravity: the gravity vector in the base frame.
+     - payload: the default payload mass.
+     - payload_center: the payload position relative to the end-effector frame.
+    """
+
+    def __init__(self,
+                 params: Union[DHTable, CompactDHTable],
+                 links: Sequence[LinkInertia],
+                 gravity: Sequence[float] = (0., 0., -9.81),
+                 payload: float = 0.,
+                 payload_center: Sequence[float] = (0., 0., 0.)):
+        """
+        Generates a new instance for the gravity load.
+        :param params: the Denavit-Hartenberg params.
+        :param links: the inertial parameters, one for each row of the table.
+        :param gravity: the gravity vector, in the base frame - default: -9.81 in Z.
+        :param payload: the payload mass - default: no payload.
+        :param payload_center: the payload position in the end-effector frame.
+        :raises ValueError when the number of links does not match the table or
+        when a joint variable is neither theta (revolute) nor d (prismatic).
+        """
+        self.params = params.compact() if isinstance(params, DHTable) else params
+        if len(links) != len(self.params):
+            raise ValueError(f"There must be one LinkInertia for each row - "
+                             f"expected {len(self.params)}, got {len(links)}")
+        if np.any(self.params.rows["joint"] > 1):
+            raise ValueError("Only revolute (theta) and prismatic (d) joints are "
+                             "supported")
+        self.links = tuple(links)
+        self.gravity = np.asarray(gravity, dtype=np.float64)
+        self.payload = float(payload)
+        self.payload_center = np.asarray(payload_center, dtype=np.float64)
+        self._masses = np.array([link.mass for link in self.links])
+        self._centers = np.array([link.center for link in self.links])
+
+    def torques(self, q: np.ndarray, payload: float = None) -> np.ndarray:
+        """
+        Computes the static joint torques (or forces, for prismatic joints).
+        :param q: the joint values, as a (N, dof) array.
+        :param payload: the payload mass - default: the one given when created.
+        :return: a (N, dof) array with the joint torques.
+        """
+        payload = self.payload if payload is None else float(payload)
+        frames = chain_frames(self.params, as_batch(q, len(self.params.symbols)))
+        rotations = frames[..., :3, :3]
+        origins = frames[..., :3, 3]
+        # Links are attached to the DH frames, without the end-effector translation
+        link_origins = origins.copy()
+        link_origins[:, -1] -= (self.params.Tx, self.params.Ty, self.params.Tz)
+        centers = link_origins + np.einsum("nkij,kj->nki", rotations, self._centers)
+        weights = -self._masses[:, np.newaxis] * self.gravity
+        moments = np.cross(centers, weights)
+        if payload != 0:
+            payload_center = origins[:, -1] + rotations[:, -1] @ self.payload_center
+            payload_weight = -payload * self.gravity
+            moments[:, -1] += np.cross(payload_center, payload_weight)
+            weights = weights.copy()
+            weights[-1] += payload_weight
+        # Moments and forces of every link from i to n, about the base origin
+        moments = np.cumsum(moments[:, ::-1], axis=1)[:, ::-1]
+        forces = np.cumsum(weights[::-1], axis=0)[::-1]
+        # Joint i moves around the Z axis of the previous frame (the base, for 1)
+        axes = np.empty_like(origins)
+        axes[:, 0] = (0., 0., 1.)
+        axes[:, 1:] = rotations[:, :-1, :, 2]
+        joint_origins = np.zeros_like(origins)
+        joint_origins[:, 1:] = origins[:, :-1]
+        loads = moments - np.cross(joint_origins, forces)
+
+        result = np.empty((len(frames), len(self.params.symbols)))
+        for i, (joint, kind) in enumerate(zip(self.params.joints,
+                                              self.params.rows["joint"])):
+            if joint >= 0:
+                load = loads[:, i] if kind == 0 else \
+                    np.broadcast_to(forces[i], loads[:, i].shape)
+                result[:, joint] = np.einsum("ni,ni->n", load, axes[:, i])
+        return result
+
+    def map(self,
+            q: np.ndarray,
+            payload: float = None,
+            chunk_size: int = 100000,
+            workers: int = None) -> np.ndarray:
+        """
+        Computes the static torques for an arbitrary set of configurations (for
+        example, the reachable ones) in chunks, optionally in several processes.
+        :param q: the joint values, as a (N, dof) array.
+        :param payload: the payload mass - default: the one given when created.
+        :param chunk_size: the number of configurations per chunk.
+        :param workers: number of worker processes - default: run in this process.
+        :return: a (N, dof) array with the joint torques.
+        """
+        q = as_batch(q, len(self.params.symbols))
+        result = np.empty_like(q)
+        bounds = [(start, min(start + chunk_size, len(q)))
+                  for start in range(0, len(q), chunk_size)]
+        if workers is None or workers <= 1:
+            for start, stop in bounds:
+                result[start:stop] = self.torques(q[start:stop], payload)
+            return result
+        with ProcessPoolExecutor(workers) as executor:
+            chunks = executor.map(self.torques,
+                                  [q[start:stop] for start, stop in bounds],
+                                  [payload] * len(bounds))
+            for (start, stop), torques in zip(bounds, chunks):
+                result[start:stop] = torques
+        return result
+
+    def grid(self,
+             ranges: Sequence[Tuple[float, float, int]],
+             payload: float = None,
+             chunk_size: int = 100000,
+             workers: int = None,
+             path: Union[str, Path] = None) -> 'GravityMap':
+        """
+        Computes the static torques over a regular joint-space grid, in chunks and
+        optionally in several processes. Configurations are generated per chunk,
+        so only the result is kept in memory - or in disk, if "path" is given.
+        :param ranges: (low, high, count) of each joint.
+        :param payload: the payload mass - default: the one given when created.
+        :param chunk_size: the number of configurations per chunk.
+        :param workers: number of worker processes - default: run in this process.
+        :param path: if given, the torques are written to a memory-mapped ".npy"
+        file instead of being kept in memory.
+        :return: the GravityMap with the grid and its torques.
+        :raises ValueError when there is not a range for each joint.
+        """
+        dof = len(self.params.symbols)
+        if len(ranges) != dof:
+            raise ValueError(f"There must be one range for each joint ({dof})")
+        axes = [np.linspace(low, high, int(count)) for low, high, count in ranges]
+        shape = tuple(len(axis) for axis in axes)
+        total = int(np.prod(shape))
+        if path is None:
+            torques = np.empty((total, dof))
+        else:
+            torques = np.lib.format.open_memmap(path, mode="w+", shape=(total, dof))
+        bounds = [(start, min(start + chunk_size, total))
+                  for start in range(0, total, chunk_size)]
+        payload = self.payload if payload is None else float(payload)
+        if workers is None or workers <= 1:
+            for start, stop in bounds:
+                torques[start:stop] = _grid_chunk(self, axes, start, stop, payload)
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                chunks = executor.map(_grid_chunk,
+                                      [self] * len(bounds),
+                                      [axes] * len(bounds),
+                                      [start for start, _ in bounds],
+                                      [stop for _, stop in bounds],
+                                      [payload] * len(bounds))
+                for (start, stop), values in zip(bounds, chunks):
+                    torques[start:stop] = values
+        if path is not None:
+            torques.flush()
+        return GravityMap(axes, torques.reshape(shape + (dof,)), payload)
+
+
+def _grid_chunk(load: GravityLoad,
+                axes: List[np.ndarray],
+                start: int,
+                stop: int,
+                payload: float) -> np.ndarray:
+    indices = np.unravel_index(np.arange(start, stop), tuple(len(axis) for axis in axes))
+    q = np.stack([axis[index] for axis, index in zip(axes, indices)], axis=1)
+    return load.torques(q, payload)
+
+
+class GravityMap:
+    """
+    Static torques sampled over a regular joint-space grid.
+    The accessible params are:
+     - axes: the grid values of each joint.
+     - torques: array of shape (*grid, dof) with the torques at each grid node.
+     - payload: the payload mass used.
+    """
+
+    def __init__(self, axes: Sequence[np.ndarray], torques: np.ndarray, payload: float):
+        self.axes = [np.asarray(axis, dtype=np.float64) for axis in axes]
+        self.torques = torques
+        self.payload = payload
+
+    def lookup(self, q: np.ndarray) -> np.ndarray:
+        """
+        Obtains the torques at the grid nodes closest to the given configurations.
+        :param q: the joint values, as a (N, dof) array.
+        :return: a (N, dof) array with the torques.
+        """
+        q = as_batch(q, len(self.axes))
+        indices = list()
+        for column, axis in enumerate(self.axes):
+            step = axis[1] - axis[0] if len(axis) > 1 else 1.
+            index = np.rint((q[:, column] - axis[0]) / step).astype(np.intp)
+            indices.append(np.clip(index, 0, len(axis) - 1))
+        return self.torques[tuple(indices)]
+
+    def max_abs(self) -> np.ndarray:
+        """
+        :return: the maximum absolute torque of each joint over the grid.
+        """
+        dof = self.torques.shape[-1]
+        return np.abs(self.torques.reshape(-1, dof)).max(axis=0)
+
+    def save(self, path: Union[str, Path]):
+        """
+        Saves the map as a ".npz" file.
+        :param path: the destination file.
+        """
+        arrays = {f"axis_{i}": axis for i, axis in enumerate(self.axes)}
+        np.savez(path, torques=np.asarray(self.torques), payload=self.payload, **arrays)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'GravityMap':
+        """
+        Loads a map saved with "save".
+        :param path: the ".npz" file.
+        :return: the GravityMap.
+        """
+        with np.load(path) as data:
+            axes = [data[f"axis_{i}"] for i in range(len(data.files) - 2)]
+            return cls(axes, data["torques"], float(data["payload"]))
@@ -0,0 +1,341 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from itertools import product
+from pathlib import Path
+from typing import Callable
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+
+def _chebyshev_rows(scaled: np.ndarray, degree: int) -> np.ndarray:
+    """
+    Evaluates the Chebyshev polynomials T0 ... T(degree) with their recurrence.
+    :param scaled: the inputs, in [-1, 1], as a (D, N) array.
+    :param degree: the highest degree.
+    :return: a (D, degree + 1, N) array - each polynomial is a contiguous row.
+    """
+    values = np.empty((len(scaled), degree + 1, scaled.shape[1]))
+    values[:, 0] = 1.
+    if degree > 0:
+        values[:, 1] = scaled
+    for k in range(2, degree + 1):
+        np.multiply(2. * scaled, values[:, k - 1], out=values[:, k])
+        values[:, k] -= values[:, k - 2]
+    return values
+
+
+def _chebyshev(scaled: np.ndarray, degree: int) -> np.ndarray:
+    """
+    Evaluates the Chebyshev polynomials T0 ... T(degree) with their recurrence.
+    :param scaled: the inputs, in [-1, 1], as a (N, D) array.
+    :param degree: the highest degree.
+    :return: a (D, N, degree + 1) array.
+    """
+    return np.ascontiguousarray(_chebyshev_rows(scaled.T, degree).transpose(0, 2, 1))
+
+
+def _products(chebyshev: np.ndarray, exponents: np.ndarray) -> np.ndarray:
+    """
+    Multiplies the Chebyshev polynomials of each input for every term.
+    :param chebyshev: the polynomials, as returned by "_chebyshev".
+    :param exponents: the degree of each input in every term, as a (M, D) array.
+    :return: a (N, M) array.
+    """
+    result = np.ones((chebyshev.shape[1], len(exponents)))
+    for column in range(exponents.shape[1]):
+        result *= np.take(chebyshev[column], exponents[:, column], axis=1)
+    return result
+
+
+class PolynomialSurrogate:
+    """
+    Polynomial approximation of a vector function over a box domain, as a sum of
+    products of Chebyshev polynomials (one per input). The polynomials are
+    evaluated with their recurrence, so no trigonometric function is called.
+    The coefficients are laid out once as a dense tensor: the outer products of
+    the polynomials of all the inputs but the last one are combined with a single
+    matrix product, whose rows are then weighted by the polynomials of the last
+    input. Points are evaluated in small chunks through buffers allocated once
+    per call, so every step works on short contiguous rows that stay in cache.
+    The cost grows with the number of dense coefficients, this is, with the
+    product of the degrees of each input: prefer a low degree per input to a
+    high total degree.
+    Inputs outside the domain evaluate to NaN, as the error is only known inside.
+    The accessible params are:
+     - low, high: the domain bounds of each input, as (D,) arrays.
+     - exponents: the degree of each input in every term, as a (M, D) array.
+     - coefficients: the coefficients of every term and output, as a (M, K) array.
+     - validation_max_error: the largest absolute error of each output on the
+       validation set - it is not a bound: points off that set may be worse.
+     - validation_rms_error: the root mean square error of each output on the
+       validation set.
+     - validation_size: the number of validation points.
+    """
+
+    def __init__(self,
+                 low: np.ndarray,
+                 high: np.ndarray,
+                 exponents: np.ndarray,
+                 coefficients: np.ndarray,
+                 validation_max_error: np.ndarray = None,
+                 validation_rms_error: np.ndarray = None,
+                 validation_size: int = 0):
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.exponents = np.asarray(exponents, dtype=np.int64)
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        outputs = self.coefficients.shape[1]
+        self.validation_max_error = np.full(outputs, np.nan) \
+            if validation_max_error is None else \
+            np.asarray(validation_max_error, dtype=np.float64)
+        self.validation_rms_error = np.full(outputs, np.nan) \
+            if validation_rms_error is None else \
+            np.asarray(validation_rms_error, dtype=np.float64)
+        self.validation_size = validation_size
+        self._degrees = self.exponents.max(axis=0, initial=0)
+        self._center = (self.low + self.high) / 2.
+        self._factor = 2. / (self.high - self.low)
+        tensor = np.zeros(tuple(self._degrees + 1) + (outputs,))
+        tensor[tuple(self.exponents.T)] = self.coefficients
+        # Row d * K + k of the weights gives the output k for degree d of the last
+        # input, and each column is a product of the polynomials of the others
+        self._weights = np.ascontiguousarray(
+            tensor.reshape(-1, (self._degrees[-1] + 1) * outputs).T)
+
+    @property
+    def inputs(self) -> int:
+        return len(self.low)
+
+    @property
+    def outputs(self) -> int:
+        return self.coefficients.shape[1]
+
+    def _scale(self, x: np.ndarray) -> np.ndarray:
+        return (2. * x - (self.low + self.high)) / (self.high - self.low)
+
+    def basis(self, x: np.ndarray) -> np.ndarray:
+        """
+        Evaluates every term of the polynomial.
+        :param x: the inputs, as a (N, D) array - they must be inside the domain.
+        :return: a (N, M) array.
+        """
+        return _products(_chebyshev(self._scale(x), int(self._degrees.max())),
+                         self.exponents)
+
+    def _buffers(self, size: int) -> dict:
+        # Row 1 is always written, even for inputs of degree 0
+        rows = max(self._degrees.max(initial=0), 1) + 1
+        buffers = {"chebyshev": np.ones((self.inputs, rows, size)),
+                   "twice": np.empty(size),
+                   "partial": np.empty((len(self._weights), size)),
+                   "result": np.empty((self.outputs, size))}
+        # One buffer for every partial outer product of the inputs but the last
+        heads = [np.ones((1, size))]
+        terms = 1
+        for degree in self._degrees[:-1]:
+            terms *= degree + 1
+            heads.append(np.empty((terms, size)))
+        buffers["heads"] = heads
+        return buffers
+
+    def _evaluate(self, columns: np.ndarray, out: np.ndarray, buffers: dict):
+        chebyshev = buffers["chebyshev"]
+        twice = buffers["twice"]
+        for column, degree in enumerate(self._degrees):
+            values = chebyshev[column]
+            np.subtract(columns[column], self._center[column], out=values[1])
+            values[1] *= self._factor[column]
+            np.multiply(values[1], 2., out=twice)
+            for k in range(2, degree + 1):
+                np.multiply(twice, values[k - 1], out=values[k])
+                values[k] -= values[k - 2]
+        heads = buffers["heads"]
+        for column, degree in enumerate(self._degrees[:-1]):
+            np.multiply(heads[column][:, np.newaxis], chebyshev[column, np.newaxis,
+                                                                :degree + 1],
+                        out=heads[column + 1].reshape(len(heads[column]), degree + 1,
+                                                      -1))
+        partial = np.matmul(self._weights, heads[-1], out=buffers["partial"])
+        last = chebyshev[-1]
+        outputs = self.outputs
+        result = np.multiply(partial[:outputs], last[0], out=buffers["result"])
+        for degree in range(1, self._degrees[-1] + 1):
+            rows = partial[degree * outputs:(degree + 1) * outputs]
+            rows *= last[degree]
+            result += rows
+        out[...] = result.T
+
+    def __call__(self, x: np.ndarray, chunk_size: int = 2048) -> np.ndarray:
+        """
+        Evaluates the surrogate.
+        :param x: the inputs, as a (N, D) array.
+        :param chunk_size: the number of inputs evaluated at once - default: 2048,
+        small enough for the intermediate values to stay in cache.
+        :return: a (N, K) array - NaN for inputs outside the domain.
+        :raises ValueError when the inputs do not have D columns.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if x.ndim == 1:
+            x = x[np.newaxis, :]
+        if x.ndim != 2 or x.shape[1] != self.inputs:
+            raise ValueError(f"Inputs must have shape (N, {self.inputs}) - got {x.shape}")
+        result = np.empty((len(x), self.outputs))
+        columns = np.ascontiguousarray(x.T)
+        size = max(min(chunk_size, len(x)), 1)
+        buffers = self._buffers(size)
+        for start in range(0, len(x), size):
+            chunk = columns[:, start:start + size]
+            if chunk.shape[1] != size:
+                buffers = self._buffers(chunk.shape[1])
+            self._evaluate(chunk, result[start:start + size], buffers)
+        outside = np.zeros(len(x), dtype=bool)
+        for column in range(self.inputs):
+            outside |= (x[:, column] < self.low[column]) | \
+                       (x[:, column] > self.high[column])
+        result[outside] = np.nan
+        return result
+
+    def save(self, path: Union[str, Path]):
+        """
+        Saves the surrogate as a ".npz" file.
+        :param path: the destination file.
+        """
+        np.savez(path, low=self.low, high=self.high, exponents=self.exponents,
+                 coefficients=self.coefficients,
+                 validation_max_error=self.validation_max_error,
+                 validation_rms_error=self.validation_rms_error,
+                 validation_size=self.validation_size)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'PolynomialSurrogate':
+        """
+        Loads a surrogate saved with "save".
+        :param path: the ".npz" file.
+        :return: the PolynomialSurrogate.
+        """
+        with np.load(path) as data:
+            return cls(data["low"], data["high"], data["exponents"],
+                       data["coefficients"], data["validation_max_error"],
+                       data["validation_rms_error"], int(data["validation_size"]))
+
+    def __str__(self):
+        result = f"{self.inputs} inputs, {self.outputs} outputs, " \
+                 f"{len(self.exponents)} terms (degree " \
+                 f"{int(self.exponents.sum(axis=1).max(initial=0))})\n"
+        result += "{:>8}{:>16}{:>16}\n".format("output", "validation max", "validation rms")
+        for i in range(self.outputs):
+            result += "{:>8}{:>16.6g}{:>16.6g}\n".format(i + 1,
+                                                         self.validation_max_error[i],
+                                                         self.validation_rms_error[i])
+        return result + f"measured on {self.validation_size} validation points\n"
+
+
+def _exponents(degrees: np.ndarray, total_degree: bool) -> np.ndarray:
+    exponents = np.array(list(product(*(range(degree + 1) for degree in degrees))),
+                         dtype=np.int64)
+    if total_degree:
+        exponents = exponents[exponents.sum(axis=1) <= degrees.max()]
+    return exponents
+
+
+def fit_surrogate(function: Callable[[np.ndarray], np.ndarray],
+                  domain: Sequence[Tuple[float, float]],
+                  degree: Union[int, Sequence[int]] = 8,
+                  total_degree: bool = True,
+                  samples: int = None,
+                  validation: Union[int, np.ndarray] = 100000,
+                  seed: int = None) -> PolynomialSurrogate:
+    """
+    Fits a Chebyshev polynomial surrogate of a batched function by least squares.
+    The training points are drawn with the Chebyshev (arcsine) density, which
+    keeps the fit stable near the domain bounds. The error is then measured on
+    a separate validation set: the reported maximum is only as good as that
+    set covers the domain, so use a large one (or a dense grid) for safety
+    margins. Points where the function is not finite (NaN, for example an
+    unreachable pose) are ignored.
+    :param function: the function to approximate - it receives a (N, D) array and
+    returns a (N, K) one.
+    :param domain: (low, high) of each input.
+    :param degree: the maximum degree, for all the inputs or for each of them -
+    default: 8.
+    :param total_degree: keep only the terms whose total degree is not above the
+    maximum degree, instead of the whole tensor product - default: True.
+    :param samples: the number of training points - default: four per term.
+    :param validation: the number of random validation points or the validation
+    points themselves, as a (V, D) array - default: 100000.
+    :param seed: the seed for the random generator.
+    :return: the PolynomialSurrogate.
+    :raises ValueError when there are not enough finite training points.
+    """
+    domain = np.asarray(domain, dtype=np.float64)
+    low, high = domain[:, 0], domain[:, 1]
+    degrees = np.broadcast_to(np.asarray(degree, dtype=np.int64), (len(domain),))
+    exponents = _exponents(degrees, total_degree)
+    generator = np.random.default_rng(seed)
+    if samples is None:
+        samples = 4 * len(exponents)
+    nodes = np.cos(np.pi * generator.uniform(size=(samples, len(domain))))
+    x = (low + high) / 2. + nodes * (high - low) / 2.
+    y = np.asarray(function(x), dtype=np.float64).reshape(samples, -1)
+    finite = np.all(np.isfinite(y), axis=1)
+    if finite.sum() < len(exponents):
+        raise ValueError(f"Only {int(finite.sum())} training points are finite - at "
+                         f"least {len(exponents)} are needed")
+    scaled = (2. * x[finite] - (low + high)) / (high - low)
+    basis = _products(_chebyshev(scaled, int(degrees.max())), exponents)
+    coefficients, *_ = np.linalg.lstsq(basis, y[finite], rcond=None)
+    surrogate = PolynomialSurrogate(low, high, exponents, coefficients)
+
+    if np.isscalar(validation):
+        validation = generator.uniform(low, high, (int(validation), len(domain)))
+    validation = np.asarray(validation, dtype=np.float64)
+    expected = np.asarray(function(validation), dtype=np.float64).reshape(
+        len(validation), -1)
+    finite = np.all(np.isfinite(expected), axis=1)
+    errors = surrogate(validation[finite]) - expected[finite]
+    surrogate.validation_max_error = np.abs(errors).max(axis=0, initial=0.)
+    surrogate.validation_rms_error = np.sqrt(np.mean(errors ** 2, axis=0)) \
+        if len(errors) > 0 else np.full(y.shape[1], np.nan)
+    surrogate.validation_size = int(finite.sum())
+    return surrogate
+
+
+def forward_surrogate(manipulator,
+                      ranges: Sequence[Tuple[float, float]],
+                      degree: Union[int, Sequence[int]] = 8,
+                      **kwargs) -> PolynomialSurrogate:
+    """
+    Fits a surrogate of the end-effector position, as "Manipulator.point" gives
+    it, over a joint-space domain. Phi is included as a fourth output if it was
+    set in the direct kinematics.
+    :param manipulator: the Manipulator.
+    :param ranges: (low, high) of each joint, in the order of the table symbols.
+    :param degree: the maximum degree - default: 8.
+    :param kwargs: the remaining arguments of "fit_surrogate".
+    :return: the PolynomialSurrogate, whose inputs are the joint values and whose
+    outputs are (X, Y, Z[, Phi]).
+    """
+    direct_kinematics = manipulator.direct_kinematics
+    outputs = 4 if direct_kinematics.phi_e is not None else 3
+
+    def function(q: np.ndarray) -> np.ndarray:
+        return direct_kinematics.poses(q)[:, :outputs]
+
+    return fit_surrogate(function, ranges, degree, **kwargs)
+
@@ -55,10 +55,10 @@ def main():
     print("Estudio de la inversa - si el resultado es un número imaginario, "
           "entonces es un punto al cual el robot no puede llegar")
     startt = time()
-    i1 = manipulator.eval(c1[0], c1[1], c1[2], c1[3])
-    i2 = manipulator.eval(c2[0], c2[1], c2[2], c2[3])
-    i3 = manipulator.eval(c3[0], c3[1], c3[2], c3[3])
-    i4 = manipulator.eval(c4[0], c4[1], c4[2], c4[3])
+    i1 = manipulator.eval(c1[0], c1[1], c1[2])
+    i2 = manipulator.eval(c2[0], c2[1], c2[2])
+    i3 = manipulator.eval(c3[0], c3[1], c3[2])
+    i4 = manipulator.eval(c4[0], c4[1], c4[2])
     endt = time()
     print(i1)
     print(i2)
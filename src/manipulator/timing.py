@@ -0,0 +1,209 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from typing import Callable
+from typing import List
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+
+class TimedPath:
+    """
+    Time parameterization of a joint path. The accessible params are:
+     - s: the path parameter of each sample (joint-space arc length).
+     - q: the joint values, as a (N, dof) array.
+     - t: the time of each sample, as a (N,) array.
+     - qd: the joint velocities, as a (N, dof) array.
+     - qdd: the joint accelerations, as a (N, dof) array.
+     - sd: the path speed (ds/dt) of each sample, as a (N,) array.
+     - iterations: the fixed-point iterations used by the forward and backward
+       passes.
+     - converged: whether both passes converged within the iteration limit.
+    """
+
+    def __init__(self,
+                 s: np.ndarray,
+                 q: np.ndarray,
+                 t: np.ndarray,
+                 qd: np.ndarray,
+                 qdd: np.ndarray,
+                 sd: np.ndarray,
+                 iterations: int,
+                 converged: bool):
+        self.s = s
+        self.q = q
+        self.t = t
+        self.qd = qd
+        self.qdd = qdd
+        self.sd = sd
+        self.iterations = iterations
+        self.converged = converged
+
+    @property
+    def duration(self) -> float:
+        return float(self.t[-1])
+
+    def sample(self, times: np.ndarray) -> np.ndarray:
+        """
+        Interpolates the joint values at the given times.
+        :param times: the times, as a (M,) array.
+        :return: a (M, dof) array.
+        """
+        times = np.clip(np.asarray(times, dtype=np.float64), 0., self.duration)
+        return np.stack([np.interp(times, self.t, column) for column in self.q.T], axis=1)
+
+    def __len__(self):
+        return len(self.q)
+
+    def __str__(self):
+        return f"{len(self.q)} samples - duration {self.duration:.4f}s - " \
+               f"{self.iterations} iterations" + ("" if self.converged else " (not converged)")
+
+
+def _scan(limits: np.ndarray,
+          increments: Callable[[np.ndarray], np.ndarray],
+          iterations: int,
+          tolerance: float) -> Tuple[np.ndarray, int, bool]:
+    """
+    Solves u[k + 1] = min(limits[k + 1], u[k] + increments(u)[k]), with
+    u[0] = limits[0]. For fixed increments, the solution is a prefix minimum of
+    the limits minus the cumulative increments; the dependency of the increments
+    on u is resolved by fixed-point iteration, starting from the limits.
+    """
+    u = limits
+    for iteration in range(1, iterations + 1):
+        cumulative = np.concatenate([[0.], np.cumsum(increments(u))])
+        new = np.maximum(cumulative + np.minimum.accumulate(limits - cumulative), 0.)
+        change = np.max(np.abs(new - u), initial=0.)
+        u = new
+        if change <= tolerance * max(float(u.max(initial=0.)), 1e-12):
+            return u, iteration, True
+    return u, iterations, False
+
+
+def time_optimal(q: np.ndarray,
+                 velocity_limits: Union[float, Sequence[float]],
+                 acceleration_limits: Union[float, Sequence[float]],
+                 jacobian: Callable[[np.ndarray], np.ndarray] = None,
+                 cartesian_speed: float = None,
+                 start_speed: float = 0.,
+                 end_speed: float = 0.,
+                 iterations: int = 200,
+                 tolerance: float = 1e-9) -> TimedPath:
+    """
+    Finds the fastest timing of a geometric joint path under per-joint velocity
+    and acceleration limits and, optionally, a limit on the end-effector speed.
+    The path is parameterized by its joint-space arc length s and the squared
+    path speed u = (ds/dt)^2 is bounded by the velocity limit curve and then
+    integrated forward with the largest acceleration and backward with the
+    largest deceleration (the classical bang-bang solution). Both passes are
+    vectorized over all the samples, but each one is a fixed-point iteration:
+    smooth paths typically need about 50 sweeps per pass, and more where the
+    acceleration limits depend strongly on the speed ("TimedPath.iterations"
+    reports them).
+    :param q: the path samples, as a (N, dof) array - consecutive duplicates are
+    not allowed.
+    :param velocity_limits: the largest speed, for all the joints or for each one.
+    :param acceleration_limits: the largest acceleration, for all the joints or for
+    each one.
+    :param jacobian: batched Jacobian - it receives a (N, dof) array and returns a
+    (N, 6, dof) one (for example, "CompiledModel.jacobian") - needed for
+    "cartesian_speed".
+    :param cartesian_speed: the largest end-effector linear speed, if any.
+    :param start_speed: the joint-space speed at the start - default: at rest.
+    :param end_speed: the joint-space speed at the end - default: at rest.
+    :param iterations: the maximum fixed-point iterations of each pass -
+    default: 200.
+    :param tolerance: the relative change of u that stops the iterations.
+    :return: the TimedPath.
+    :raises ValueError when the path is too short or has repeated samples, or when
+    "cartesian_speed" is given without "jacobian".
+    """
+    q = np.asarray(q, dtype=np.float64)
+    if q.ndim != 2 or len(q) < 2:
+        raise ValueError("The path must have at least two samples")
+    if cartesian_speed is not None and jacobian is None:
+        raise ValueError("A Jacobian is needed for limiting the Cartesian speed")
+    dof = q.shape[1]
+    velocity_limits = np.broadcast_to(np.asarray(velocity_limits, dtype=np.float64), (dof,))
+    acceleration_limits = np.broadcast_to(np.asarray(acceleration_limits, dtype=np.float64),
+                                          (dof,))
+    steps = np.linalg.norm(np.diff(q, axis=0), axis=1)
+    if np.any(steps <= 0.):
+        raise ValueError("The path has repeated consecutive samples")
+    s = np.concatenate([[0.], np.cumsum(steps)])
+    first = np.gradient(q, s, axis=0)
+    second = np.gradient(first, s, axis=0)
+
+    # Velocity limit curve: joint speeds, Cartesian speed and the largest u for
+    # which some acceleration satisfies every joint limit
+    with np.errstate(divide="ignore", invalid="ignore"):
+        limits = np.min((velocity_limits / np.abs(first)) ** 2, axis=1)
+        if cartesian_speed is not None:
+            linear = np.einsum("nij,nj->ni", np.asarray(jacobian(q))[:, :3, :], first)
+            limits = np.minimum(limits, (cartesian_speed /
+                                         np.linalg.norm(linear, axis=1)) ** 2)
+        # Each joint allows s'' in [-alpha - beta u, alpha - beta u]
+        moving = np.abs(first) > 1e-9
+        alpha = np.where(moving, acceleration_limits / np.abs(first), np.inf)
+        beta = np.where(moving, second / first, 0.)
+        still = np.where(moving, np.inf, acceleration_limits / np.abs(second))
+        limits = np.minimum(limits, np.min(still, axis=1))
+        gaps = beta[:, np.newaxis, :] - beta[:, :, np.newaxis]
+        pairs = np.where(gaps > 0, (alpha[:, :, np.newaxis] + alpha[:, np.newaxis, :]) /
+                         gaps, np.inf)
+        limits = np.minimum(limits, np.nan_to_num(pairs, nan=np.inf).min(axis=(1, 2)))
+    limits = np.nan_to_num(limits, nan=np.inf, posinf=1e300)
+    limits[0] = min(limits[0], start_speed ** 2)
+    limits[-1] = min(limits[-1], end_speed ** 2)
+
+    # Bounded alpha: joints at rest in the path derivative do not limit s''. The
+    # minimum over the joints is taken column by column, which is much faster than
+    # reducing a short last axis
+    alpha = np.where(np.isfinite(alpha), alpha, 1e300)
+    forward_columns = [(2. * steps * alpha[:-1, joint], 2. * steps * beta[:-1, joint])
+                       for joint in range(dof)]
+    backward_columns = [(2. * steps[::-1] * alpha[:0:-1, joint],
+                         -2. * steps[::-1] * beta[:0:-1, joint]) for joint in range(dof)]
+
+    def increments(columns: List[Tuple[np.ndarray, np.ndarray]]) -> Callable:
+        def evaluate(u: np.ndarray) -> np.ndarray:
+            result = None
+            for offset, slope in columns:
+                value = offset - slope * u[:-1]
+                result = value if result is None else np.minimum(result, value, out=result)
+            return result
+        return evaluate
+
+    forward, forward_iterations, forward_converged = _scan(
+        limits, increments(forward_columns), iterations, tolerance)
+    # The backward pass is a forward pass on the reversed path
+    backward, backward_iterations, backward_converged = _scan(
+        forward[::-1], increments(backward_columns), iterations, tolerance)
+    u = backward[::-1]
+
+    sd = np.sqrt(u)
+    with np.errstate(divide="ignore"):
+        durations = 2. * steps / (sd[:-1] + sd[1:])
+    t = np.concatenate([[0.], np.cumsum(durations)])
+    sdd = np.diff(u) / (2. * steps)
+    sdd = np.concatenate([sdd, sdd[-1:]])
+    qd = first * sd[:, np.newaxis]
+    qdd = first * sdd[:, np.newaxis] + second * u[:, np.newaxis]
+    return TimedPath(s, q, t, qd, qdd, sd, forward_iterations + backward_iterations,
+                     forward_converged and backward_converged)
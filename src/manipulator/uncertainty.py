@@ -0,0 +1,175 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from typing import Dict
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+from .dh_table import DHTable
+from .dh_table import CompactDHTable
+from .calibration import parameter_names
+from .calibration import parameter_vector
+from .numeric import as_batch
+from .numeric import chain_frames
+from .numeric import dh_transforms
+from .numeric import multiply_chain
+
+
+class UncertaintyResult:
+    """
+    End-effector position error statistics for a set of nominal configurations.
+    Errors are measured against the nominal end-effector position.
+    The accessible params are:
+     - q: the nominal configurations, as a (M, dof) array.
+     - nominal: the nominal end-effector positions, as a (M, 3) array.
+     - mean: the mean error (bias), as a (M, 3) array.
+     - covariance: the error covariance, as a (M, 3, 3) array.
+     - max_error: the largest error norm found, as a (M,) array.
+     - samples: the number of samples per configuration.
+    """
+
+    def __init__(self,
+                 q: np.ndarray,
+                 nominal: np.ndarray,
+                 mean: np.ndarray,
+                 covariance: np.ndarray,
+                 max_error: np.ndarray,
+                 samples: int):
+        self.q = q
+        self.nominal = nominal
+        self.mean = mean
+        self.covariance = covariance
+        self.max_error = max_error
+        self.samples = samples
+
+    @property
+    def rms(self) -> np.ndarray:
+        """
+        :return: the root mean square error norm of each configuration.
+        """
+        return np.sqrt(np.trace(self.covariance, axis1=1, axis2=2) +
+                       np.sum(self.mean ** 2, axis=1))
+
+    def ellipsoids(self, scale: float = 3.) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Obtains the error ellipsoids, centered at the mean error.
+        :param scale: the number of standard deviations of the semi-axes -
+        default: 3.
+        :return: (semi_axes, axes) as (M, 3) and (M, 3, 3) arrays - the columns of
+        each "axes" matrix are the directions of the semi-axes, from the smallest
+        to the largest.
+        """
+        values, vectors = np.linalg.eigh(self.covariance)
+        return scale * np.sqrt(np.clip(values, 0, None)), vectors
+
+    def __str__(self):
+        semi_axes, _ = self.ellipsoids()
+        result = f"{self.samples} samples per configuration\n"
+        result += "{:>4}{:>30}{:>12}{:>12}{:>30}\n".format(
+            'i', "nominal", "rms", "max", "3-sigma semi-axes")
+        for i in range(len(self.nominal)):
+            result += "{:>4}{:>30}{:>12.4f}{:>12.4f}{:>30}\n".format(
+                i + 1,
+                np.array2string(self.nominal[i], precision=2),
+                self.rms[i],
+                self.max_error[i],
+                np.array2string(semi_axes[i], precision=4))
+        return result
+
+
+def _draw(generator: np.random.Generator,
+          distribution: str,
+          spread: np.ndarray,
+          shape: Tuple[int, ...]) -> np.ndarray:
+    if distribution == "normal":
+        return generator.standard_normal(shape) * spread
+    return generator.uniform(-1., 1., shape) * spread
+
+
+def propagate(table: Union[DHTable, CompactDHTable],
+              q: np.ndarray,
+              tolerances: Dict[str, float] = None,
+              joint_noise: Union[float, Sequence[float]] = 0.,
+              samples: int = 100000,
+              chunk_size: int = 100000,
+              distribution: str = "normal",
+              seed: int = None) -> UncertaintyResult:
+    """
+    Propagates the tolerances of the Denavit-Hartenberg values and the joint
+    encoder noise to the end-effector position by Monte Carlo sampling. Each
+    sample perturbs the whole table and the joint values and evaluates the
+    forward kinematics; samples are evaluated in vectorized chunks and the
+    statistics are accumulated, so millions of samples fit in memory. Each
+    chunk is centered on its own mean before it is merged, so the covariance
+    does not lose precision when the bias is large compared with the spread.
+    :param table: the nominal Denavit-Hartenberg table.
+    :param q: the nominal configurations, as a (M, dof) array.
+    :param tolerances: dict with the tolerance of each parameter, by its name in
+    "calibration.parameter_names" (for example: {'a_2': 0.1, "Tx": 0.2}).
+    :param joint_noise: the encoder noise, for all the joints or for each of them.
+    :param samples: the number of samples per configuration - default: 100000.
+    :param chunk_size: the number of samples evaluated at once - default: 100000.
+    :param distribution: "normal", where tolerances are standard deviations, or
+    "uniform", where they are half-widths - default: "normal".
+    :param seed: the seed for the random generator.
+    :return: the UncertaintyResult.
+    :raises ValueError when a parameter name or the distribution is not valid.
+    """
+    if distribution not in ("normal", "uniform"):
+        raise ValueError("distribution must be ['normal', 'uniform']")
+    table = table.compact() if isinstance(table, DHTable) else table
+    dof = len(table.symbols)
+    n = len(table)
+    q = as_batch(q, dof)
+    names = parameter_names(table)
+    spread = np.zeros(len(names))
+    for name, tolerance in (tolerances or dict()).items():
+        if name not in names:
+            raise ValueError(f"Unknown parameter '{name}' - it must be one of: {names}")
+        spread[names.index(name)] = tolerance
+    joint_spread = np.broadcast_to(np.asarray(joint_noise, dtype=np.float64), (dof,))
+    nominal_vector = parameter_vector(table)
+    generator = np.random.default_rng(seed)
+    nominal = chain_frames(table, q, positions_only=True)[:, -1]
+
+    mean = np.zeros((len(q), 3))
+    scatter = np.zeros((len(q), 3, 3))
+    max_error = np.zeros(len(q))
+    joint_rows = np.flatnonzero(table.joints >= 0)
+    for m in range(len(q)):
+        for start in range(0, samples, chunk_size):
+            size = min(chunk_size, samples - start)
+            vector = nominal_vector + _draw(generator, distribution, spread,
+                                            (size, len(names)))
+            params = vector[:, :4 * n].reshape(size, n, 4)
+            joints = q[m] + _draw(generator, distribution, joint_spread, (size, dof))
+            kinds = table.rows["joint"][joint_rows]
+            params[:, joint_rows, kinds] += joints[:, table.joints[joint_rows]]
+            frames = multiply_chain(dh_transforms(params[..., 0], params[..., 1],
+                                                  params[..., 2], params[..., 3]))
+            errors = frames[:, -1, :3, 3] + vector[:, 4 * n:] - nominal[m]
+            # Merge the centered chunk statistics (Chan et al.)
+            chunk_mean = errors.mean(axis=0)
+            centered = errors - chunk_mean
+            delta = chunk_mean - mean[m]
+            mean[m] += delta * size / (start + size)
+            scatter[m] += centered.T @ centered + \
+                np.outer(delta, delta) * start * size / (start + size)
+            max_error[m] = max(max_error[m], np.linalg.norm(errors, axis=1).max())
+    covariance = scatter / samples
+    return UncertaintyResult(q, nominal, mean, covariance, max_error, samples)
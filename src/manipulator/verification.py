@@ -0,0 +1,269 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import Any
+from typing import Dict
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+
+from .dh_table import CompactDHTable
+from .kernels import CompiledExpressions
+from .numeric import chain_frames
+
+HISTOGRAM_EDGES = np.concatenate([[0.], np.logspace(-12, 6, 73), [np.inf]])
+"""
+Bin edges of the error histograms: zero, then four bins per decade from 1e-12
+to 1e6 and everything above.
+"""
+
+
+class RoundTripModel:
+    """
+    Numeric model used by the verifier: forward kinematics from the compact table
+    and the compiled Phi and uArm inverse kinematics expressions. It can be sent
+    to worker processes, where the expressions are compiled again once.
+    """
+
+    def __init__(self,
+                 params: CompactDHTable,
+                 phi: CompiledExpressions,
+                 inverse: CompiledExpressions):
+        self.params = params
+        self.phi = phi
+        self.inverse = inverse
+
+    def round_trip(self, q: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Runs FK, then IK, then FK again for a batch of configurations.
+        :param q: the joint values, as a (N, dof) array.
+        :return: (ik_q, pose_error, joint_error) - the joints found by the IK, the
+        distance between both end-effector positions and the largest wrapped
+        joint difference, NaN when the IK has no solution.
+        """
+        positions = chain_frames(self.params, q, positions_only=True)[:, -1]
+        phi = self.phi(q) if self.phi is not None else np.zeros((len(q), 1))
+        ik_q = self.inverse(np.concatenate([positions, phi], axis=1))
+        with np.errstate(invalid="ignore"):
+            ik_positions = chain_frames(self.params, ik_q, positions_only=True)[:, -1]
+            pose_error = np.linalg.norm(ik_positions - positions, axis=1)
+            difference = np.remainder(ik_q - q + np.pi, 2 * np.pi) - np.pi
+            joint_error = np.abs(difference).max(axis=1)
+        return ik_q, pose_error, joint_error
+
+
+class RoundTripReport:
+    """
+    Summary of a FK/IK round-trip verification. The accessible params are:
+     - samples: the number of configurations checked.
+     - failures: how many of them had no IK solution (NaN).
+     - pose_histogram, joint_histogram: counts over HISTOGRAM_EDGES.
+     - max_pose_error, max_joint_error: the largest errors found.
+     - worst: list of the worst cases by pose error, as dicts with "q", "ik_q",
+       "pose_error" and "joint_error".
+     - time: the verification time, in seconds.
+    """
+
+    def __init__(self, samples: int, worst_cases: int):
+        self.samples = samples
+        self.failures = 0
+        self.pose_histogram = np.zeros(len(HISTOGRAM_EDGES) - 1, dtype=np.int64)
+        self.joint_histogram = np.zeros(len(HISTOGRAM_EDGES) - 1, dtype=np.int64)
+        self.max_pose_error = 0.
+        self.max_joint_error = 0.
+        self.worst = list()
+        self.time = 0.
+        self._worst_cases = worst_cases
+
+    def add(self, partial: Dict[str, Any]):
+        """
+        Merges the partial result of a shard into the report.
+        :param partial: the dict returned for the shard.
+        """
+        self.failures += partial["failures"]
+        self.pose_histogram += partial["pose_histogram"]
+        self.joint_histogram += partial["joint_histogram"]
+        self.max_pose_error = max(self.max_pose_error, partial["max_pose_error"])
+        self.max_joint_error = max(self.max_joint_error, partial["max_joint_error"])
+        self.worst = sorted(self.worst + partial["worst"],
+                            key=lambda case: -case["pose_error"])[:self._worst_cases]
+
+    def quantile(self, fraction: float, joint: bool = False) -> float:
+        """
+        Estimates an error quantile of the solved samples from the histogram.
+        :param fraction: the quantile, in [0, 1].
+        :param joint: use the joint errors instead of the pose errors.
+        :return: the upper edge of the bin that contains the quantile.
+        """
+        histogram = self.joint_histogram if joint else self.pose_histogram
+        total = histogram.sum()
+        if total == 0:
+            return float("nan")
+        index = int(np.searchsorted(np.cumsum(histogram), fraction * total))
+        return float(HISTOGRAM_EDGES[min(index + 1, len(HISTOGRAM_EDGES) - 1)])
+
+    def passed(self,
+               pose_tolerance: float,
+               joint_tolerance: float = None,
+               max_failures: int = 0) -> bool:
+        """
+        Checks the report against some tolerances, for using it as a regression
+        gate.
+        :param pose_tolerance: the largest position error allowed.
+        :param joint_tolerance: the largest joint error allowed - default: unchecked.
+        :param max_failures: how many samples may have no IK solution - default: 0.
+        :return: whether all the limits are respected.
+        """
+        return (self.failures <= max_failures and
+                self.max_pose_error <= pose_tolerance and
+                (joint_tolerance is None or self.max_joint_error <= joint_tolerance))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        :return: the report as a JSON-serializable dict.
+        """
+        return {"samples": self.samples,
+                "failures": self.failures,
+                "max_pose_error": self.max_pose_error,
+                "max_joint_error": self.max_joint_error,
+                "histogram_edges": HISTOGRAM_EDGES.tolist(),
+                "pose_histogram": self.pose_histogram.tolist(),
+                "joint_histogram": self.joint_histogram.tolist(),
+                "worst": [{key: np.asarray(value).tolist() for key, value in case.items()}
+                          for case in self.worst],
+                "time": self.time}
+
+    def __str__(self):
+        solved = self.samples - self.failures
+        result = f"{self.samples} samples - {self.failures} without IK solution - " \
+                 f"{self.time:.3f}s\n"
+        if solved > 0:
+            result += f"pose error:  p50 <= {self.quantile(.5):.3g}, " \
+                      f"p99 <= {self.quantile(.99):.3g}, max = {self.max_pose_error:.3g}\n"
+            result += f"joint error: p50 <= {self.quantile(.5, True):.3g}, " \
+                      f"p99 <= {self.quantile(.99, True):.3g}, " \
+                      f"max = {self.max_joint_error:.3g}\n"
+        for case in self.worst:
+            result += f"q = {np.array2string(case['q'], precision=4)} -> " \
+                      f"{np.array2string(case['ik_q'], precision=4)}: " \
+                      f"pose error {case['pose_error']:.4g}, " \
+                      f"joint error {case['joint_error']:.4g}\n"
+        return result
+
+
+_worker_model: RoundTripModel = None
+
+
+def _init_worker(model: RoundTripModel):
+    global _worker_model
+    _worker_model = model
+
+
+def _shard(ranges: np.ndarray,
+           samples: int,
+           chunk_size: int,
+           seed: Sequence[int],
+           worst_cases: int) -> Dict[str, Any]:
+    generator = np.random.default_rng(seed)
+    partial = {"failures": 0,
+               "pose_histogram": np.zeros(len(HISTOGRAM_EDGES) - 1, dtype=np.int64),
+               "joint_histogram": np.zeros(len(HISTOGRAM_EDGES) - 1, dtype=np.int64),
+               "max_pose_error": 0.,
+               "max_joint_error": 0.,
+               "worst": list()}
+    for start in range(0, samples, chunk_size):
+        size = min(chunk_size, samples - start)
+        q = generator.uniform(ranges[:, 0], ranges[:, 1], (size, len(ranges)))
+        ik_q, pose_error, joint_error = _worker_model.round_trip(q)
+        solved = np.isfinite(pose_error)
+        partial["failures"] += int(size - solved.sum())
+        if not solved.any():
+            continue
+        partial["pose_histogram"] += np.histogram(pose_error[solved],
+                                                  HISTOGRAM_EDGES)[0]
+        partial["joint_histogram"] += np.histogram(joint_error[solved],
+                                                   HISTOGRAM_EDGES)[0]
+        partial["max_pose_error"] = max(partial["max_pose_error"],
+                                        float(pose_error[solved].max()))
+        partial["max_joint_error"] = max(partial["max_joint_error"],
+                                         float(joint_error[solved].max()))
+        indices = np.flatnonzero(solved)
+        count = min(worst_cases, len(indices))
+        worst = indices[np.argpartition(-pose_error[indices], count - 1)[:count]]
+        partial["worst"] = sorted(
+            partial["worst"] + [{"q": q[i], "ik_q": ik_q[i],
+                                 "pose_error": float(pose_error[i]),
+                                 "joint_error": float(joint_error[i])} for i in worst],
+            key=lambda case: -case["pose_error"])[:worst_cases]
+    return partial
+
+
+def verify_round_trip(manipulator,
+                      samples: int = 1000000,
+                      ranges: Sequence[Tuple[float, float]] = None,
+                      chunk_size: int = 100000,
+                      workers: int = None,
+                      shards: int = None,
+                      worst_cases: int = 10,
+                      seed: int = None) -> RoundTripReport:
+    """
+    Verifies the consistency of the forward kinematics and the uArm inverse
+    kinematics of a manipulator: random configurations are sampled over the
+    joint ranges, converted to poses with the FK, solved with the IK and
+    converted back with the FK. The work is split in shards that can run in a
+    process pool; each worker compiles the model once.
+    :param manipulator: the Manipulator to verify - its phi_e must be set in the
+    direct kinematics if the IK depends on Phi.
+    :param samples: the number of configurations to check - default: 1000000.
+    :param ranges: (low, high) of each joint - default: (-pi, pi).
+    :param chunk_size: the number of configurations evaluated at once.
+    :param workers: number of worker processes - default: run in this process.
+    :param shards: number of shards - default: one per worker.
+    :param worst_cases: how many of the worst cases are reported - default: 10.
+    :param seed: the seed for the random generator.
+    :return: the RoundTripReport.
+    """
+    start = perf_counter()
+    direct_kinematics = manipulator.direct_kinematics
+    params = direct_kinematics.compact_params
+    phi = None
+    if direct_kinematics.phi_e is not None:
+        phi = CompiledExpressions(params.symbols, [direct_kinematics.phi_e])
+    model = RoundTripModel(params, phi, manipulator.uarm_ik.compile())
+    if ranges is None:
+        ranges = [(-np.pi, np.pi)] * len(params.symbols)
+    ranges = np.asarray(ranges, dtype=np.float64)
+    if shards is None:
+        shards = max(workers or 1, 1)
+    sizes = [samples // shards + (1 if i < samples % shards else 0)
+             for i in range(shards)]
+    seeds = np.random.SeedSequence(seed).spawn(shards)
+    report = RoundTripReport(samples, worst_cases)
+    arguments = ([ranges] * shards, sizes, [chunk_size] * shards, seeds,
+                 [worst_cases] * shards)
+    if workers is None or workers <= 1:
+        _init_worker(model)
+        for partial in map(_shard, *arguments):
+            report.add(partial)
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(model,)) as executor:
+            for partial in executor.map(_shard, *arguments):
+                report.add(partial)
+    report.time = perf_counter() - start
+    return report
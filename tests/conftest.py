@@ -0,0 +1,43 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import sys
+
+from pathlib import Path
+
+import pytest
+
+# The package is not installed: it lives in "src"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from sympy import pi
+from sympy import symbols
+
+from manipulator import DHTable
+
+
+@pytest.fixture
+def uarm():
+    """
+    :return: (table, (theta_1, theta_2, theta_3)) for the uArm Swift Pro.
+    """
+    t1, t2, t3 = symbols("theta_1 theta_2 theta_3")
+    table = DHTable()
+    table.add(theta=t1, d=106.1, a=13.2, alpha=(pi / 2)) \
+         .add(theta=t2, d=0, a=142, alpha=pi) \
+         .add(theta=t3, d=0, a=158.9, alpha=0)
+    table.Tx = 44.5
+    table.Tz = -13.2
+    return table, (t1, t2, t3)
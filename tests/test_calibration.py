@@ -0,0 +1,87 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from manipulator import calibrate
+from manipulator.calibration import from_parameter_vector
+from manipulator.calibration import identification_jacobian
+from manipulator.calibration import parameter_names
+from manipulator.calibration import parameter_vector
+from manipulator.numeric import chain_frames
+
+PERTURBATION = {"d_1": .8, "a_2": -.5, "a_3": .3, "alpha_2": .004, "theta_2": -.01,
+                "theta_3": .02, "Ty": 1.5}
+"""
+Errors of the "true" arm - parameters the end-effector positions can identify.
+"""
+
+
+@pytest.fixture
+def nominal(uarm):
+    table, _ = uarm
+    return table.compact()
+
+
+@pytest.fixture
+def q():
+    low, high = [-np.pi / 2, np.pi / 4, np.pi / 4], [np.pi / 2, np.pi / 2, 3 * np.pi / 4]
+    return np.random.default_rng(0).uniform(low, high, (200, 3))
+
+
+def perturbed(table, errors):
+    names = parameter_names(table)
+    vector = parameter_vector(table)
+    for name, error in errors.items():
+        vector[names.index(name)] += error
+    return from_parameter_vector(table, vector)
+
+
+def test_identification_jacobian(nominal, q):
+    jacobian = identification_jacobian(nominal, q)
+    vector = parameter_vector(nominal)
+    step = 1e-6
+    for column in range(len(vector)):
+        shifted = [vector.copy(), vector.copy()]
+        shifted[0][column] += step
+        shifted[1][column] -= step
+        positions = [chain_frames(from_parameter_vector(nominal, values), q,
+                                  positions_only=True)[:, -1] for values in shifted]
+        np.testing.assert_allclose(jacobian[..., column],
+                                   (positions[0] - positions[1]) / (2 * step),
+                                   atol=1e-6, err_msg=parameter_names(nominal)[column])
+
+
+def test_recovers_parameters(nominal, q):
+    measured = chain_frames(perturbed(nominal, PERTURBATION), q, positions_only=True)[:, -1]
+    result = calibrate(nominal, q, measured, fit=list(PERTURBATION))
+    assert result.converged
+    assert result.initial_residuals.max() > 1.
+    assert result.residuals.max() < 1e-8
+    assert result.corrections == pytest.approx(PERTURBATION, abs=1e-9)
+
+
+def test_unidentifiable_parameters(nominal, q):
+    # Fitting everything still reaches the measurements: the combinations that
+    # positions cannot identify are left at their nominal values
+    measured = chain_frames(perturbed(nominal, PERTURBATION), q, positions_only=True)[:, -1]
+    measured += np.random.default_rng(1).normal(scale=1e-3, size=measured.shape)
+    result = calibrate(nominal, q, measured)
+    assert result.residuals.max() < 1e-2
+    assert np.all(np.isfinite(list(result.parameters.values())))
+    assert "calibrated" in str(result)
+    with pytest.raises(ValueError):
+        calibrate(nominal, q, measured, fit=["e_1"])
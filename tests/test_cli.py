@@ -0,0 +1,80 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import warnings
+
+import numpy as np
+import pytest
+
+from manipulator import ExpressionBudgetWarning
+from manipulator.cli import main
+from manipulator.cli import read_chunks
+
+
+def test_comments_are_not_rows(tmp_path):
+    source = tmp_path / "joints.csv"
+    source.write_text("# uArm joints\ntheta_1,theta_2,theta_3\n0,0.8,1.2\n"
+                      "# a comment\n\n0.1,0.9,1.3  # inline\n0.2,1.0,1.4\n")
+    rows, chunks = read_chunks(source, 2)
+    values = np.concatenate(list(chunks))
+    assert rows == len(values) == 3
+    np.testing.assert_allclose(values[:, 0], [0., .1, .2])
+
+    target = tmp_path / "poses.npy"
+    assert main(["fk", str(source), str(target), "--quiet"]) == 0
+    poses = np.load(target)
+    assert poses.shape == (3, 4)
+    assert np.all(np.isfinite(poses[:, :3]))
+
+
+def test_ik_rejects_table(tmp_path, capsys):
+    table = tmp_path / "table.json"
+    table.write_text(json.dumps({"rows": [
+        {"theta": "theta_1", 'd': 106.1, 'a': 13.2, "alpha": "pi/2"},
+        {"theta": "theta_2", 'd': 0, 'a': 142, "alpha": "pi"},
+        {"theta": "theta_3", 'd': 0, 'a': 158.9, "alpha": 0}]}))
+    source = tmp_path / "points.csv"
+    source.write_text("200,0,100,0\n")
+    with pytest.raises(SystemExit) as exit_info:
+        main(["ik", str(source), str(tmp_path / "joints.csv"), "--table", str(table)])
+    assert exit_info.value.code == 2
+    assert "--table" in capsys.readouterr().err
+
+
+def test_max_operations(tmp_path):
+    source = tmp_path / "joints.csv"
+    source.write_text("0,0.8,1.2\n0.1,0.9,1.3\n")
+    target = tmp_path / "poses.csv"
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", ExpressionBudgetWarning)
+        assert main(["fk", str(source), str(target), "--quiet",
+                     "--max-operations", "1"]) == 0
+    expected = tmp_path / "expected.csv"
+    assert main(["fk", str(source), str(expected), "--quiet"]) == 0
+    assert target.read_text() == expected.read_text()
+
+
+def test_numeric_only_jacobian(tmp_path, capsys):
+    source = tmp_path / "joints.csv"
+    source.write_text("0,0.8,1.2\n")
+    target = tmp_path / "jacobians.npy"
+    # The model may already be in the process-wide registry, without warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", ExpressionBudgetWarning)
+        assert main(["jacobian", str(source), str(target), "--quiet",
+                     "--max-operations", "1"]) == 1
+    assert "budget" in capsys.readouterr().err
+    assert not target.exists()
@@ -0,0 +1,137 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from sympy import symbols
+
+from manipulator import Box
+from manipulator import CollisionChecker
+from manipulator import DHTable
+from manipulator import ModelRegistry
+from manipulator import RRTConnect
+from manipulator import Sphere
+from manipulator.collision import link_segments
+
+
+def planar(radius: float = 0.) -> DHTable:
+    """
+    :return: a planar arm with three 100 mm links of the given capsule radius.
+    """
+    t1, t2, t3 = symbols("theta_1 theta_2 theta_3")
+    table = DHTable()
+    for theta in (t1, t2, t3):
+        table.add(theta=theta, d=0, a=100, alpha=0, radius=radius)
+    return table
+
+
+def test_radii_are_part_of_the_fingerprint():
+    assert planar(5.).fingerprint() != planar().fingerprint()
+    assert planar(5.).fingerprint() != planar(6.).fingerprint()
+    assert planar(5.).compact() != planar().compact()
+    assert planar(5.).fingerprint() == planar(5.).compact().fingerprint()
+
+
+def test_registry_separates_radii():
+    registry = ModelRegistry()
+    thin = registry.manipulator(planar(), optimize="none")
+    thick = registry.manipulator(planar(5.), optimize="none")
+    assert thin is not thick
+    assert thick.direct_kinematics.compact_params.radii.tolist() == [5.] * 3
+
+
+def test_free_only_checks_obstacles_by_default():
+    folded = np.array([[0., np.pi, np.pi]])
+    checker = CollisionChecker(planar(5.), [Sphere([0., 0., 500.], 10.)])
+    assert checker.query(folded).self_clearance[0] < 0
+    assert checker.free(folded)[0]
+    assert not CollisionChecker(planar(5.), self_collision=True).free(folded)[0]
+
+
+def test_obstacles():
+    checker = CollisionChecker(planar(5.), [Sphere([150., 0., 0.], 10.)])
+    result = checker.query(np.array([[0., 0., 0.], [np.pi / 2, 0., 0.]]))
+    assert result.environment[0] == pytest.approx(-15.)
+    assert result.environment[1] > 0
+    assert checker.free(np.array([[np.pi / 2, 0., 0.]]))[0]
+
+
+def sampled_distance(obstacle, starts, ends, samples=2001):
+    """
+    :return: the distance from each segment to the obstacle, by dense sampling.
+    """
+    result = np.full(starts.shape[:-1], np.inf)
+    for t in np.linspace(0., 1., samples):
+        result = np.minimum(result, obstacle.distance(starts + t * (ends - starts)))
+    return result
+
+
+def test_box_segment_distance():
+    generator = np.random.default_rng(0)
+    rotation, _ = np.linalg.qr(generator.normal(size=(3, 3)))
+    box = Box([10., 20., 30.], [40., 60., 20.], rotation)
+    starts = generator.uniform(-50., 80., (2000, 3))
+    ends = generator.uniform(-50., 80., (2000, 3))
+    expected = sampled_distance(box, starts, ends)
+    distance = box.segment_distance(starts, ends)
+    assert (expected < 0).sum() > 100
+    assert np.all(np.sign(distance) == np.sign(expected))
+    # Sampling can only miss the minimum, by at most half a step
+    assert np.all(distance <= expected + 1e-9)
+    assert np.all(distance >= expected - .1)
+
+
+def test_box_segment_through_center():
+    box = Box([0., 0., 0.], [20., 40., 60.])
+    distance = box.segment_distance(np.array([[-50., 0., 0.], [-50., 5., 0.]]),
+                                    np.array([[50., 0., 0.], [-50., 5., 40.]]))
+    assert distance == pytest.approx([-10., 40.])
+
+
+def test_capsule_crossing_box():
+    # The middle link crosses a 20 mm thick box 10 mm under its top face
+    checker = CollisionChecker(planar(5.), [Box([150., 0., 0.], [20., 20., 20.])])
+    result = checker.query(np.array([[0., 0., 0.], [np.pi / 2, 0., 0.]]))
+    assert result.environment[0] == pytest.approx(-15.)
+    assert result.environment_pairs[0].tolist() == [1, 0]
+    assert result.environment[1] > 0
+    assert checker.free(np.array([[0., 0., 0.], [np.pi / 2, 0., 0.]])).tolist() == \
+        [False, True]
+
+
+def test_free_matches_sampling():
+    box = Box([150., 80., 0.], [60., 40., 40.])
+    checker = CollisionChecker(planar(), [box])
+    q = np.random.default_rng(1).uniform(-np.pi, np.pi, (2000, 3))
+    starts, ends, _ = link_segments(checker.params, q)
+    expected = sampled_distance(box, starts, ends).min(axis=1) > 0
+    assert (~expected).sum() > 50
+    assert np.array_equal(checker.free(q), expected)
+
+
+def test_planner_avoids_box():
+    box = Box([150., 0., 0.], [60., 60., 40.])
+    checker = CollisionChecker(planar(), [box])
+    start, goal = [-np.pi / 3, 0., 0.], [np.pi / 3, 0., 0.]
+    plan = RRTConnect(checker, seed=0).plan(start, goal)
+    assert plan.success
+    np.testing.assert_allclose(plan.path[[0, -1]], [start, goal])
+    # Every link stays out of the box along the interpolated path
+    fractions = np.linspace(0., 1., 200)[:, np.newaxis]
+    q = np.concatenate([q0 + fractions * (q1 - q0)
+                        for q0, q1 in zip(plan.path[:-1], plan.path[1:])])
+    starts, ends, _ = link_segments(checker.params, q)
+    assert sampled_distance(box, starts, ends).min() > 0
@@ -0,0 +1,168 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from manipulator import ControlLoop
+from manipulator import Manipulator
+from manipulator import ResolvedRateController
+from manipulator import SimulatedSwiftPro
+
+
+class VirtualClock:
+    """
+    Clock that only advances when waiting or when a step spends time.
+    """
+
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self) -> float:
+        return self.now
+
+    def wait(self, seconds: float):
+        self.now += max(seconds, 0.)
+
+
+def timed_steps(clock: VirtualClock, durations: dict, started: list):
+    """
+    :return: a step function that records its tick and scheduled time and spends
+    the virtual time given for its tick (zero by default).
+    """
+    def step(tick: int, scheduled: float):
+        started.append((tick, scheduled, clock.now))
+        clock.wait(durations.get(tick, 0.))
+    return step
+
+
+def test_on_time_loop():
+    clock = VirtualClock()
+    started = list()
+    loop = ControlLoop(timed_steps(clock, {tick: .002 for tick in range(10)}, started),
+                       100., clock=clock, wait=clock.wait)
+    telemetry = loop.run(ticks=10)
+    assert telemetry.ticks == 10
+    assert telemetry.misses == 0
+    assert telemetry.skipped == 0
+    assert [scheduled for _, scheduled, _ in started] == \
+        pytest.approx([.01 * tick for tick in range(10)])
+    assert telemetry.recent_jitter == pytest.approx(np.zeros(10))
+    assert telemetry.recent_compute_time == pytest.approx(np.full(10, .002))
+
+
+def test_skip_overrun():
+    clock = VirtualClock()
+    started = list()
+    loop = ControlLoop(timed_steps(clock, {3: .035}, started), 100., overrun="skip",
+                       clock=clock, wait=clock.wait)
+    telemetry = loop.run(ticks=10)
+    # Tick 3 ends at 0.065s: ticks 4, 5 and 6 are dropped and the loop waits for 7
+    assert [tick for tick, _, _ in started] == [0, 1, 2, 3, 7, 8, 9]
+    assert telemetry.ticks == 7
+    assert telemetry.misses == 1
+    assert telemetry.skipped == 3
+    assert telemetry.recent_jitter == pytest.approx(np.zeros(7))
+    assert telemetry.missed[:telemetry.ticks].tolist() == \
+        [False, False, False, True, False, False, False]
+
+
+def test_catch_up_overrun():
+    clock = VirtualClock()
+    started = list()
+    loop = ControlLoop(timed_steps(clock, {3: .035}, started), 100., overrun="catch_up",
+                       clock=clock, wait=clock.wait)
+    telemetry = loop.run(ticks=10)
+    # The missed ticks run immediately, late, until the schedule is recovered
+    assert [tick for tick, _, _ in started] == list(range(10))
+    assert telemetry.skipped == 0
+    assert telemetry.misses == 3
+    assert telemetry.recent_jitter[4:7] == pytest.approx([.025, .015, .005])
+    assert telemetry.recent_jitter[7:] == pytest.approx(np.zeros(3))
+    assert telemetry.summary()["jitter_max"] == pytest.approx(.025)
+
+
+def test_stop_and_duration():
+    clock = VirtualClock()
+    loop = ControlLoop(lambda tick, _: tick < 4, 100., clock=clock, wait=clock.wait)
+    assert loop.run().ticks == 5
+    loop = ControlLoop(lambda tick, _: None, 100., clock=clock, wait=clock.wait)
+    assert loop.run(duration=.1).ticks == 10
+
+
+def test_telemetry_ring_buffer():
+    clock = VirtualClock()
+    loop = ControlLoop(timed_steps(clock, {tick: .001 * tick for tick in range(6)}, []),
+                       100., history=4, clock=clock, wait=clock.wait)
+    telemetry = loop.run(ticks=6)
+    assert telemetry.ticks == 6
+    assert telemetry.recent_compute_time == pytest.approx([.002, .003, .004, .005])
+    counts, _ = telemetry.histogram(bins=4)
+    assert counts.sum() == 4
+    with pytest.raises(ValueError):
+        telemetry.histogram("latency")
+
+
+def test_invalid_loops():
+    with pytest.raises(ValueError):
+        ControlLoop(lambda tick, _: None, 0.)
+    with pytest.raises(ValueError):
+        ControlLoop(lambda tick, _: None, 100., overrun="drop")
+
+
+@pytest.fixture
+def uarm_model(uarm):
+    table, (t1, t2, t3) = uarm
+    manipulator = Manipulator(table, optimize="none")
+    manipulator.direct_kinematics.set_phi(t2 - t3)
+    for axis, expression in (('x', t2 - t3), ('y', 0), ('z', t1)):
+        manipulator.set_phi(axis, expression)
+    return table, manipulator.compile()
+
+
+def test_speed_limit_keeps_the_direction(uarm_model):
+    _, model = uarm_model
+    q = np.array([[0., 1., 1.5]])
+    target = model.poses(q)[:, :3] + [[40., -30., 20.]]
+    free = ResolvedRateController(model).velocity(q, target)
+    limited = ResolvedRateController(model, max_speed=.01).velocity(q, target)
+    assert np.abs(limited).max() == pytest.approx(.01)
+    assert limited / np.linalg.norm(limited) == pytest.approx(free / np.linalg.norm(free))
+    slow = ResolvedRateController(model, max_speed=100.).velocity(q, target)
+    assert slow == pytest.approx(free)
+
+
+def test_resolved_rate_against_simulator(uarm_model):
+    table, model = uarm_model
+    clock = VirtualClock()
+    start = np.array([0., 1., 1.5])
+    device = SimulatedSwiftPro(table, speed_limits=np.pi, q=start, clock=clock,
+                               wait=clock.wait)
+    target = model.poses(np.array([[.3, 1.2, 1.3]]))[:, :3]
+    controller = ResolvedRateController(model, gain=5., max_speed=1.)
+    frequency = 50.
+
+    def step(tick: int, scheduled: float):
+        q = controller(device.update()[np.newaxis], target, 1. / frequency)[0]
+        for joint, angle in enumerate(np.degrees(q)):
+            assert device.handle(f"#{3 * tick + joint} G2202 N{joint} V{angle:.6f}") \
+                .endswith("ok")
+
+    telemetry = ControlLoop(step, frequency, clock=clock, wait=clock.wait).run(ticks=200)
+    assert telemetry.misses == 0
+    clock.wait(1.)
+    reply = device.handle("#0 P2220").split()
+    position = [float(value[1:]) for value in reply[2:]]
+    assert position == pytest.approx(target[0], abs=.01)
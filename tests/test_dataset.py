@@ -0,0 +1,148 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+
+import numpy as np
+import pytest
+
+from sympy import pi
+
+from manipulator import DHTable
+from manipulator import Dataset
+from manipulator import DatasetWriter
+from manipulator.dataset import FIELDS
+from manipulator.dataset import dataset_dtype
+
+
+def records(count, dof=3, seed=0):
+    generator = np.random.default_rng(seed)
+    return {'q': generator.normal(size=(count, dof)),
+            "pose": generator.normal(size=(count, 4))}
+
+
+def test_round_trip(uarm, tmp_path):
+    table, _ = uarm
+    path = tmp_path / "poses.npy"
+    first, second = records(10), records(5, seed=1)
+    with DatasetWriter(path, table) as writer:
+        assert writer.append(**first) == 10
+        assert writer.append(**second) == 5
+    dataset = Dataset(path, table)
+    assert len(dataset) == 15
+    assert dataset.dof == 3 and dataset.fields == ('q', "pose")
+    for field in ('q', "pose"):
+        np.testing.assert_array_equal(dataset[field],
+                                      np.concatenate([first[field], second[field]]))
+    # A plain ".npy" file for NumPy
+    loaded = np.load(path)
+    assert loaded.dtype == dataset_dtype(3)
+    np.testing.assert_array_equal(loaded["q"][10:], second['q'])
+    assert [len(chunk) for chunk in dataset.chunks(4)] == [4, 4, 4, 3]
+
+
+def test_header_follows_every_chunk(uarm, tmp_path):
+    table, _ = uarm
+    path = tmp_path / "poses.npy"
+    writer = DatasetWriter(path, table)
+    for count in range(1, 4):
+        writer.append(**records(count))
+        writer.flush()
+        assert len(np.load(path)) == count * (count + 1) // 2
+    # Records written after the last header update (an interrupted writer) are
+    # ignored by readers and dropped by the next append
+    writer._file.seek(0, 2)
+    writer._file.write(b"\0" * 40)
+    writer._file.close()
+    assert len(Dataset(path)) == 6
+    with DatasetWriter(path, table, mode='a') as writer:
+        assert writer.length == 6
+        writer.append(**records(2))
+    assert len(np.load(path)) == 8
+    assert path.stat().st_size == 1024 + 8 * dataset_dtype(3).itemsize
+
+
+def test_append(uarm, tmp_path):
+    table, _ = uarm
+    path = tmp_path / "poses.npy"
+    with DatasetWriter(path, table, mode='a') as writer:
+        writer.append(**records(3))
+    with DatasetWriter(path, table.compact(), mode='a') as writer:
+        writer.append(**records(4, seed=1))
+    dataset = Dataset(path)
+    assert len(dataset) == 7
+    np.testing.assert_array_equal(dataset['q'][3:], records(4, seed=1)['q'])
+    with DatasetWriter(path, table, mode='w'):
+        pass
+    assert len(Dataset(path)) == 0
+
+
+def test_append_validation(uarm, tmp_path):
+    table, _ = uarm
+    path = tmp_path / "poses.npy"
+    with DatasetWriter(path, table) as writer:
+        writer.append(**records(3))
+    other = table.compact().to_table()
+    other.Tx = 0.
+    with pytest.raises(ValueError, match="different DHTable"):
+        DatasetWriter(path, other, mode='a')
+    with pytest.raises(ValueError, match="fields"):
+        DatasetWriter(path, table, fields=('q',), mode='a')
+
+    # A ".npy" saved by NumPy has a shorter header, which must not be overwritten
+    foreign = tmp_path / "foreign.npy"
+    original = np.load(path)
+    np.save(foreign, original)
+    (tmp_path / "foreign.npy.json").write_text((tmp_path / "poses.npy.json").read_text())
+    contents = foreign.read_bytes()
+    with pytest.raises(ValueError, match="DatasetWriter"):
+        DatasetWriter(foreign, table, mode='a')
+    assert foreign.read_bytes() == contents
+
+    # A header that counts more records than the file has
+    with open(path, "r+b") as file:
+        file.truncate(1024 + 2 * dataset_dtype(3).itemsize)
+    with pytest.raises(ValueError, match="truncated"):
+        DatasetWriter(path, table, mode='a')
+
+    with pytest.raises(ValueError):
+        DatasetWriter(path, table, mode='x')
+
+
+def test_append_columns(uarm, tmp_path):
+    table, _ = uarm
+    with DatasetWriter(tmp_path / "poses.npy", table) as writer:
+        with pytest.raises(KeyError):
+            writer.append(q=np.zeros((2, 3)))
+        with pytest.raises(KeyError):
+            writer.append(jacobian=np.zeros((2, 6, 3)), **records(2))
+        with pytest.raises(ValueError):
+            writer.append(q=np.zeros((2, 3)), pose=np.zeros((3, 4)))
+
+
+def test_offset_joints(uarm, tmp_path):
+    # Joint variables with a constant offset are joints too
+    table, (t1, t2, t3) = uarm
+    offset = DHTable()
+    offset.add(theta=t1 + pi / 2, d=106.1, a=13.2, alpha=pi / 2) \
+          .add(theta=t2, d=0, a=142, alpha=pi) \
+          .add(theta=t3 - pi / 4, d=0, a=158.9, alpha=0)
+    path = tmp_path / "poses.npy"
+    with DatasetWriter(path, offset, fields=FIELDS) as writer:
+        assert writer.dof == 3
+        writer.append(jacobian=np.ones((2, 6, 3)), **records(2))
+    assert json.loads((tmp_path / "poses.npy.json").read_text())["dof"] == 3
+    np.testing.assert_array_equal(Dataset(path, offset)["jacobian"], np.ones((2, 6, 3)))
+
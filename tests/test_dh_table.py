@@ -0,0 +1,78 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import pickle
+
+from sympy import cos
+from sympy import pi
+
+from manipulator import CompactDHTable
+
+
+def test_round_trip_keeps_exact_constants(uarm):
+    table, (t1, _, _) = uarm
+    restored = table.compact().to_table()
+    assert restored[0]["alpha"] == pi / 2
+    assert restored[1]["alpha"] == pi
+    assert cos(restored[0]["alpha"]) == 0
+    assert restored[0]["theta"] == t1
+    assert restored.fingerprint() == table.fingerprint()
+
+
+def test_offsets_are_exact(uarm):
+    table, (t1, _, _) = uarm
+    table.change(1, theta=t1 + pi / 2)
+    compact = table.compact()
+    assert compact[0]["theta"] == t1 + pi / 2
+    assert compact[1:].to_list()[0]["alpha"] == pi
+
+
+def test_tables_built_from_floats(uarm):
+    table, _ = uarm
+    compact = table.compact()
+    rebuilt = CompactDHTable(compact.rows, compact.symbols, compact.Tx, compact.Ty,
+                             compact.Tz)
+    assert rebuilt.constants is None
+    assert rebuilt == compact
+    assert rebuilt[0]["alpha"] == float(pi / 2)
+
+
+def test_pickle(uarm):
+    table, _ = uarm
+    compact = table.compact()
+    restored = pickle.loads(pickle.dumps(compact))
+    assert restored == compact
+    assert restored.constants == compact.constants
+
+
+def test_symbols_match_compact_table(uarm):
+    # Joint variables with a constant offset are symbols of both tables
+    table, (t1, t2, t3) = uarm
+    table.change(1, theta=t1 + pi / 2)
+    table.change(3, theta=t3 - pi / 4)
+    assert table.symbols == [t1, t2, t3]
+    assert tuple(table.symbols) == table.compact().symbols
+    table.change(2, theta=0.)
+    assert table.symbols == [t1, t3]
+    table.remove(1)
+    assert table.symbols == [t3]
+    assert tuple(table.symbols) == table.compact().symbols
+
+
+def test_rows_have_radius(uarm):
+    table, _ = uarm
+    assert [row["radius"] for row in table.get()] == [0., 0., 0.]
+    table.change(2, radius=5.)
+    assert table.compact()[1]["radius"] == 5.
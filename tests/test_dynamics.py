@@ -0,0 +1,124 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from sympy import pi
+from sympy import symbols
+
+from manipulator import DHTable
+from manipulator import InverseDynamics
+from manipulator import LinkInertia
+from manipulator.numeric import chain_frames
+
+GRAVITY = 9.81
+
+
+def planar_torques(q, qd, qdd, masses, lengths, inertias):
+    """
+    Hand-derived dynamics of a planar two-link arm in the XY plane, with the mass
+    of each link at its end, an inertia about Z there and gravity along -Y.
+    """
+    (m1, m2), (l1, l2), (i1, i2) = masses, lengths, inertias
+    c1, c2, c12 = np.cos(q[:, 0]), np.cos(q[:, 1]), np.cos(q[:, 0] + q[:, 1])
+    h = m2 * l1 * l2 * np.sin(q[:, 1])
+    m11 = (m1 + m2) * l1 ** 2 + m2 * l2 ** 2 + 2 * m2 * l1 * l2 * c2 + i1 + i2
+    m12 = m2 * l2 ** 2 + m2 * l1 * l2 * c2 + i2
+    m22 = m2 * l2 ** 2 + i2
+    t1 = m11 * qdd[:, 0] + m12 * qdd[:, 1] - h * (2 * qd[:, 0] * qd[:, 1] + qd[:, 1] ** 2) + \
+        GRAVITY * ((m1 + m2) * l1 * c1 + m2 * l2 * c12)
+    t2 = m12 * qdd[:, 0] + m22 * qdd[:, 1] + h * qd[:, 0] ** 2 + GRAVITY * m2 * l2 * c12
+    return np.stack([t1, t2], axis=1)
+
+
+def test_planar_two_link():
+    t1, t2 = symbols("theta_1 theta_2")
+    table = DHTable()
+    table.add(theta=t1, d=0, a=.4, alpha=0).add(theta=t2, d=0, a=.3, alpha=0)
+    links = [LinkInertia(2., inertia=np.diag([0., 0., .05])),
+             LinkInertia(1.5, inertia=np.diag([0., 0., .02]))]
+    dynamics = InverseDynamics(table, links, gravity=(0., -GRAVITY, 0.))
+    generator = np.random.default_rng(0)
+    q, qd, qdd = generator.uniform(-3., 3., (3, 500, 2))
+    expected = planar_torques(q, qd, qdd, (2., 1.5), (.4, .3), (.05, .02))
+    np.testing.assert_allclose(dynamics.torques(q, qd, qdd), expected, atol=1e-10)
+    np.testing.assert_allclose(dynamics.gravity_torques(q),
+                               planar_torques(q, 0 * qd, 0 * qdd, (2., 1.5), (.4, .3),
+                                              (.05, .02)), atol=1e-10)
+
+
+@pytest.fixture
+def spatial():
+    """
+    :return: (table, links) of a spatial arm with a prismatic joint and full inertia
+    tensors.
+    """
+    t1, t2, d3 = symbols("theta_1 theta_2 d_3")
+    table = DHTable()
+    table.add(theta=t1, d=.1, a=.05, alpha=(pi / 2)) \
+         .add(theta=t2, d=.02, a=.3, alpha=0) \
+         .add(theta=(pi / 2), d=d3, a=.05, alpha=(pi / 2))
+    generator = np.random.default_rng(1)
+    links = list()
+    for mass in (3., 2., 1.):
+        root = generator.normal(size=(3, 3)) * .05
+        links.append(LinkInertia(mass, generator.normal(size=3) * .05, root @ root.T))
+    return table, links
+
+
+def test_power_balance(spatial):
+    # The power of the torques is the derivative of the kinetic plus the potential
+    # energy along any trajectory
+    table, links = spatial
+    dynamics = InverseDynamics(table, links, gravity=(0., 0., -GRAVITY))
+    free = InverseDynamics(table, links, gravity=(0., 0., 0.))
+    params = dynamics.params
+    amplitude, frequency, phase = np.array([[1., .8, .2], [1.3, 2.1, .7], [.3, 1., 2.]])
+
+    def trajectory(t):
+        t = np.atleast_1d(t)[:, np.newaxis]
+        return (amplitude * np.sin(frequency * t + phase),
+                amplitude * frequency * np.cos(frequency * t + phase),
+                -amplitude * frequency ** 2 * np.sin(frequency * t + phase))
+
+    def energy(t):
+        q, qd, _ = trajectory(t)
+        # Columns of the mass matrix: the torques of unit accelerations at rest
+        mass_matrix = np.stack([free.torques(q, qdd=np.tile(unit, (len(q), 1)))
+                                for unit in np.eye(3)], axis=-1)
+        kinetic = .5 * np.einsum("ni,nij,nj->n", qd, mass_matrix, qd)
+        frames = chain_frames(params, q)
+        centers = np.stack([frames[:, i, :3, :3] @ link.center + frames[:, i, :3, 3]
+                            for i, link in enumerate(links)], axis=1)
+        potential = GRAVITY * np.einsum("i,ni->n", [link.mass for link in links],
+                                        centers[..., 2])
+        return kinetic + potential
+
+    times = np.linspace(0., 3., 31)
+    step = 1e-5
+    derivative = (energy(times + step) - energy(times - step)) / (2 * step)
+    q, qd, qdd = trajectory(times)
+    power = np.einsum("ni,ni->n", dynamics.torques(q, qd, qdd), qd)
+    np.testing.assert_allclose(power, derivative, rtol=1e-6, atol=1e-6)
+    assert np.abs(power).max() > 1.
+
+
+def test_validation(spatial):
+    table, links = spatial
+    with pytest.raises(ValueError):
+        InverseDynamics(table, links[:2])
+    with pytest.raises(ValueError):
+        LinkInertia(1., center=(0., 0.))
@@ -0,0 +1,89 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from manipulator import BatchExecutor
+from manipulator import Manipulator
+from manipulator.executor import OPERATIONS
+
+UARM_RANGES = [(-np.pi / 2, np.pi / 2), (np.pi / 4, np.pi / 2), (np.pi / 4, 3 * np.pi / 4)]
+
+
+@pytest.fixture
+def model(uarm):
+    table, (t1, t2, t3) = uarm
+    manipulator = Manipulator(table, optimize="none")
+    manipulator.direct_kinematics.set_phi(t2 - t3)
+    manipulator.set_phi('x', t2 - t3)
+    manipulator.set_phi('y', 0)
+    manipulator.set_phi('z', t1)
+    return manipulator.compile()
+
+
+@pytest.fixture
+def executor(model):
+    with BatchExecutor(model, workers=2, chunk_size=50) as executor:
+        yield executor
+
+
+def inputs(model, operation):
+    q = np.random.default_rng(0).uniform(*np.transpose(UARM_RANGES), (403, 3))
+    if operation == "inverse":
+        return model.poses(q)
+    return q
+
+
+@pytest.mark.parametrize("operation", list(OPERATIONS))
+def test_operations(model, executor, operation):
+    values = inputs(model, operation)
+    expected = OPERATIONS[operation][0](model, values)
+    result = executor.run(operation, values, shards=3)
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result, expected, rtol=1e-12, atol=1e-9, equal_nan=True)
+    assert executor.throughput > 0
+    executor.release()
+
+
+def test_memmap_output(model, executor, tmp_path):
+    values = inputs(model, "poses")
+    path = tmp_path / "poses.npy"
+    result = executor.run("poses", values, out=path)
+    assert isinstance(result, np.memmap)
+    np.testing.assert_allclose(np.load(path), model.poses(values), atol=1e-9,
+                               equal_nan=True)
+    # Nothing is kept in shared memory for file outputs
+    assert len(executor._memory) == 0
+
+
+def test_release(model, executor):
+    values = inputs(model, "positions")
+    first = np.array(executor.run("positions", values))
+    executor.run("positions", values[:10])
+    assert len(executor._memory) == 2
+    executor.release()
+    assert len(executor._memory) == 0
+    # The workers are kept and new results are still correct
+    np.testing.assert_array_equal(executor.run("positions", values), first)
+    executor.release()
+
+
+def test_errors(model, executor):
+    with pytest.raises(ValueError):
+        executor.run("hessian", inputs(model, "positions"))
+    # Errors in the workers are raised and the inputs are released
+    with pytest.raises(ValueError):
+        executor.run("positions", np.zeros((10, 2)))
@@ -0,0 +1,96 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import pickle
+
+import numpy as np
+import pytest
+
+from sympy import symbols
+
+from manipulator import DHTable
+from manipulator import Manipulator
+from manipulator.kernels import CompiledExpressions
+
+
+@pytest.fixture
+def uarm_manipulator(uarm):
+    table, (t1, t2, t3) = uarm
+    manipulator = Manipulator(table, optimize="none")
+    manipulator.set_phi('x', t2 - t3)
+    manipulator.set_phi('y', 0)
+    manipulator.set_phi('z', t1)
+    return manipulator
+
+
+@pytest.fixture
+def q():
+    return np.random.default_rng(0).uniform(-np.pi, np.pi, (300, 3))
+
+
+def test_fused_matches_separate(uarm_manipulator, q):
+    kernel = uarm_manipulator.kernel()
+    pose, jacobian, det = kernel(q)
+    expected = kernel.separate(q)
+    assert pose.shape == (300, 6) and jacobian.shape == (300, 6, 3) and det.shape == (300,)
+    for value, reference in zip((pose, jacobian, det), expected):
+        np.testing.assert_allclose(value, reference, rtol=1e-12, atol=1e-9)
+    # And with the direct kinematics and the determinant of the Jacobian
+    np.testing.assert_allclose(pose[:, :3],
+                               uarm_manipulator.direct_kinematics.poses(q)[:, :3],
+                               atol=1e-9)
+    np.testing.assert_allclose(det, np.linalg.det(jacobian[:, :3]), rtol=1e-9, atol=1e-6)
+
+
+def test_not_square(q):
+    # A planar arm has a 3x2 upper Jacobian, without determinant
+    t1, t2 = symbols("theta_1 theta_2")
+    table = DHTable()
+    table.add(theta=t1, d=0, a=100, alpha=0) \
+         .add(theta=t2, d=0, a=60, alpha=0) \
+         .add(theta=0, d=0, a=20, alpha=0)
+    manipulator = Manipulator(table, optimize="none")
+    manipulator.set_phi('x', 0)
+    manipulator.set_phi('y', 0)
+    manipulator.set_phi('z', t1 + t2)
+    kernel = manipulator.kernel()
+    pose, jacobian, det = kernel(q[:, :2])
+    assert det is None and kernel.separate(q[:, :2])[2] is None
+    assert jacobian.shape == (300, 6, 2)
+    np.testing.assert_allclose(jacobian, kernel.separate(q[:, :2])[1], rtol=1e-12,
+                               atol=1e-9)
+    np.testing.assert_allclose(pose[:, 0], 100 * np.cos(q[:, 0]) +
+                               80 * np.cos(q[:, 0] + q[:, 1]), atol=1e-9)
+
+
+def test_measure_speedup(uarm_manipulator, q):
+    kernel = uarm_manipulator.kernel()
+    speedup = kernel.measure_speedup(q, repeat=3)
+    assert np.isfinite(speedup) and speedup > 0
+    # The separate evaluators are compiled once, before measuring
+    evaluators = kernel._separate
+    assert len(evaluators) == 3
+    kernel.measure_speedup(q[:10], repeat=1)
+    assert kernel._separate is evaluators
+
+
+def test_compiled_expressions(uarm):
+    _, (t1, t2, _) = uarm
+    evaluator = CompiledExpressions([t1, t2], [t1 * t2, t1 ** 0.5])
+    values = evaluator(np.array([[2., 3.], [-4., 1.]]))
+    np.testing.assert_allclose(values[:, 0], [6., -4.])
+    assert values[0, 1] == pytest.approx(np.sqrt(2.)) and np.isnan(values[1, 1])
+    copy = pickle.loads(pickle.dumps(evaluator))
+    np.testing.assert_array_equal(copy(np.array([[2., 3.]])), values[:1])
@@ -0,0 +1,116 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from sympy import symbols
+
+from manipulator import DHTable
+from manipulator import Manipulator
+from manipulator.numeric import chain_frames
+from manipulator.numeric import geometric_jacobian
+
+
+@pytest.fixture
+def coupled():
+    """
+    :return: a planar table whose first joint is geared (theta = 2 * theta_1).
+    """
+    t1, t2, t3 = symbols("theta_1 theta_2 theta_3")
+    table = DHTable()
+    table.add(theta=2 * t1, d=0, a=100, alpha=0) \
+         .add(theta=t2, d=0, a=50, alpha=0) \
+         .add(theta=t3, d=0, a=25, alpha=0)
+    return table, (t1, t2, t3)
+
+
+def test_symbolic_only_table_builds(coupled):
+    table, (t1, t2, t3) = coupled
+    manipulator = Manipulator(table, optimize="none")
+    x, y, _, _ = manipulator.point({t1: 0.25, t2: 0., t3: 0.})
+    assert float(x) == pytest.approx(175 * np.cos(0.5))
+    assert float(y) == pytest.approx(175 * np.sin(0.5))
+    assert table.fingerprint() != DHTable().fingerprint()
+
+
+def test_numeric_paths_need_a_compact_table(coupled):
+    table, _ = coupled
+    manipulator = Manipulator(table, optimize="none")
+    with pytest.raises(ValueError):
+        manipulator.frames(np.zeros((1, 3)))
+
+
+def test_frames_match_the_matrices(uarm):
+    table, (t1, t2, t3) = uarm
+    manipulator = Manipulator(table, optimize="none")
+    q = [0.3, -0.7, 1.1]
+    expected = manipulator.point(dict(zip((t1, t2, t3), q)))
+    position = manipulator.frames(np.array([q]), positions_only=True)[0, -1]
+    assert position == pytest.approx([float(value) for value in expected[:3]])
+
+
+@pytest.fixture
+def mixed_chain():
+    """
+    :return: a 12-joint table that cycles through revolute, prismatic, variable
+    'a' and variable "alpha" joints, some of them with offsets.
+    """
+    generator = np.random.default_rng(0)
+    table = DHTable()
+    for i, joint in enumerate(symbols("q_1:13")):
+        values = {"theta": generator.uniform(-np.pi, np.pi),
+                  'd': generator.uniform(0, 50),
+                  'a': generator.uniform(0, 80),
+                  "alpha": generator.uniform(-np.pi, np.pi)}
+        key = ("theta", 'd', 'a', "alpha")[i % 4]
+        values[key] = joint + (0.3 if i % 3 == 0 else 0)
+        table.add(check_attrs=False, **values)
+    table.Tx, table.Ty, table.Tz = 10., -5., 3.
+    return table.compact()
+
+
+def test_geometric_jacobian_matches_finite_differences(mixed_chain):
+    q = np.random.default_rng(1).uniform(-1, 1, (20, 12))
+    jacobian = geometric_jacobian(mixed_chain, q)
+    assert jacobian.shape == (20, 6, 12)
+    step = 1e-6
+    for joint in range(12):
+        delta = np.zeros(12)
+        delta[joint] = step
+        after = chain_frames(mixed_chain, q + delta)[:, -1]
+        before = chain_frames(mixed_chain, q - delta)[:, -1]
+        linear = (after[:, :3, 3] - before[:, :3, 3]) / (2 * step)
+        np.testing.assert_allclose(jacobian[:, :3, joint], linear, atol=1e-5)
+        # The angular velocity is the axial vector of R' R^T
+        rotation = chain_frames(mixed_chain, q)[:, -1, :3, :3]
+        derivative = (after[:, :3, :3] - before[:, :3, :3]) / (2 * step)
+        skew = derivative @ rotation.transpose(0, 2, 1)
+        angular = np.stack([skew[:, 2, 1], skew[:, 0, 2], skew[:, 1, 0]], axis=1)
+        np.testing.assert_allclose(jacobian[:, 3:, joint], angular, atol=1e-6)
+
+
+def test_geometric_jacobian_matches_symbolic(uarm):
+    # The linear rows are the same for both; the angular ones differ, as the
+    # symbolic Jacobian differentiates phi
+    table, (t1, t2, t3) = uarm
+    manipulator = Manipulator(table, optimize="none")
+    manipulator.set_phi('x', t2 - t3)
+    manipulator.set_phi('y', 0)
+    manipulator.set_phi('z', t1)
+    model = manipulator.compile()
+    q = np.random.default_rng(2).uniform(-np.pi, np.pi, (100, 3))
+    np.testing.assert_allclose(model.geometric_jacobian(q)[:, :3],
+                               model.jacobian(q)[:, :3], atol=1e-9)
@@ -0,0 +1,59 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from manipulator import Manipulator
+from manipulator import linearize
+from manipulator.numeric import chain_frames
+
+
+@pytest.fixture
+def uarm_manipulator(uarm):
+    table, _ = uarm
+    return Manipulator(table, optimize="none")
+
+
+def interpolate(path, samples=50):
+    """
+    :return: the joint values along the linear interpolation of the waypoints.
+    """
+    fractions = np.linspace(0., 1., samples)[:, np.newaxis]
+    return np.concatenate([q0 + fractions * (q1 - q0)
+                           for q0, q1 in zip(path.q[:-1], path.q[1:])])
+
+
+def test_straight_line(uarm_manipulator):
+    params = uarm_manipulator.direct_kinematics.compact_params
+    points = np.array([[200., -80., 100., 0.], [200., 80., 100., 0.]])
+    path = linearize(params, uarm_manipulator.uarm_ik.compile(), points, tolerance=.1)
+    assert path.converged
+    assert path.max_error <= .1
+    np.testing.assert_allclose(path.points[[0, -1]], points)
+
+
+def test_branch_cut(uarm_manipulator):
+    # Behind the base theta_1 = atan2(Y, X - Tx) jumps from pi to -pi
+    params = uarm_manipulator.direct_kinematics.compact_params
+    points = np.array([[-200., 40., 100., 0.], [-200., -40., 100., 0.]])
+    path = linearize(params, uarm_manipulator.uarm_ik.compile(), points, tolerance=.1)
+    assert path.converged
+    assert path.max_error <= .1
+    assert np.abs(np.diff(path.q, axis=0)).max() < np.pi
+    # The interpolated joints stay near the line: it is 80 long at X = -200
+    positions = chain_frames(params, interpolate(path), positions_only=True)[:, -1]
+    np.testing.assert_allclose(positions[:, 0], -200., atol=.5)
+    np.testing.assert_allclose(positions[:, 2], 100., atol=.5)
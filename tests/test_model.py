@@ -0,0 +1,129 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import pickle
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from sympy import Matrix
+
+from manipulator import Manipulator
+
+
+@pytest.fixture
+def uarm_manipulator(uarm):
+    table, (t1, t2, t3) = uarm
+    manipulator = Manipulator(table, optimize="none")
+    manipulator.direct_kinematics.set_phi(t2 - t3)
+    manipulator.set_phi('x', t2 - t3)
+    manipulator.set_phi('y', 0)
+    manipulator.set_phi('z', t1)
+    return manipulator
+
+
+@pytest.fixture
+def q():
+    return np.random.default_rng(0).uniform(-np.pi, np.pi, (200, 3))
+
+
+def test_immutable(uarm_manipulator):
+    model = uarm_manipulator.compile()
+    with pytest.raises(AttributeError):
+        model.params = None
+    with pytest.raises(AttributeError):
+        del model.symbols
+
+
+def test_snapshot(uarm, uarm_manipulator, q):
+    _, (t1, _, _) = uarm
+    model = uarm_manipulator.compile()
+    expected = model.jacobian(q)
+    uarm_manipulator.set_phi('x', t1)
+    np.testing.assert_array_equal(model.jacobian(q), expected)
+
+
+def test_pickle(uarm_manipulator, q):
+    model = uarm_manipulator.compile(derivatives=True)
+    copy = pickle.loads(pickle.dumps(model))
+    assert copy.fingerprint == model.fingerprint
+    np.testing.assert_array_equal(copy.poses(q), model.poses(q))
+    for expected, value in zip(model.evaluate(q), copy.evaluate(q)):
+        np.testing.assert_array_equal(value, expected)
+    np.testing.assert_array_equal(copy.hessian(q), model.hessian(q))
+
+
+def test_threads(uarm_manipulator, q):
+    model = uarm_manipulator.compile()
+    chunks = np.array_split(np.repeat(q, 20, axis=0), 64)
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(model.evaluate, chunks))
+    for chunk, (pose, jacobian, det) in zip(chunks, results):
+        expected = model.evaluate(chunk)
+        np.testing.assert_array_equal(pose, expected[0])
+        np.testing.assert_array_equal(jacobian, expected[1])
+        np.testing.assert_array_equal(det, expected[2])
+
+
+def test_without_phi(uarm, q):
+    table, _ = uarm
+    model = Manipulator(table, optimize="none").compile(derivatives=True)
+    assert np.all(np.isfinite(model.poses(q)[:, :3]))
+    with pytest.raises(ValueError, match="set phi"):
+        model.jacobian(q)
+    with pytest.raises(ValueError, match="derivatives"):
+        model.hessian(q)
+
+
+def test_derivative_failures_are_raised(uarm_manipulator, monkeypatch):
+    def fail(subs=None):
+        raise ValueError("derivation failed")
+
+    monkeypatch.setattr(uarm_manipulator.inverse_kinematics, "derivatives", fail)
+    with pytest.raises(ValueError, match="derivation failed"):
+        uarm_manipulator.compile(derivatives=True)
+    assert uarm_manipulator.compile().jacobian(np.zeros((1, 3))).shape == (1, 6, 3)
+
+
+def test_jacobian_derivative(uarm_manipulator, q):
+    # J' = H q' matches the central difference of J along q'
+    model = uarm_manipulator.compile(derivatives=True)
+    qd = np.random.default_rng(1).normal(size=q.shape)
+    step = 1e-6
+    expected = (model.jacobian(q + step * qd) - model.jacobian(q - step * qd)) / (2 * step)
+    np.testing.assert_allclose(model.jacobian_derivative(q, qd), expected, rtol=1e-5,
+                               atol=1e-5)
+    np.testing.assert_allclose(np.einsum("nijk,nk->nij", model.hessian(q), qd), expected,
+                               rtol=1e-5, atol=1e-5)
+
+
+def test_jacobian_derived_once(uarm_manipulator, monkeypatch):
+    # The kernel, the Hessian and the derivative kernel share one derivation
+    calls = list()
+    derive = Matrix.jacobian
+
+    def counted(matrix, subs):
+        calls.append(tuple(subs))
+        return derive(matrix, subs)
+
+    monkeypatch.setattr(Matrix, "jacobian", counted)
+    uarm_manipulator.compile(derivatives=True)
+    assert len(calls) == 1
+    t1 = uarm_manipulator.params.symbols[0]
+    uarm_manipulator.set_phi('z', 2 * t1)
+    uarm_manipulator.compile(derivatives=True)
+    assert len(calls) == 2
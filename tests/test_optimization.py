@@ -0,0 +1,151 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from sympy import Matrix
+from sympy import cos
+from sympy import symbols
+
+from manipulator import ExpressionBudget
+from manipulator import ExpressionBudgetWarning
+from manipulator import Manipulator
+from manipulator import Optimization
+from manipulator import expression_stats
+from manipulator.manipulator import ForwardKinematics
+from manipulator.optimization import apply_optimization
+
+
+def test_default_model_is_fully_optimized(uarm):
+    table, (t1, t2, t3) = uarm
+    forward_kinematics = ForwardKinematics(table)
+    assert forward_kinematics.report.level is Optimization.FULL
+    x, y, z, _ = forward_kinematics.point({t1: 0, t2: 0, t3: 0})
+    assert float(x) == pytest.approx(13.2 + 142 + 158.9 + 44.5)
+    assert float(y) == pytest.approx(0.)
+    assert float(z) == pytest.approx(106.1 - 13.2)
+
+
+@pytest.mark.parametrize("level", list(Optimization))
+def test_levels_agree(uarm, level):
+    table, (t1, t2, t3) = uarm
+    reference = ForwardKinematics(table, Optimization.NONE)
+    forward_kinematics = ForwardKinematics(table, level)
+    subs = {t1: 0.3, t2: -0.7, t3: 1.1}
+    assert [float(value) for value in forward_kinematics.point(subs)[:3]] == \
+        pytest.approx([float(value) for value in reference.point(subs)[:3]])
+
+
+def test_full_optimization_keeps_matrices_mutable(uarm):
+    _, (t1, _, _) = uarm
+    matrix = apply_optimization(Matrix([[t1 + t1]]), Optimization.FULL)
+    matrix[0, 0] += 1
+    assert matrix[0, 0] == 2 * t1 + 1
+
+
+def test_parse():
+    assert Optimization.parse(True) is Optimization.FULL
+    assert Optimization.parse(False) is Optimization.NONE
+    assert Optimization.parse("Trig") is Optimization.TRIG
+    assert Optimization.parse("cse") is Optimization.CSE
+    with pytest.raises(ValueError):
+        Optimization.parse("fast")
+
+
+def test_cse_level_reports_reduced_sizes(uarm):
+    table, (t1, t2, t3) = uarm
+    none = Manipulator(table, Optimization.NONE)
+    reduced = Manipulator(table, Optimization.CSE)
+    reports = none.direct_kinematics.report, reduced.direct_kinematics.report
+    assert set(reports[1].subexpressions) == set(reports[1].sizes)
+    assert reports[1].sizes["A03"] < reports[0].sizes["A03"]
+    # The reduced form evaluates to the same matrix
+    replacements, entries = reports[1].subexpressions["A03"]
+    subs = {t1: 0.3, t2: -0.7, t3: 1.1}
+    for symbol, value in replacements:
+        subs[symbol] = value.subs(subs)
+    expected = reduced.direct_kinematics["A03"].subs(subs)
+    assert [float(entry.subs(subs)) for entry in entries] == \
+        pytest.approx([float(value) for value in expected])
+
+    for manipulator in (none, reduced):
+        manipulator.set_phi('x', t2 - t3)
+        manipulator.set_phi('y', 0)
+        manipulator.set_phi('z', t1)
+        manipulator.jacobian(optimize=manipulator.direct_kinematics.report.level)
+    reports = none.inverse_kinematics.report, reduced.inverse_kinematics.report
+    assert set(reports[1].subexpressions) == {"jacobian", "det", "inverse"}
+    assert reports[1].total_size < reports[0].total_size
+
+
+def test_expression_stats():
+    x, y, z = symbols("x y z")
+    shared = cos(x) * y
+    stats = expression_stats(Matrix([[x + y, shared + z, shared * z]]), "m")
+    assert stats.shape == (1, 3)
+    assert stats.operations.tolist() == [[1, 3, 3]]
+    assert stats.max_depth == 4
+    # cos(x) * y is stored once: x, y, z, cos(x), shared, and the three entries
+    assert stats.nodes == 8
+    assert stats.memory > 0
+    assert "m: 1x3 - 7 operations" in str(stats)
+
+
+def test_budget_limits():
+    with pytest.raises(ValueError):
+        ExpressionBudget(action="fail")
+    x, y = symbols("x y")
+    stats = expression_stats(Matrix([[x * y + x]]))
+    assert ExpressionBudget(max_operations=2).exceeded(stats) == []
+    assert len(ExpressionBudget(max_operations=1, max_depth=1).exceeded(stats)) == 2
+    with pytest.warns(ExpressionBudgetWarning):
+        assert not ExpressionBudget(max_operations=1).check(x * y + x, "e")
+
+
+def test_numeric_only_forward_kinematics(uarm, monkeypatch):
+    table, (t1, t2, t3) = uarm
+    reference = Manipulator(table, Optimization.NONE)
+    optimized = list()
+    monkeypatch.setattr("manipulator.manipulator.apply_optimization",
+                        lambda expression, level: optimized.append(expression))
+    # A02 has 35 operations before it is simplified: it is never simplified
+    with pytest.warns(ExpressionBudgetWarning, match="A02"):
+        manipulator = Manipulator(table, Optimization.FULL,
+                                  ExpressionBudget(max_operations=20, action="numeric"))
+    assert optimized == []
+    assert manipulator.numeric_only
+    assert set(manipulator.direct_kinematics.report.stats) == {"A01", "A02"}
+    q = np.array([[0.3, 1.1, 0.9]])
+    np.testing.assert_allclose(manipulator.direct_kinematics.poses(q)[:, :3],
+                               reference.direct_kinematics.poses(q)[:, :3])
+    with pytest.raises(ValueError, match="numeric-only"):
+        manipulator.jacobian()
+
+
+@pytest.mark.parametrize("limit, exceeded", [(150, "det"), (500, "inverse")])
+def test_budget_keeps_jacobian(uarm, limit, exceeded):
+    table, (t1, t2, t3) = uarm
+    manipulator = Manipulator(table, Optimization.NONE,
+                              ExpressionBudget(max_operations=limit, action="numeric"))
+    manipulator.set_phi('x', t2 - t3)
+    manipulator.set_phi('y', 0)
+    manipulator.set_phi('z', t1)
+    with pytest.warns(ExpressionBudgetWarning, match=exceeded):
+        jacobian = manipulator.jacobian(optimize=Optimization.NONE)
+    assert jacobian is not None
+    assert not manipulator.numeric_only
+    assert manipulator.inverse is None
+    assert list(manipulator.inverse_kinematics.report.stats)[-1] == exceeded
@@ -0,0 +1,160 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from manipulator import Manipulator
+from manipulator import PosePipeline
+
+
+class Interrupted(BaseException):
+    pass
+
+
+@pytest.fixture
+def uarm_manipulator(uarm):
+    table, (t1, t2, t3) = uarm
+    manipulator = Manipulator(table, optimize="none")
+    manipulator.direct_kinematics.set_phi(t2 - t3)
+    manipulator.set_phi('x', t2 - t3)
+    manipulator.set_phi('y', 0)
+    manipulator.set_phi('z', t1)
+    return manipulator
+
+
+@pytest.fixture
+def readings():
+    return np.random.default_rng(0).uniform(-np.pi, np.pi, (500, 3))
+
+
+def collect(pipeline, readings):
+    async def source():
+        for reading in readings:
+            yield reading
+
+    async def run():
+        return [batch async for batch in pipeline.aprocess(source())]
+
+    return asyncio.run(run())
+
+
+def test_sync_and_async_agree(uarm_manipulator, readings):
+    pipeline = PosePipeline(uarm_manipulator.direct_kinematics,
+                            uarm_manipulator.kernel(), batch_size=32, max_delay=1.)
+    expected = uarm_manipulator.direct_kinematics.poses(readings)
+    jacobian = uarm_manipulator.kernel()(readings)[1]
+    for batches in (list(pipeline.process(iter(readings))), collect(pipeline, readings)):
+        assert all(len(batch) <= 32 for batch in batches)
+        np.testing.assert_array_equal(np.concatenate([batch.q for batch in batches]),
+                                      readings)
+        np.testing.assert_allclose(np.concatenate([batch.poses for batch in batches]),
+                                   expected, atol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(np.concatenate([batch.jacobian for batch in batches]),
+                                   jacobian, atol=1e-9)
+    assert pipeline.stats.readings == 1000
+    assert pipeline.stats.summary()["batches"] == pipeline.stats.batches
+
+
+def test_batches_wait_max_delay(uarm_manipulator, readings):
+    # A pause in the source delivers the pending readings after "max_delay",
+    # without waiting for the batch to fill
+    pipeline = PosePipeline(uarm_manipulator.direct_kinematics, batch_size=64,
+                            max_delay=.02)
+
+    def source():
+        yield from readings[:3]
+        time.sleep(.3)
+        yield from readings[3:5]
+
+    async def asource():
+        for reading in readings[:3]:
+            yield reading
+        await asyncio.sleep(.3)
+        for reading in readings[3:5]:
+            yield reading
+
+    async def run():
+        return [batch async for batch in pipeline.aprocess(asource())]
+
+    assert [len(batch) for batch in pipeline.process(source())] == [3, 2]
+    assert [len(batch) for batch in asyncio.run(run())] == [3, 2]
+    assert np.all(pipeline.stats.recent("batch") < .25)
+
+
+def test_backpressure(uarm_manipulator):
+    # A slow consumer stops the reader once the queue is full
+    pulled = 0
+
+    def source():
+        nonlocal pulled
+        while True:
+            pulled += 1
+            yield (0., 0., 0.)
+
+    pipeline = PosePipeline(uarm_manipulator.direct_kinematics, batch_size=4,
+                            max_delay=.01, queue_size=8)
+    batches = pipeline.process(source())
+    next(batches)
+    time.sleep(.2)
+    # The queue, the batch being consumed, the reading waiting to be queued and,
+    # for the async reader, the pending "get"
+    limit = 8 + 4 + 2
+    assert pulled <= limit
+    batches.close()
+
+    async def asource():
+        nonlocal pulled
+        while True:
+            pulled += 1
+            yield (0., 0., 0.)
+
+    async def run():
+        batches = pipeline.aprocess(asource())
+        await batches.__anext__()
+        await asyncio.sleep(.2)
+        count = pulled
+        await batches.aclose()
+        return count
+
+    pulled = 0
+    assert asyncio.run(run()) <= limit
+
+
+@pytest.mark.parametrize("error", [ValueError, Interrupted])
+def test_errors(uarm_manipulator, readings, error):
+    # Any error of the source, also those that are not an "Exception", reaches
+    # the consumer in both modes
+    pipeline = PosePipeline(uarm_manipulator.direct_kinematics, batch_size=4)
+
+    def source():
+        yield from readings[:10]
+        raise error("sensor lost")
+
+    async def asource():
+        for reading in readings[:10]:
+            yield reading
+        raise error("sensor lost")
+
+    async def run():
+        return [batch async for batch in pipeline.aprocess(asource())]
+
+    with pytest.raises(error):
+        list(pipeline.process(source()))
+    with pytest.raises(error):
+        asyncio.run(run())
@@ -0,0 +1,82 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from manipulator import ExpressionBudget
+from manipulator import ExpressionBudgetWarning
+from manipulator import ModelRegistry
+
+
+def test_manipulators_are_copies(uarm):
+    table, (_, t2, t3) = uarm
+    registry = ModelRegistry()
+    first = registry.manipulator(table, phi_e=t2 - t3, optimize="none")
+    first.direct_kinematics.set_phi(0)
+    second = registry.manipulator(table, phi_e=t2 - t3, optimize="none")
+    assert second is not first
+    assert second.direct_kinematics.phi_e == t2 - t3
+    assert registry.stats()["misses"] == 1
+    assert registry.stats()["hits"] == 1
+
+
+def test_compiled_is_shared(uarm):
+    table, (t1, t2, t3) = uarm
+    registry = ModelRegistry()
+    phi = {'x': t2 - t3, 'y': 0, 'z': t1}
+    model = registry.compiled(table, phi, t2 - t3, optimize="none")
+    assert registry.compiled(table, phi, t2 - t3, optimize="none") is model
+    q = np.array([[0., np.pi / 3, np.pi / 2]])
+    manipulator = registry.manipulator(table, phi, t2 - t3, optimize="none")
+    np.testing.assert_allclose(model.poses(q), manipulator.direct_kinematics.poses(q))
+
+
+def test_failed_build_can_be_retried():
+    registry = ModelRegistry()
+    calls = list()
+
+    def build():
+        calls.append(None)
+        if len(calls) == 1:
+            raise RuntimeError("derivation failed")
+        return "model"
+
+    with pytest.raises(RuntimeError):
+        registry._get("key", build)
+    assert not registry._building
+    assert registry._get("key", build) == "model"
+    assert len(calls) == 2
+
+
+def test_budget_is_part_of_the_key(uarm):
+    table, (t1, t2, t3) = uarm
+    registry = ModelRegistry()
+    budget = ExpressionBudget(max_operations=1, action="numeric")
+    with pytest.warns(ExpressionBudgetWarning):
+        numeric = registry.manipulator(table, phi_e=t2 - t3, optimize="none",
+                                       budget=budget)
+    assert numeric.numeric_only
+    assert not registry.manipulator(table, phi_e=t2 - t3, optimize="none").numeric_only
+    assert registry.stats()["misses"] == 2
+
+    # Only the base frames can be evaluated without the matrices
+    subs = {t1: 0., t2: np.pi / 3, t3: np.pi / 2}
+    x, y, z, phi = numeric.point(subs, "A02")
+    assert np.isfinite([x, y, z]).all()
+    with pytest.raises(ValueError):
+        numeric.point(subs, "A12")
+    with pytest.raises(ValueError):
+        numeric.point(subs, "A04")
@@ -0,0 +1,90 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import pytest
+
+from manipulator import CommandSender
+from manipulator import SimulatedSerial
+from manipulator import SimulatedSwiftPro
+
+
+class LossyPort:
+    """
+    Wraps a port, dropping the replies to some commands and injecting a malformed
+    line before the first reply.
+    """
+
+    def __init__(self, port: SimulatedSerial, lost: set):
+        self.port = port
+        self.lost = lost
+        self.injected = False
+
+    def write(self, data: bytes) -> int:
+        return self.port.write(data)
+
+    def readline(self) -> bytes:
+        if not self.injected:
+            self.injected = True
+            return b"$x ok\n"
+        while True:
+            reply = self.port.readline()
+            number = reply[1:].split(b' ')[0]
+            if not reply or int(number) not in self.lost:
+                return reply
+
+
+@pytest.fixture
+def serial(uarm):
+    table, _ = uarm
+    port = SimulatedSerial(SimulatedSwiftPro(table, speed_limits=1e3), timeout=.02)
+    yield port
+    port.close()
+
+
+def test_pipelined_commands(serial):
+    sender = CommandSender(serial, window=4)
+    stats = sender.send_all(["P2200", "G2202 N0 V10", "M2200", "P2220", "G7"] * 4)
+    assert stats.commands == 20
+    assert len(stats.latencies) == 20
+    assert stats.errors == 4
+    assert stats.timeouts == 0
+    assert sender.replies[5].startswith("E20")
+
+
+def test_lost_and_malformed_replies(serial):
+    sender = CommandSender(LossyPort(serial, {2, 5}), window=3, timeout=.1)
+    stats = sender.send_all(["P2200"] * 8)
+    assert stats.commands == 8
+    assert stats.timeouts == 2
+    assert stats.errors == 2
+    assert len(stats.latencies) == 6
+    assert sorted(sender.replies) == [1, 3, 4, 6, 7, 8]
+
+
+def test_arguments_without_integer_part(uarm):
+    # ".5" and "-.5" are valid numbers, as in "G2202 N1 V-.5"
+    table, _ = uarm
+    now = [0.]
+
+    def wait(seconds):
+        now[0] += seconds
+
+    device = SimulatedSwiftPro(table, clock=lambda: now[0], wait=wait)
+    assert device.handle("#1 G2202 N1 V-.5") == "$1 ok"
+    assert device.handle("#2 G2202 N2 V.25") == "$2 ok"
+    assert device.handle("#3 G2202 N0 V12.") == "$3 ok"
+    now[0] += 1.
+    assert device.handle("#4 P2200") == "$4 ok J1=12.0000 J2=-0.5000 J3=0.2500"
+    assert device.handle("#5 G2202 N0 V-") == "$5 E21"
@@ -0,0 +1,94 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from sympy import pi
+from sympy import symbols
+
+from manipulator import DHTable
+from manipulator import GravityLoad
+from manipulator import GravityMap
+from manipulator import InverseDynamics
+from manipulator import LinkInertia
+
+
+@pytest.fixture
+def arm():
+    """
+    :return: (table, links) of a spatial arm with a prismatic joint.
+    """
+    t1, t2, d3 = symbols("theta_1 theta_2 d_3")
+    table = DHTable()
+    table.add(theta=t1, d=.1, a=.05, alpha=(pi / 2)) \
+         .add(theta=t2, d=.02, a=.3, alpha=0) \
+         .add(theta=(pi / 2), d=d3, a=.05, alpha=(pi / 2))
+    links = [LinkInertia(3., (.01, -.02, .03)),
+             LinkInertia(2., (-.15, 0., .01)),
+             LinkInertia(1., (0., .02, -.04))]
+    return table, links
+
+
+@pytest.fixture
+def q():
+    return np.random.default_rng(0).uniform(-2., 2., (300, 3))
+
+
+def test_matches_inverse_dynamics(arm, q):
+    table, links = arm
+    gravity = (.5, -1., -9.81)
+    expected = InverseDynamics(table, links, gravity).gravity_torques(q)
+    np.testing.assert_allclose(GravityLoad(table, links, gravity).torques(q), expected,
+                               atol=1e-12)
+
+
+def test_end_effector_offset(uarm, q):
+    # The links hang from the DH frames: the tool offset does not move them
+    table, _ = uarm
+    links = [LinkInertia(.5, (0., 0., .02)), LinkInertia(.3, (-.07, 0., 0.)),
+             LinkInertia(.2, (-.08, 0., 0.))]
+    expected = InverseDynamics(table, links).gravity_torques(q)
+    np.testing.assert_allclose(GravityLoad(table, links).torques(q), expected,
+                               atol=1e-9)
+
+
+def test_payload(arm, q):
+    # A payload is a point mass added to the last link
+    table, links = arm
+    payload, center = .8, np.array([.02, .01, .05])
+    last = links[-1]
+    mass = last.mass + payload
+    heavier = links[:-1] + [LinkInertia(mass, (last.mass * last.center +
+                                               payload * center) / mass)]
+    expected = InverseDynamics(table, heavier).gravity_torques(q)
+    load = GravityLoad(table, links, payload_center=center)
+    np.testing.assert_allclose(load.torques(q, payload), expected, atol=1e-12)
+    np.testing.assert_allclose(load.map(q, payload, chunk_size=64), expected, atol=1e-12)
+
+
+def test_grid(arm, tmp_path):
+    table, links = arm
+    load = GravityLoad(table, links)
+    ranges = [(-1., 1., 5), (0., 2., 4), (-.1, .1, 3)]
+    in_memory = load.grid(ranges, chunk_size=7)
+    on_disk = load.grid(ranges, chunk_size=7, path=tmp_path / "torques.npy")
+    np.testing.assert_array_equal(np.asarray(on_disk.torques), in_memory.torques)
+    nodes = np.array([[-1., 0., .1], [.5, 2. / 3., 0.]])
+    np.testing.assert_allclose(in_memory.lookup(nodes + 1e-3), load.torques(nodes))
+    in_memory.save(tmp_path / "map.npz")
+    loaded = GravityMap.load(tmp_path / "map.npz")
+    np.testing.assert_array_equal(loaded.torques, in_memory.torques)
+    np.testing.assert_array_equal(loaded.max_abs(), in_memory.max_abs())
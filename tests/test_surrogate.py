@@ -0,0 +1,89 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from manipulator import Manipulator
+from manipulator import PolynomialSurrogate
+from manipulator import fit_surrogate
+from manipulator import forward_surrogate
+from manipulator.surrogate import _chebyshev
+from manipulator.surrogate import _products
+
+UARM_RANGES = [(-np.pi / 2, np.pi / 2), (np.pi / 4, np.pi / 2), (np.pi / 4, 3 * np.pi / 4)]
+
+
+@pytest.fixture
+def uarm_manipulator(uarm):
+    table, (_, t2, t3) = uarm
+    manipulator = Manipulator(table, optimize="none")
+    manipulator.direct_kinematics.set_phi(t2 - t3)
+    return manipulator
+
+
+def test_evaluation_matches_basis():
+    generator = np.random.default_rng(0)
+    exponents = np.array([[0, 0, 0], [1, 0, 2], [0, 3, 1], [2, 2, 0], [0, 0, 4]])
+    coefficients = generator.normal(size=(len(exponents), 2))
+    surrogate = PolynomialSurrogate([-1., 0., 2.], [1., 3., 5.], exponents, coefficients)
+    x = generator.uniform([-1., 0., 2.], [1., 3., 5.], (1000, 3))
+    expected = _products(_chebyshev(surrogate._scale(x), 4), exponents) @ coefficients
+    np.testing.assert_allclose(surrogate(x), expected, atol=1e-12)
+    # Chunks that do not divide the inputs, and inputs of degree zero
+    np.testing.assert_allclose(surrogate(x, chunk_size=77), expected, atol=1e-12)
+    constant = PolynomialSurrogate([0., 0.], [1., 1.], [[0, 0]], [[2.5]])
+    np.testing.assert_array_equal(constant(generator.uniform(size=(10, 2))),
+                                  np.full((10, 1), 2.5))
+    assert surrogate(np.empty((0, 3))).shape == (0, 2)
+
+
+def test_fit_polynomial_is_exact():
+    def function(x):
+        return np.stack([x[:, 0] ** 2 * x[:, 1], 3. - x[:, 1] ** 3], axis=1)
+
+    surrogate = fit_surrogate(function, [(-2., 1.), (0., 4.)], degree=3, seed=0,
+                              validation=1000)
+    assert surrogate.validation_size == 1000
+    assert np.all(surrogate.validation_max_error < 1e-9)
+    assert np.all(surrogate.validation_rms_error <= surrogate.validation_max_error)
+    assert np.all(np.isnan(surrogate(np.array([[1.5, 1.], [0., -1.]]))))
+
+
+def test_tensor_degrees(uarm_manipulator):
+    # A low degree per joint is cheaper to evaluate than a high total degree
+    surrogate = forward_surrogate(uarm_manipulator, UARM_RANGES, degree=(6, 5, 5),
+                                  total_degree=False, seed=0, validation=5000)
+    assert len(surrogate.exponents) == 7 * 6 * 6
+    assert np.all(surrogate.validation_max_error < .1)
+
+
+def test_forward_surrogate(uarm_manipulator, tmp_path):
+    surrogate = forward_surrogate(uarm_manipulator, UARM_RANGES, seed=0,
+                                  validation=5000)
+    assert surrogate.outputs == 4
+    assert np.all(surrogate.validation_max_error < .1)
+    q = np.random.default_rng(1).uniform(*np.transpose(UARM_RANGES), (500, 3))
+    expected = uarm_manipulator.direct_kinematics.poses(q)[:, :4]
+    assert np.abs(surrogate(q) - expected).max() < .1
+    assert "validation max" in str(surrogate)
+
+    path = tmp_path / "surrogate.npz"
+    surrogate.save(path)
+    loaded = PolynomialSurrogate.load(path)
+    np.testing.assert_array_equal(loaded(q), surrogate(q))
+    np.testing.assert_array_equal(loaded.validation_max_error,
+                                  surrogate.validation_max_error)
+
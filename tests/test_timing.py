@@ -0,0 +1,125 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from manipulator import time_optimal
+
+VELOCITY = np.array([1., 1.2, .8])
+ACCELERATION = np.array([2., 3., 2.5])
+
+
+@pytest.fixture
+def path():
+    s = np.linspace(0., 1., 2001)
+    return np.stack([np.sin(3 * s) + s, .5 * np.cos(2 * s), s ** 2], axis=1)
+
+
+def sequential(q, velocity, acceleration):
+    """
+    Reference solution, sample by sample: the largest feasible u of each sample
+    by bisection, then the forward and backward integrations.
+    """
+    steps = np.linalg.norm(np.diff(q, axis=0), axis=1)
+    s = np.concatenate([[0.], np.cumsum(steps)])
+    first = np.gradient(q, s, axis=0)
+    second = np.gradient(first, s, axis=0)
+
+    def bounds(k, u):
+        # s'' must keep every |q''| = |q' s'' + q'' u| under its limit
+        low, high = -np.inf, np.inf
+        for joint in range(q.shape[1]):
+            f, g, a = first[k, joint], second[k, joint], acceleration[joint]
+            if abs(f) > 1e-9:
+                alpha, beta = a / abs(f), g / f
+                low, high = max(low, -alpha - beta * u), min(high, alpha - beta * u)
+            elif abs(g) * u > a:
+                return np.inf, -np.inf
+        return low, high
+
+    limits = np.empty(len(q))
+    for k in range(len(q)):
+        with np.errstate(divide="ignore"):
+            upper = np.min((velocity / np.abs(first[k])) ** 2)
+        low, high = 0., upper
+        if bounds(k, upper)[0] <= bounds(k, upper)[1]:
+            low = upper
+        for _ in range(100):
+            middle = (low + high) / 2
+            low, high = (middle, high) if np.less_equal(*bounds(k, middle)) else \
+                (low, middle)
+        limits[k] = low
+    u = np.empty(len(q))
+    u[0] = 0.
+    for k in range(len(q) - 1):
+        u[k + 1] = min(limits[k + 1], max(u[k] + 2 * steps[k] * bounds(k, u[k])[1], 0.))
+    u[-1] = 0.
+    for k in range(len(q) - 2, -1, -1):
+        u[k] = min(u[k], max(u[k + 1] - 2 * steps[k] * bounds(k + 1, u[k + 1])[0], 0.))
+    return u
+
+
+def test_matches_sequential(path):
+    timed = time_optimal(path, VELOCITY, ACCELERATION)
+    assert timed.converged
+    expected = np.sqrt(sequential(path, VELOCITY, ACCELERATION))
+    np.testing.assert_allclose(timed.sd, expected, rtol=1e-7, atol=1e-9)
+
+
+def test_limits(path):
+    timed = time_optimal(path, VELOCITY, ACCELERATION)
+    assert np.all(np.abs(timed.qd) <= VELOCITY * (1 + 1e-9))
+    # Accelerations come from finite differences of u: they match the limits up
+    # to the sampling error
+    assert np.all(np.abs(timed.qdd) <= ACCELERATION * 1.01)
+    assert np.max(np.abs(timed.qd) / VELOCITY) == pytest.approx(1.)
+    assert timed.sd[0] == 0. and timed.sd[-1] == 0.
+    assert np.all(np.diff(timed.t) > 0)
+    np.testing.assert_allclose(timed.sample([0., timed.duration]), path[[0, -1]])
+
+
+def test_straight_line():
+    # Unit limits over a unit distance: accelerate for 1 s and brake for 1 s
+    s = np.linspace(0., 1., 1001)
+    timed = time_optimal(np.stack([s, np.zeros_like(s)], axis=1), 1., 1.)
+    assert timed.duration == pytest.approx(2.)
+    assert np.max(timed.sd) == pytest.approx(1.)
+    moving = time_optimal(np.stack([s, np.zeros_like(s)], axis=1), 1., 1.,
+                          start_speed=1., end_speed=1.)
+    assert moving.duration == pytest.approx(1.)
+
+
+def test_cartesian_speed():
+    # A Jacobian that scales the joint speed by 2 halves the speed limit
+    s = np.linspace(0., 1., 1001)
+    q = np.stack([s, np.zeros_like(s)], axis=1)
+
+    def jacobian(values):
+        result = np.zeros((len(values), 6, 2))
+        result[:, 0, 0] = 2.
+        return result
+
+    timed = time_optimal(q, 10., 1., jacobian=jacobian, cartesian_speed=.5)
+    assert np.max(timed.sd) == pytest.approx(.25)
+    with pytest.raises(ValueError):
+        time_optimal(q, 1., 1., cartesian_speed=.5)
+
+
+def test_validation():
+    with pytest.raises(ValueError):
+        time_optimal(np.zeros((1, 2)), 1., 1.)
+    with pytest.raises(ValueError):
+        time_optimal(np.zeros((3, 2)), 1., 1.)
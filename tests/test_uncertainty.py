@@ -0,0 +1,87 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from manipulator import propagate
+from manipulator.calibration import identification_jacobian
+from manipulator.calibration import parameter_names
+
+TOLERANCES = {"a_1": .05, "a_2": .1, "a_3": .1, "d_1": .2, "alpha_1": 1e-3,
+              "alpha_2": 5e-4, "theta_2": 1e-3, "Tx": .05}
+
+
+@pytest.fixture
+def nominal(uarm):
+    table, _ = uarm
+    return table.compact()
+
+
+@pytest.fixture
+def q():
+    return np.array([[0., np.pi / 3, np.pi / 2], [.7, 1.2, 1.9]])
+
+
+def test_linear_covariance(nominal, q):
+    # Small tolerances: the covariance is J S J^T, with the joint noise acting as
+    # the theta offsets of the rows
+    joint_noise = np.array([2e-3, 1e-3, 1e-3])
+    result = propagate(nominal, q, TOLERANCES, joint_noise, samples=200000,
+                       chunk_size=30000, seed=0)
+    names = parameter_names(nominal)
+    variances = np.zeros(len(names))
+    for name, tolerance in TOLERANCES.items():
+        variances[names.index(name)] += tolerance ** 2
+    for row, noise in enumerate(joint_noise):
+        variances[names.index(f"theta_{row + 1}")] += noise ** 2
+    jacobian = identification_jacobian(nominal, q)
+    expected = np.einsum("mip,p,mjp->mij", jacobian, variances, jacobian)
+    scale = np.sqrt(np.einsum("mii->mi", expected))
+    np.testing.assert_allclose(result.covariance / np.einsum("mi,mj->mij", scale, scale),
+                               expected / np.einsum("mi,mj->mij", scale, scale),
+                               atol=.02)
+    assert np.all(np.abs(result.mean) < .02)
+    np.testing.assert_allclose(result.rms, np.sqrt(np.einsum("mii->m", expected)),
+                               rtol=.02)
+
+
+def test_biased_rotation(nominal):
+    # A wide base rotation noise moves the arm along a circle: the error is biased
+    # towards the base by millimetres and its moments are known exactly (the tool
+    # offset is in the base frame, so it does not rotate)
+    sigma = .5
+    q = np.array([[0., np.pi / 3, np.pi / 2]])
+    result = propagate(nominal, q, joint_noise=[sigma, 0., 0.], samples=400000,
+                       chunk_size=70000, seed=1)
+    radius = result.nominal[0, 0] - nominal.Tx
+    cos_mean = np.exp(-sigma ** 2 / 2)
+    cos_square = (1 + np.exp(-2 * sigma ** 2)) / 2
+    sin_square = (1 - np.exp(-2 * sigma ** 2)) / 2
+    assert result.mean[0, 0] == pytest.approx(radius * (cos_mean - 1), rel=.01)
+    np.testing.assert_allclose(np.diag(result.covariance[0]),
+                               [radius ** 2 * (cos_square - cos_mean ** 2),
+                                radius ** 2 * sin_square, 0.], rtol=.02, atol=1e-9)
+    assert result.covariance[0, 0, 1] == pytest.approx(0., abs=.01 * radius ** 2 * sin_square)
+
+
+def test_chunks_agree(nominal, q):
+    # The merged statistics do not depend on the chunking, only on the draws
+    results = [propagate(nominal, q, TOLERANCES, samples=3000, chunk_size=size, seed=2)
+               for size in (3000, 3001)]
+    np.testing.assert_allclose(results[0].mean, results[1].mean, atol=1e-12)
+    np.testing.assert_allclose(results[0].covariance, results[1].covariance, atol=1e-12)
+    with pytest.raises(ValueError):
+        propagate(nominal, q, {"b_1": 1.})
@@ -0,0 +1,66 @@
+#                             manipulator
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+
+from manipulator import Manipulator
+from manipulator import verify_round_trip
+
+UARM_RANGES = [(-np.pi / 2, np.pi / 2), (np.pi / 4, np.pi / 2), (np.pi / 4, 3 * np.pi / 4)]
+"""
+Joint ranges of the uArm working envelope: the arm in front of the base and the
+elbow away from its singularities.
+"""
+
+
+@pytest.fixture
+def uarm_manipulator(uarm):
+    table, (_, t2, t3) = uarm
+    manipulator = Manipulator(table, optimize="none")
+    manipulator.direct_kinematics.set_phi(t2 - t3)
+    return manipulator
+
+
+def test_uarm_round_trip(uarm_manipulator):
+    report = verify_round_trip(uarm_manipulator, samples=20000, ranges=UARM_RANGES,
+                               seed=1)
+    assert report.failures == 0
+    assert report.passed(pose_tolerance=1e-9, joint_tolerance=1e-9)
+
+
+def test_uarm_round_trip_in_workers(uarm_manipulator):
+    report = verify_round_trip(uarm_manipulator, samples=2000, ranges=UARM_RANGES,
+                               workers=2, seed=1)
+    assert report.passed(pose_tolerance=1e-9)
+
+
+def test_uarm_inverse_kinematics(uarm, uarm_manipulator):
+    _, joints = uarm
+    q = [0.4, 1.2, 1.9]
+    x, y, z, phi = uarm_manipulator.point(dict(zip(joints, q)))
+    solution = uarm_manipulator.eval(x, y, z)
+    assert [float(value) for value in solution] == pytest.approx(q)
+    # phi is implied by the position: passing it is deprecated and has no effect
+    for evaluate in (uarm_manipulator.eval, uarm_manipulator.uarm_ik.eval):
+        with pytest.warns(DeprecationWarning, match="phi"):
+            assert evaluate(x, y, z, phi + 1) == solution
+    batch = uarm_manipulator.uarm_ik.eval_batch(np.array([[x, y, z, phi]], dtype=float))
+    assert batch[0] == pytest.approx(q)
+
+
+def test_unreachable_points_are_nan(uarm_manipulator):
+    solution = uarm_manipulator.uarm_ik.eval_batch(np.array([[1000., 0., 0., 0.]]))
+    assert np.isnan(solution[0, 1:]).all()